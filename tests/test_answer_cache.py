@@ -0,0 +1,104 @@
+# tests/test_answer_cache.py
+"""Cache de respostas do LLM (`answer_cache`)."""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "veritas_juris"))
+
+import answer_cache
+from answer_cache import AnswerCache, chunk_cache_id
+
+PROMPT_VERSION = "1"
+MODEL_ID = "models/teste"
+
+
+def _chunk(text, chunk_id=None, source_document="RESP-1-2019-01-01.pdf"):
+    chunk = {"text_chunk": text, "metadata_chunk": {"source_document": source_document}}
+    if chunk_id is not None:
+        chunk["chunk_id"] = chunk_id
+    return chunk
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _lookup(cache, query, chunk_ids=("1", "2"), **kwargs):
+    return cache.get(query, list(chunk_ids), PROMPT_VERSION, MODEL_ID, **kwargs)
+
+
+def _store(cache, query, answer, chunk_ids=("1", "2"), **kwargs):
+    cache.put(query, list(chunk_ids), PROMPT_VERSION, MODEL_ID, answer, **kwargs)
+
+
+def test_chunk_id_with_other_text_gets_other_key():
+    original = chunk_cache_id(_chunk("prescrição intercorrente", chunk_id=7))
+    assert chunk_cache_id(_chunk("prescrição intercorrente", chunk_id=7)) == original
+    assert chunk_cache_id(_chunk("texto reindexado", chunk_id=7)) != original
+    assert chunk_cache_id(_chunk("prescrição intercorrente", chunk_id=8)) != original
+
+
+def test_passage_without_chunk_id_is_keyed_by_document_and_text():
+    passage = chunk_cache_id(_chunk("trecho fundido"))
+    assert passage == chunk_cache_id(_chunk("trecho fundido"))
+    assert passage != chunk_cache_id(_chunk("trecho fundido", source_document="AGINT-2-2020-02-02.pdf"))
+
+
+def test_exact_hit_ignores_case_spaces_and_question_mark():
+    cache = AnswerCache(semantic_threshold=None)
+    _store(cache, "O que é prescrição intercorrente?", "resposta")
+    assert _lookup(cache, "  o que é   prescrição intercorrente ") == ("resposta", "exact")
+    # Mesmo conjunto de chunks em outra ordem: mesmo contexto
+    assert _lookup(cache, "o que é prescrição intercorrente", chunk_ids=("2", "1")) == ("resposta", "exact")
+    assert _lookup(cache, "o que é prescrição intercorrente", chunk_ids=("1", "3")) == (None, None)
+    assert cache.stats()["exact_hits"] == 2 and cache.stats()["misses"] == 1
+
+
+def test_semantic_hit_requires_same_context():
+    cache = AnswerCache(semantic_threshold=0.9)
+    _store(cache, "pergunta original", "resposta", query_vector=np.array([1.0, 0.0]))
+    close_vector = np.array([0.99, 0.05])
+    assert _lookup(cache, "pergunta parecida", query_vector=close_vector) == ("resposta", "semantic")
+    assert _lookup(cache, "pergunta parecida", chunk_ids=("3",), query_vector=close_vector) == (None, None)
+    assert _lookup(cache, "outra pergunta", query_vector=np.array([0.0, 1.0])) == (None, None)
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(answer_cache.time, "time", clock)
+    cache = AnswerCache(ttl_seconds=60, semantic_threshold=None)
+    _store(cache, "pergunta", "resposta")
+    clock.now += 59
+    assert _lookup(cache, "pergunta") == ("resposta", "exact")
+    clock.now += 2
+    assert _lookup(cache, "pergunta") == (None, None)
+    assert cache.stats()["expirations"] == 1
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AnswerCache(max_entries=2, semantic_threshold=None)
+    _store(cache, "primeira", "1")
+    _store(cache, "segunda", "2")
+    # Usar a primeira a torna a mais recente; a segunda passa a ser descartada
+    assert _lookup(cache, "primeira") == ("1", "exact")
+    _store(cache, "terceira", "3")
+    assert _lookup(cache, "segunda") == (None, None)
+    assert _lookup(cache, "primeira") == ("1", "exact")
+    assert _lookup(cache, "terceira") == ("3", "exact")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_new_index_version_invalidates_cache():
+    cache = AnswerCache(semantic_threshold=None, index_version="v1")
+    _store(cache, "pergunta", "resposta", index_version="v1")
+    assert _lookup(cache, "pergunta", index_version="v1") == ("resposta", "exact")
+    assert _lookup(cache, "pergunta", index_version="v2") == (None, None)
+    assert cache.index_version == "v2"
+    assert cache.stats()["invalidations"] == 1
@@ -0,0 +1,71 @@
+# tests/test_context_builder.py
+"""Montagem do contexto do prompt (`context_builder.build_context`)."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "veritas_juris"))
+
+from answer_cache import chunk_cache_id
+from context_builder import build_context
+
+
+def _chunk(chunk_id, document_id, chunk_index, words, file_name="RHC-1-2018-09-19.pdf"):
+    return {
+        "chunk_id": chunk_id,
+        "chunk_index": chunk_index,
+        "text_chunk": " ".join(words),
+        "metadata_chunk": {"source_document": file_name, "document_id": document_id},
+    }
+
+
+def _words(prefix, start, end):
+    return [f"{prefix}{i}" for i in range(start, end)]
+
+
+def test_adjacent_chunks_are_merged_without_repeating_the_overlap():
+    first = _chunk(3, 0, 0, _words("w", 0, 20))
+    second = _chunk(4, 0, 1, _words("w", 15, 35))
+    context = build_context("q", [second, first], token_budget=10_000)
+    assert len(context) == 1
+    assert context[0]["text_chunk"] == " ".join(_words("w", 0, 35))
+    assert context[0]["merged_chunk_indices"] == [0, 1]
+    assert context[0]["merged_chunk_ids"] == [3, 4]
+
+
+def test_documents_with_the_same_file_name_are_not_merged():
+    first = _chunk(3, 0, 0, _words("a", 0, 20))
+    other_ruling = _chunk(9, 1, 1, _words("b", 0, 20))
+    context = build_context("q", [first, other_ruling], token_budget=10_000)
+    assert [passage["text_chunk"] for passage in context] == [first["text_chunk"], other_ruling["text_chunk"]]
+
+
+def test_near_duplicates_are_dropped_and_relevance_order_kept():
+    best = _chunk(1, 0, 5, _words("x", 0, 30))
+    duplicate = _chunk(2, 1, 0, _words("x", 0, 30))
+    other = _chunk(3, 2, 0, _words("y", 0, 30))
+    context = build_context("q", [best, duplicate, other], token_budget=10_000)
+    assert [passage.get("chunk_id") for passage in context] == [1, 3]
+
+
+def test_budget_keeps_the_most_relevant_passages_that_fit():
+    chunks = [_chunk(position, position, 0, _words(f"d{position}w", 0, 10)) for position in range(3)]
+    count_words = lambda text: len(text.split())
+    context = build_context("q", chunks, token_budget=25, token_counter=count_words)
+    assert [passage["chunk_id"] for passage in context] == [0, 1]
+
+
+def test_passage_larger_than_the_budget_is_truncated():
+    chunk = _chunk(7, 0, 0, _words("w", 0, 100))
+    context = build_context("q", [chunk], token_budget=50, token_counter=lambda text: len(text.split()))
+    assert len(context) == 1
+    assert len(context[0]["text_chunk"].split()) <= 50
+    assert context[0]["text_chunk"].startswith("w0 w1")
+
+
+def test_synthesized_passages_do_not_share_the_cache_id_of_their_first_chunk():
+    first = _chunk(3, 0, 0, _words("w", 0, 20))
+    second = _chunk(4, 0, 1, _words("w", 20, 40))
+    merged = build_context("q", [first, second], token_budget=10_000)[0]
+    truncated = build_context("q", [first], token_budget=10, token_counter=lambda text: len(text.split()))[0]
+    assert "chunk_id" not in merged and "chunk_id" not in truncated
+    assert len({chunk_cache_id(first), chunk_cache_id(merged), chunk_cache_id(truncated)}) == 3
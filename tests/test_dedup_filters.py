@@ -0,0 +1,68 @@
+# tests/test_dedup_filters.py
+"""Filtros de metadados sobre fontes colapsadas pela deduplicação (ver `dedup`)."""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "veritas_juris"))
+
+from chunk_store import ChunkStore
+from dedup import NearDuplicateFilter
+from metadata_filters import MetadataFilterIndex
+from rag_pipeline import process_documents_for_rag
+
+
+def _words(prefix, count=50):
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+
+def _document(document_id, file_name, relator, text):
+    return {
+        "document_id": document_id,
+        "source": file_name,
+        "text": text,
+        "ementa_display_text": "Ementa.",
+        "full_metadata_origem": {"fileName": file_name, "case_info": None, "relator": relator,
+                                 "tribunal": "SUPERIOR TRIBUNAL DE JUSTIÇA"},
+    }
+
+
+def _chunks():
+    shared = _words("comum")
+    documents = [
+        _document(0, "RESP-100-2019-05-10.pdf", "MINISTRO ALFA", _words("alfa") + " " + shared),
+        # Republicação do documento 0 com outro relator e outra data: colapsada inteira
+        _document(1, "RESP-100-2021-03-04.pdf", "MINISTRO BETA", _words("alfa") + " " + shared),
+        # Documento diferente com um trecho igual ao do documento 0: só o chunk é colapsado
+        _document(2, "AGINT-200-2022-08-01.pdf", "MINISTRA GAMA", _words("gama") + " " + shared),
+    ]
+    return process_documents_for_rag(documents, chunk_size=50, overlap=0, chunking_strategy="words",
+                                     near_duplicate_filter=NearDuplicateFilter())
+
+
+def _check_filters(filter_index):
+    # Chunks mantidos: [alfa, comum] do documento 0 e [gama] do documento 2
+    assert filter_index.select_ids({"relator": "Ministro Alfa"}).tolist() == [0, 1]
+    # O documento 1 foi descartado; os chunks do representante respondem pelo seu relator e data
+    assert filter_index.select_ids({"relator": "Beta"}).tolist() == [0, 1]
+    assert filter_index.select_ids({"date_from": "2021-03-04", "date_to": "2021-03-04"}).tolist() == [0, 1]
+    # O trecho comum do documento 2 foi colapsado no chunk 1
+    assert filter_index.select_ids({"relator": "Gama"}).tolist() == [1, 2]
+    assert filter_index.select_ids({"classe": "AGINT", "date_from": "2022"}).tolist() == [1, 2]
+    assert filter_index.select_ids({"relator": "Delta"}).tolist() == []
+    assert filter_index.select_ids({"relator": "Beta", "date_from": "2023"}).tolist() == []
+    assert "BETA" in filter_index.values("relator")
+
+
+def test_filters_match_collapsed_sources():
+    chunks = _chunks()
+    assert len(chunks) == 3
+    _check_filters(MetadataFilterIndex.build(chunks))
+
+
+def test_filters_match_collapsed_sources_in_chunk_store():
+    store = ChunkStore.from_chunks(_chunks())
+    filter_index = MetadataFilterIndex.build(store)
+    _check_filters(filter_index)
+    assert np.array_equal(filter_index.all_ids, np.arange(3))
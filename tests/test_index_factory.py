@@ -0,0 +1,44 @@
+# tests/test_index_factory.py
+"""Medição de recall dos índices aproximados (`index_factory`)."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "veritas_juris"))
+
+from index_factory import build_faiss_index, hold_out_queries, stored_vectors
+
+
+def _embeddings(count=200, dimension=16):
+    return np.random.default_rng(0).random((count, dimension), dtype=np.float32)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "hnsw"])
+def test_stored_vectors_reconstructs_any_index(index_type):
+    embeddings = _embeddings()
+    index = build_faiss_index(embeddings, index_type=index_type, nlist=4)
+    np.testing.assert_allclose(stored_vectors(index), embeddings, rtol=1e-6)
+
+
+def test_stored_vectors_reads_ivf_loaded_from_disk(tmp_path):
+    embeddings = _embeddings()
+    path = str(tmp_path / "index.faiss")
+    faiss.write_index(build_faiss_index(embeddings, index_type="ivf_flat", nlist=4), path)
+    np.testing.assert_allclose(stored_vectors(faiss.read_index(path)), embeddings, rtol=1e-6)
+
+
+def test_held_out_queries_leave_the_corpus():
+    embeddings = _embeddings()
+    corpus, queries = hold_out_queries(embeddings, 30)
+    assert len(corpus) == 170 and len(queries) == 30
+    corpus_rows = {row.tobytes() for row in corpus}
+    assert not any(query.tobytes() in corpus_rows for query in queries)
+
+
+def test_hold_out_keeps_at_least_one_corpus_vector():
+    corpus, queries = hold_out_queries(_embeddings(count=5), 200)
+    assert len(corpus) == 1 and len(queries) == 4
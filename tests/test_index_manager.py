@@ -0,0 +1,150 @@
+# tests/test_index_manager.py
+"""Atualização incremental do vector store (`index_manager.IndexManager`)."""
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "veritas_juris"))
+
+from index_factory import build_faiss_index
+from index_manager import IndexManager
+from rag_pipeline import embed_texts, process_documents_for_rag
+
+CHUNKING = {"chunk_size": 20, "overlap": 0, "chunking_strategy": "words"}
+
+
+class HashingEncoder:
+    """Embedding determinístico (bag of words com hashing), para os testes não dependerem de um modelo."""
+
+    dimension = 64
+
+    def encode(self, texts, **kwargs):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dimension] += 1.0
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+
+
+def _document(document_id, file_name, relator, text):
+    return {
+        "document_id": document_id,
+        "source": file_name,
+        "text": text,
+        "ementa_display_text": "Ementa.",
+        "full_metadata_origem": {"fileName": file_name, "case_info": None, "relator": relator,
+                                 "tribunal": "SUPERIOR TRIBUNAL DE JUSTIÇA"},
+    }
+
+
+def _word(prefix, position):
+    # Só letras: o tokenizador do BM25 separa os dígitos ("alfa3" -> "alfa", "3")
+    return prefix + "".join("abcdefghijklmnopqrstuvwxyz"[int(digit)] for digit in str(position))
+
+
+def _words(prefix, count=40):
+    return " ".join(_word(prefix, i) for i in range(count))
+
+
+def _corpus():
+    return [
+        _document(0, "RESP-1-2019-01-01.pdf", "MINISTRO ALFA", _words("alfa")),
+        # Mesmo fileName, outro acórdão
+        _document(1, "RESP-1-2019-01-01.pdf", "MINISTRO BETA", _words("beta")),
+        _document(2, "AGINT-2-2020-02-02.pdf", "MINISTRA GAMA", _words("gama")),
+    ]
+
+
+def _manager(index_type="flat"):
+    encoder = HashingEncoder()
+    chunks = process_documents_for_rag(_corpus(), chunk_size=20, overlap=0, chunking_strategy="words")
+    vectors = embed_texts([chunk["text_chunk"] for chunk in chunks], encoder, show_progress_bar=False)
+    index = build_faiss_index(vectors, index_type=index_type, nlist=2)
+    return IndexManager.from_vector_store(index, chunks, encoder, **CHUNKING), index
+
+
+def _document_ids(chunks):
+    return [chunk["metadata_chunk"]["document_id"] for chunk in chunks]
+
+
+def test_documents_are_keyed_by_document_id():
+    manager, _ = _manager()
+    assert sorted(manager.documents()) == [0, 1, 2]
+    assert manager.ids_by_document[0] == [0, 1]
+    assert manager.ids_by_document[1] == [2, 3]
+
+
+def test_search_resolves_stable_ids():
+    manager, _ = _manager()
+    results = manager.search(_words("beta", 20), top_k=1)
+    assert results[0]["chunk_id"] == 2
+    assert _document_ids(results) == [1]
+    lexical = manager.search(_word("gama", 25), top_k=1, search_mode="lexical")
+    assert lexical[0]["chunk_id"] == 5
+
+
+def test_upsert_adds_a_new_document_to_every_index():
+    manager, _ = _manager()
+    version = manager.version
+    document = _document(None, "RESP-9-2024-05-05.pdf", "MINISTRO DELTA", _words("delta"))
+    added_ids, removed_ids = manager.upsert_document(document)
+    assert document["document_id"] == 3
+    assert added_ids == [6, 7] and removed_ids == []
+    assert manager.ntotal == 8 and manager.version > version
+    assert _document_ids(manager.search(_words("delta", 20), top_k=1)) == [3]
+    assert _document_ids(manager.search(_word("delta", 30), top_k=1, search_mode="lexical")) == [3]
+    assert _document_ids(manager.search(_words("delta", 20), top_k=5, filters={"relator": "Delta"})) == [3, 3]
+
+
+def test_upsert_reuses_unchanged_chunks():
+    manager, _ = _manager()
+    document = _document(2, "AGINT-2-2020-02-02.pdf", "MINISTRA GAMA",
+                         _words("gama", 20) + " " + _words("novo", 20))
+    added_ids, removed_ids = manager.upsert_document(document)
+    assert added_ids == [6] and removed_ids == [5]
+    assert manager.ids_by_document[2] == [4, 6]
+    assert manager.ntotal == 6
+    assert manager.search(_word("novo", 5), top_k=1, search_mode="lexical")[0]["chunk_id"] == 6
+    assert manager.search(_word("gama", 30), top_k=1, search_mode="lexical") == []
+
+
+def test_delete_removes_only_that_document():
+    manager, _ = _manager()
+    assert manager.delete_document(0) == [0, 1]
+    assert manager.delete_document(0) == []
+    assert sorted(manager.documents()) == [1, 2]
+    assert manager.ntotal == 4
+    assert manager.search(_word("alfa", 3), top_k=3, search_mode="lexical") == []
+    # O outro acórdão com o mesmo fileName continua indexado
+    assert _document_ids(manager.search(_word("beta", 3), top_k=1, search_mode="lexical")) == [1]
+    assert 0 not in _document_ids(manager.search(_words("alfa", 20), top_k=4))
+
+
+def test_updates_do_not_modify_the_index_being_searched():
+    manager, _ = _manager()
+    previous_index = manager.index
+    manager.upsert_document(_document(None, "RESP-9-2024-05-05.pdf", "MINISTRO DELTA", _words("delta")))
+    manager.delete_document(0)
+    assert previous_index.ntotal == 6
+    assert manager.index is not previous_index
+
+
+def test_ivf_index_keeps_its_type_and_the_source_is_untouched():
+    manager, source_index = _manager("ivf_flat")
+    assert isinstance(faiss.downcast_index(manager.index.index), faiss.IndexIVFFlat)
+    assert faiss.extract_index_ivf(source_index).direct_map.no()
+    manager.delete_document(2)
+    assert manager.ntotal == 4 and source_index.ntotal == 6
+
+
+def test_hnsw_and_untrained_indexes_are_refused():
+    encoder = HashingEncoder()
+    with pytest.raises(ValueError, match="HNSW"):
+        IndexManager.from_vector_store(faiss.IndexHNSWFlat(encoder.dimension, 16), [], encoder)
+    with pytest.raises(ValueError, match="treinado"):
+        IndexManager.from_vector_store(faiss.index_factory(encoder.dimension, "IVF4,Flat"), [], encoder)
@@ -0,0 +1,85 @@
+# tests/test_index_store.py
+"""Gravação e recarga dos artefatos do vector store (`index_store`)."""
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "veritas_juris"))
+
+from index_store import (INDEX_FORMAT_VERSION, MANIFEST_FILE_NAME, load_vector_store, save_vector_store,
+                         vector_store_exists)
+
+FINGERPRINT = "f" * 32
+
+
+def _chunks(count):
+    metadata = {"document_id": 0, "fileName": "RESP-1-2019-01-01.pdf", "relator": "MINISTRO ALFA"}
+    return [{"text_chunk": f"trecho {i}", "metadata_chunk": metadata, "chunk_index": i} for i in range(count)]
+
+
+def _index(count, dimension=8, seed=0):
+    index = faiss.IndexFlatIP(dimension)
+    index.add(np.random.default_rng(seed).random((count, dimension), dtype=np.float32))
+    return index
+
+
+def _leftovers(artifacts_dir):
+    return [name for name in os.listdir(artifacts_dir) if name.startswith(".")]
+
+
+def test_commit_and_reload(tmp_path):
+    target_dir = save_vector_store(_index(5), _chunks(5), FINGERPRINT, artifacts_dir=str(tmp_path))
+    assert target_dir == os.path.join(str(tmp_path), FINGERPRINT)
+    assert vector_store_exists(FINGERPRINT, artifacts_dir=str(tmp_path))
+    assert _leftovers(str(tmp_path)) == []
+
+    index, chunks = load_vector_store(FINGERPRINT, artifacts_dir=str(tmp_path))
+    assert index.ntotal == len(chunks) == 5
+    assert chunks[3]["text_chunk"] == "trecho 3"
+    assert chunks[3]["metadata_chunk"]["relator"] == "MINISTRO ALFA"
+
+
+def test_missing_artifact_loads_nothing(tmp_path):
+    assert not vector_store_exists(FINGERPRINT, artifacts_dir=str(tmp_path))
+    assert load_vector_store(FINGERPRINT, artifacts_dir=str(tmp_path)) == (None, [])
+
+
+def test_existing_valid_artifact_is_kept(tmp_path):
+    save_vector_store(_index(5), _chunks(5), FINGERPRINT, artifacts_dir=str(tmp_path))
+    # Um leitor com o artefato mapeado em memória não pode perdê-lo para um commit concorrente
+    loaded, _ = load_vector_store(FINGERPRINT, artifacts_dir=str(tmp_path))
+
+    save_vector_store(_index(3, seed=1), _chunks(3), FINGERPRINT, artifacts_dir=str(tmp_path))
+    assert _leftovers(str(tmp_path)) == []
+    index, chunks = load_vector_store(FINGERPRINT, artifacts_dir=str(tmp_path))
+    assert index.ntotal == len(chunks) == 5
+    assert loaded.ntotal == 5
+
+
+def test_replace_overwrites_valid_artifact(tmp_path):
+    save_vector_store(_index(5), _chunks(5), FINGERPRINT, artifacts_dir=str(tmp_path))
+    save_vector_store(_index(3, seed=1), _chunks(3), FINGERPRINT, artifacts_dir=str(tmp_path), replace=True)
+    assert _leftovers(str(tmp_path)) == []
+    index, chunks = load_vector_store(FINGERPRINT, artifacts_dir=str(tmp_path))
+    assert index.ntotal == len(chunks) == 3
+
+
+def test_incompatible_artifact_is_replaced(tmp_path):
+    target_dir = save_vector_store(_index(5), _chunks(5), FINGERPRINT, artifacts_dir=str(tmp_path))
+    manifest_path = os.path.join(target_dir, MANIFEST_FILE_NAME)
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    manifest["format_version"] = INDEX_FORMAT_VERSION - 1
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    assert not vector_store_exists(FINGERPRINT, artifacts_dir=str(tmp_path))
+
+    save_vector_store(_index(3, seed=1), _chunks(3), FINGERPRINT, artifacts_dir=str(tmp_path))
+    assert _leftovers(str(tmp_path)) == []
+    index, chunks = load_vector_store(FINGERPRINT, artifacts_dir=str(tmp_path))
+    assert index.ntotal == len(chunks) == 3
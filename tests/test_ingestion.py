@@ -0,0 +1,91 @@
+# tests/test_ingestion.py
+"""Ingestão em fluxo do corpus (`ingestion.build_vector_store_streaming`)."""
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "veritas_juris"))
+
+from index_factory import stored_vectors
+from index_store import load_vector_store
+from ingestion import build_vector_store_streaming
+
+DATA_FILE = os.path.join(os.path.dirname(__file__), "..", "veritas_juris", "data", "processo.json")
+# Com lotes de 16 chunks, a amostra de 40 vetores fica completa no terceiro lote (48 vetores)
+BATCH_SIZE = 16
+
+
+class HashingEncoder:
+    """Embedding determinístico (bag of words com hashing), para os testes não dependerem de um modelo."""
+
+    dimension = 64
+
+    def encode(self, texts, **kwargs):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dimension] += 1.0
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+
+
+def _build(artifacts_dir, **kwargs):
+    options = {"model_name": "hashing-64", "batch_size": BATCH_SIZE, "chunk_size": 200, "overlap": 20,
+               "use_embedding_cache": False, "num_workers": 1}
+    options.update(kwargs)
+    return build_vector_store_streaming(DATA_FILE, HashingEncoder(), artifacts_dir=str(artifacts_dir), **options)
+
+
+def _load(fingerprint, artifacts_dir):
+    index, chunks = load_vector_store(fingerprint, artifacts_dir=str(artifacts_dir), mmap=False)
+    assert index is not None
+    return index, chunks
+
+
+def _index_type(index):
+    # `downcast_index` não é dono do índice: `index` precisa continuar referenciado
+    return type(faiss.downcast_index(index))
+
+
+def _assert_vectors_match_chunks(index, chunks):
+    # Os vetores retidos até o treino entram no índice na mesma ordem dos chunks gravados
+    expected = HashingEncoder().encode([chunk["text_chunk"] for chunk in chunks])
+    np.testing.assert_allclose(stored_vectors(index), expected, atol=1e-6)
+
+
+def test_ivf_is_trained_on_the_deferred_sample(tmp_path, capsys):
+    fingerprint = _build(tmp_path, index_type="ivf_flat", index_options={"nlist": 2, "train_sample_size": 40})
+    assert f"Treinando índice com {3 * BATCH_SIZE} vetores" in capsys.readouterr().out
+
+    index, chunks = _load(fingerprint, tmp_path)
+    assert _index_type(index) is faiss.IndexIVFFlat and index.is_trained
+    assert index.ntotal == len(chunks) > 3 * BATCH_SIZE
+    _assert_vectors_match_chunks(index, chunks)
+
+
+def test_corpus_smaller_than_the_sample_trains_on_everything(tmp_path, capsys):
+    fingerprint = _build(tmp_path, index_type="ivf_flat", index_options={"nlist": 2, "train_sample_size": 10_000})
+    index, chunks = _load(fingerprint, tmp_path)
+    assert f"Treinando índice com {len(chunks)} vetores" in capsys.readouterr().out
+    assert _index_type(index) is faiss.IndexIVFFlat
+    assert index.ntotal == len(chunks)
+    _assert_vectors_match_chunks(index, chunks)
+
+
+def test_auto_index_is_sized_by_the_vectors_actually_read(tmp_path):
+    # O padrão (AUTO_EXPECTED_VECTORS) pediria IVF; o corpus pequeno termina antes da amostra
+    fingerprint = _build(tmp_path, index_type="auto")
+    index, chunks = _load(fingerprint, tmp_path)
+    assert issubclass(_index_type(index), faiss.IndexFlat)
+    assert index.ntotal == len(chunks)
+
+
+def test_existing_artifact_is_not_rebuilt(tmp_path, capsys):
+    fingerprint = _build(tmp_path)
+    capsys.readouterr()
+    assert _build(tmp_path) == fingerprint
+    assert "já existe" in capsys.readouterr().out
@@ -0,0 +1,67 @@
+# tests/test_metadata_filters.py
+"""Datas e validação dos filtros de metadados (`metadata_filters`)."""
+import datetime
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "veritas_juris"))
+
+from metadata_filters import MetadataFilterIndex, parse_date, validate_filters
+
+
+def _chunk(file_name, relator="MINISTRO ALFA"):
+    return {"text_chunk": file_name, "metadata_chunk": {
+        "source_document": file_name,
+        "outros_metadados_doc": {"fileName": file_name, "relator": relator, "case_info": None,
+                                 "tribunal": "SUPERIOR TRIBUNAL DE JUSTIÇA"},
+    }}
+
+
+def test_partial_dates_start_the_period_by_default():
+    assert parse_date("2021") == 20210101
+    assert parse_date("2021-06") == 20210601
+    assert parse_date("2021-06-15") == 20210615
+    assert parse_date(datetime.date(2021, 6, 15)) == 20210615
+
+
+def test_partial_upper_bounds_end_the_period():
+    assert parse_date("2021", bound="upper") == 20211231
+    assert parse_date("2021-06", bound="upper") == 20210630
+    assert parse_date("2024-02", bound="upper") == 20240229
+    assert parse_date("2021-06-15", bound="upper") == 20210615
+
+
+@pytest.mark.parametrize("value", ["2021-13", "2021-00", "2021-02-30", "abc", "2021-01-01-01", ""])
+def test_invalid_dates_are_rejected(value):
+    with pytest.raises(ValueError):
+        parse_date(value)
+    with pytest.raises(ValueError):
+        parse_date(value, bound="upper")
+
+
+def test_date_to_covers_the_whole_year_or_month():
+    chunks = [_chunk("RESP-1-2020-12-31.pdf"), _chunk("RESP-2-2021-01-01.pdf"),
+              _chunk("RESP-3-2021-06-30.pdf"), _chunk("RESP-4-2021-12-31.pdf"), _chunk("RESP-5-2022-01-01.pdf")]
+    filter_index = MetadataFilterIndex.build(chunks)
+    assert filter_index.select_ids({"date_from": "2021", "date_to": "2021"}).tolist() == [1, 2, 3]
+    assert filter_index.select_ids({"date_from": "2021-06", "date_to": "2021-06"}).tolist() == [2]
+    assert filter_index.select_ids({"date_to": "2020"}).tolist() == [0]
+
+
+def test_validate_filters_accepts_known_fields():
+    filters = {"relator": ["Alfa", "Beta"], "classe": "RESP", "date_from": "2021", "date_to": "2021-02"}
+    assert validate_filters(filters) is filters
+
+
+@pytest.mark.parametrize("filters, message", [
+    ({"relatorr": "Alfa"}, "Filtro desconhecido"),
+    ({"relator": 3}, "deve ser um texto"),
+    ({"uf": ["SP", 1]}, "deve ser um texto"),
+    ({"date_from": "2021-13"}, "date_from"),
+    ({"date_to": "2021-02-30"}, "date_to"),
+])
+def test_validate_filters_rejects_invalid_filters(filters, message):
+    with pytest.raises(ValueError, match=message):
+        validate_filters(filters)
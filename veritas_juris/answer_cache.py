@@ -0,0 +1,197 @@
+# answer_cache.py
+"""
+Cache de respostas do LLM, em dois níveis, na frente de `generate_response_with_llm`.
+
+- Nível exato: chave = hash de (query normalizada, ids e textos dos chunks recuperados,
+  versão do prompt, modelo do LLM). A mesma pergunta com o mesmo contexto nunca
+  volta ao LLM.
+- Nível semântico (opcional): se a nova query recuperou exatamente o mesmo conjunto
+  de chunks e o seu embedding tem similaridade de cosseno >= `semantic_threshold`
+  com o de uma pergunta já respondida, a resposta é reaproveitada.
+
+As entradas expiram após `ttl_seconds` e, acima de `max_entries`, as menos usadas
+recentemente são descartadas (LRU). Quando o índice muda (`index_version`
+diferente), o cache inteiro é invalidado. Os contadores de acertos e falhas ficam
+em `stats()`.
+"""
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_SEMANTIC_THRESHOLD = 0.95
+
+
+def normalize_query(query):
+    """Normaliza a pergunta para a chave exata (NFC, minúsculas, espaços colapsados, sem '?' final)."""
+    query = " ".join(unicodedata.normalize("NFC", query).lower().split())
+    return query.rstrip(" ?.!")
+
+
+def chunk_cache_id(chunk):
+    """
+    Id do chunk para a chave: o hash de (documento, texto), prefixado pelo `chunk_id` quando houver.
+    O texto entra sempre, pois um `chunk_id` pode voltar com outro texto (ex.: documento reindexado).
+    """
+    hasher = hashlib.sha1()
+    hasher.update(chunk["metadata_chunk"].get("source_document", "").encode('utf-8'))
+    hasher.update(b"\x00")
+    hasher.update(chunk["text_chunk"].encode('utf-8'))
+    text_hash = hasher.hexdigest()[:16]
+    if "chunk_id" in chunk:
+        return f"{chunk['chunk_id']}:{text_hash}"
+    return text_hash
+
+
+def llm_model_id(llm_model):
+    """Identificador do modelo do LLM (ex.: "models/gemini-1.5-flash-latest")."""
+    return getattr(llm_model, "model_name", None) or type(llm_model).__name__
+
+
+class AnswerCache:
+    """Cache em memória, thread-safe, de respostas do LLM (ver docstring do módulo)."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 semantic_threshold=DEFAULT_SEMANTIC_THRESHOLD, index_version=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic_threshold = semantic_threshold  # None desativa o nível semântico
+        self.index_version = index_version
+        self._entries = OrderedDict()   # chave exata -> entrada, da menos para a mais recente
+        self._by_context = {}           # (chunks, prompt, modelo) -> {chave exata: embedding da query}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _context_key(chunk_ids, prompt_version, model_id):
+        # O conjunto de chunks (não a ordem) identifica o contexto
+        return (tuple(sorted(chunk_ids)), str(prompt_version), model_id)
+
+    @staticmethod
+    def _exact_key(normalized_query, context_key):
+        chunk_ids, prompt_version, model_id = context_key
+        hasher = hashlib.sha256()
+        for part in (normalized_query, ",".join(chunk_ids), prompt_version, model_id):
+            hasher.update(part.encode('utf-8'))
+            hasher.update(b"\x00")
+        return hasher.hexdigest()
+
+    @staticmethod
+    def _unit_vector(query_vector):
+        if query_vector is None:
+            return None
+        vector = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else None
+
+    def _check_index_version(self, index_version):
+        if index_version is not None and index_version != self.index_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._by_context.clear()
+            self.index_version = index_version
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            siblings = self._by_context.get(entry["context_key"])
+            if siblings is not None:
+                siblings.pop(key, None)
+                if not siblings:
+                    del self._by_context[entry["context_key"]]
+
+    def _is_expired(self, entry, now):
+        return self.ttl_seconds is not None and now - entry["created_at"] > self.ttl_seconds
+
+    def get(self, query, chunk_ids, prompt_version, model_id, query_vector=None, index_version=None):
+        """
+        Procura a resposta: primeiro pela chave exata e, se `query_vector` for informado e o
+        nível semântico estiver ativo, pela similaridade com as perguntas do mesmo contexto.
+        Retorna (resposta, "exact" | "semantic") ou (None, None).
+        """
+        context_key = self._context_key(chunk_ids, prompt_version, model_id)
+        key = self._exact_key(normalize_query(query), context_key)
+        now = time.time()
+        with self._lock:
+            self._check_index_version(index_version)
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry, now):
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry["answer"], "exact"
+
+            unit_vector = self._unit_vector(query_vector)
+            if self.semantic_threshold is not None and unit_vector is not None:
+                best_key, best_similarity = None, self.semantic_threshold
+                for other_key, other_vector in list(self._by_context.get(context_key, {}).items()):
+                    if self._is_expired(self._entries[other_key], now):
+                        self._drop(other_key)
+                        self.expirations += 1
+                        continue
+                    if other_vector is None or other_vector.shape != unit_vector.shape:
+                        continue
+                    similarity = float(np.dot(unit_vector, other_vector))
+                    if similarity >= best_similarity:
+                        best_key, best_similarity = other_key, similarity
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    return self._entries[best_key]["answer"], "semantic"
+
+            self.misses += 1
+            return None, None
+
+    def put(self, query, chunk_ids, prompt_version, model_id, answer, query_vector=None, index_version=None):
+        """Guarda a resposta, descartando as entradas menos recentes acima de `max_entries`."""
+        context_key = self._context_key(chunk_ids, prompt_version, model_id)
+        key = self._exact_key(normalize_query(query), context_key)
+        with self._lock:
+            self._check_index_version(index_version)
+            self._drop(key)
+            self._entries[key] = {"answer": answer, "created_at": time.time(), "context_key": context_key}
+            self._by_context.setdefault(context_key, {})[key] = self._unit_vector(query_vector)
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._drop(oldest_key)
+                self.evictions += 1
+
+    def invalidate(self, index_version=None):
+        """Descarta todas as respostas (ex.: após reindexar o corpus)."""
+        with self._lock:
+            self._entries.clear()
+            self._by_context.clear()
+            self.index_version = index_version
+            self.invalidations += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Contadores de acertos (exatos e semânticos), falhas, descartes e taxa de acerto."""
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -1,22 +1,18 @@
 import streamlit as st
 from dotenv import load_dotenv
 import os
-import time # For simulating delays if needed in mock functions
-
-# --- Importar as funções do pipeline RAG ---
-# Ensure rag_pipeline.py is in the same directory or PYTHONPATH
-# and all these functions are correctly defined.
-from rag_pipeline import (
-    configure_llm,
-    initialize_embedding_model,
-    load_processes_from_original_json,
-    process_documents_for_rag,
-    create_vector_store,
-    retrieve_relevant_chunks,
-    generate_response_with_llm,
-    mock_ai_analysis, # Make sure this is correctly defined
-    mock_generate_argument_variations # Make sure this is correctly defined
-)
+import datetime
+import time
+
+# --- Backend de consultas ---
+# Com QUERY_SERVICE_URL, o app é só um cliente do serviço de consultas (query_service.py),
+# que carrega modelos e índice uma vez para todos os usuários; sem ela, o QueryEngine
+# roda neste processo.
+from metrics import configure_metrics_from_env, observe
+from query_client import QueryServiceClient, QueryServiceError
+
+# Início desta execução do script: base do tempo até a primeira tela e até o sistema ficar pronto
+script_started_at = time.perf_counter()
 
 # --- 1. Configuração da Página ---
 st.set_page_config(
@@ -62,97 +58,74 @@ with col_title_text:
 # --- Gerenciamento de Estado da Aplicação e Inicialização ---
 if 'system_ready' not in st.session_state:
     st.session_state.system_ready = False
-if 'embedding_model' not in st.session_state:
-    st.session_state.embedding_model = None
-if 'llm_model' not in st.session_state:
-    st.session_state.llm_model = None
-if 'vector_store' not in st.session_state:
-    st.session_state.vector_store = None
-if 'all_chunks_ref' not in st.session_state:
-    st.session_state.all_chunks_ref = []
-if 'initial_documents' not in st.session_state:
-    st.session_state.initial_documents = []
+if 'query_backend' not in st.session_state:
+    st.session_state.query_backend = None
+if 'filter_options' not in st.session_state:
+    st.session_state.filter_options = None
+if 'session_started_at' not in st.session_state:
+    st.session_state.session_started_at = script_started_at
 
 # --- Funções de Cache e Inicialização ---
 @st.cache_resource
-def load_models_cached():
-    # Improved spinner message
-    with st.spinner("🔄 Carregando e configurando modelos de IA (Embedding e LLM)... Por favor, aguarde."):
-        embedding_model = initialize_embedding_model()
-        llm_model = configure_llm()
-    return embedding_model, llm_model
-
-@st.cache_data # Changed to cache_data for data loading
-def get_initial_documents_cached(data_file_path):
-    if not os.path.exists(data_file_path):
-        st.error(f"❌ Arquivo JSON principal não encontrado em: {data_file_path}")
-        return []
-    # Improved spinner message
-    with st.spinner(f"📚 Carregando documentos base de '{os.path.basename(data_file_path)}'..."):
-        docs = load_processes_from_original_json(data_file_path)
-    return docs
+def get_query_backend_cached(service_url):
+    if service_url:
+        return QueryServiceClient(service_url, timeout=float(os.getenv("QUERY_SERVICE_TIMEOUT", "120")))
+    # Sem serviço: modelos, documentos e índice carregados neste processo, compartilhados entre as sessões.
+    # O carregamento roda em segundo plano; a interface é exibida sem esperar por ele.
+    from query_service import QueryEngine
 
-@st.cache_resource
-def prepare_rag_components_cached(_embedding_model, initial_documents):
-    if not initial_documents:
-        st.warning("⚠️ Nenhum documento inicial para processar. O índice RAG não será criado.")
-        return None, []
-    # Improved spinner message
-    with st.spinner("⚙️ Processando documentos e construindo o índice vetorial para RAG..."):
-        all_chunks = process_documents_for_rag(initial_documents)
-        if not all_chunks:
-            st.warning("⚠️ Nenhum chunk gerado a partir dos documentos. O índice RAG não será criado.")
-            return None, []
-        index, chunks_with_ids = create_vector_store(all_chunks, _embedding_model)
-    return index, chunks_with_ids
+    data_file_path = os.path.join(os.path.dirname(__file__), "data", "processo.json")
+    return QueryEngine(data_file_path).start_loading()
 
 def initialize_system():
-    """Handles the initialization of models and RAG components."""
+    """Obtém o backend de consultas (serviço ou engine local) e retorna o seu estado (`health()`)."""
     try:
-        st.session_state.embedding_model, st.session_state.llm_model = load_models_cached()
-        # Ensure the path to your data file is correct
-        data_file_path = os.path.join(os.path.dirname(__file__), "data", "processo.json")
-        st.session_state.initial_documents = get_initial_documents_cached(data_file_path)
-
-        if st.session_state.initial_documents:
-            st.session_state.vector_store, st.session_state.all_chunks_ref = prepare_rag_components_cached(
-                st.session_state.embedding_model, st.session_state.initial_documents
-            )
-            if st.session_state.vector_store and st.session_state.all_chunks_ref:
-                st.session_state.system_ready = True
-                # Using toast for a less intrusive "ready" message
-                # st.toast("✅ Sistema RAG pronto para consultas!", icon="🚀") # Moved to after status
-            else:
-                st.error("⚠️ Falha ao preparar componentes RAG. O índice vetorial ou os chunks podem não ter sido criados.")
-                st.session_state.system_ready = False
-        else:
-            st.error("⚠️ Documentos iniciais não foram carregados. O sistema RAG não pode ser inicializado.")
-            st.session_state.system_ready = False
-
+        backend = get_query_backend_cached(os.getenv("QUERY_SERVICE_URL", ""))
+        st.session_state.query_backend = backend
+        health = backend.health()
+        if health["ready"]:
+            st.session_state.filter_options = backend.filter_options()
+        st.session_state.system_ready = health["ready"]
+        return health
     except Exception as e:
-        st.error(f"❌ Erro crítico durante a inicialização do sistema: {e}")
         st.exception(e) # Provides traceback for debugging
         st.session_state.system_ready = False
+        return {"ready": False, "error": f"Erro crítico durante a inicialização do sistema: {e}"}
+
+@st.fragment(run_every=1.0)
+def show_loading_status():
+    """Acompanha o carregamento em segundo plano; quando termina, executa o app de novo já pronto."""
+    health = st.session_state.query_backend.health()
+    if health["ready"] or health.get("error"):
+        st.rerun()
+    st.info(f"⚙️ Carregando o sistema para pesquisa em segundo plano ({health.get('phase') or 'iniciando'}, "
+            f"{health.get('loading_seconds', 0):.0f}s). As demais abas já podem ser usadas; a consulta à base "
+            "é liberada assim que o carregamento terminar.")
+
 # --- Carregar Variáveis de Ambiente e Inicializar o Sistema ---
 load_dotenv()
+configure_metrics_from_env() # Sinks opcionais: METRICS_JSON_LOG e METRICS_PROMETHEUS_FILE
 
 
 
 
 status_placeholder = st.empty()
+system_loading = False
 
 if not st.session_state.get("system_ready", False):
+    health = initialize_system()
     with status_placeholder.container():
-        with st.spinner("⚙️ Carregando o sistema para pesquisa..."):
-            initialize_system()
         if st.session_state.system_ready:
-            with st.status("✅ Carregando o sistema para pesquisa", expanded=False) as status_bar:
-                status_bar.update(label="✅ Sistema pronto!", state="complete", expanded=False)
-                time.sleep(1)
-                status_placeholder.empty()  # limpa o status da tela
-        else:
+            st.session_state.ready_seconds = time.perf_counter() - st.session_state.session_started_at
+            observe("app_time_to_ready_seconds", st.session_state.ready_seconds)
+            st.toast("✅ Sistema pronto!")
+        elif health.get("error"):
+            st.error(f"⚠️ O sistema de consulta não está pronto: {health['error']}")
             with st.status("⚠️ Falha na Inicialização. Verifique os erros acima.", expanded=True) as status_bar:
                 status_bar.update(state="error")
+        else:
+            system_loading = True
+            show_loading_status()
 else:
     status_placeholder.empty()
 
@@ -179,6 +152,49 @@ with tab_rag:
         key="rag_query_input",
     )
 
+    search_mode_labels = {
+        "hybrid": "Híbrida (termos exatos + semântica)",
+        "dense": "Semântica",
+        "lexical": "Termos exatos (BM25)",
+    }
+    search_mode = st.radio(
+        "Modo de busca:",
+        options=list(search_mode_labels),
+        format_func=search_mode_labels.get,
+        horizontal=True,
+        key="rag_search_mode",
+        help="A busca híbrida combina a similaridade semântica com a correspondência exata de termos como 'RE 1656080' ou 'Súmula 7'.",
+    )
+
+    search_filters = {}
+    filter_options = st.session_state.filter_options
+    if filter_options is not None:
+        with st.expander("🔎 Filtros de metadados (opcional)"):
+            col_filter_1, col_filter_2 = st.columns(2)
+            with col_filter_1:
+                search_filters["tribunal"] = st.multiselect("Tribunal:", filter_options["tribunal"], key="rag_filter_tribunal")
+                search_filters["relator"] = st.multiselect("Relator(a):", filter_options["relator"], key="rag_filter_relator")
+            with col_filter_2:
+                search_filters["classe"] = st.multiselect("Classe processual:", filter_options["classe"], key="rag_filter_classe")
+                search_filters["uf"] = st.multiselect("UF de origem:", filter_options["uf"], key="rag_filter_uf")
+            first_date, last_date = filter_options["date_range"]
+            if first_date is not None:
+                first_date = datetime.date(first_date // 10000, first_date // 100 % 100, first_date % 100)
+                last_date = datetime.date(last_date // 10000, last_date // 100 % 100, last_date % 100)
+                selected_period = st.date_input(
+                    "Período do julgamento:",
+                    value=(first_date, last_date),
+                    min_value=first_date,
+                    max_value=last_date,
+                    format="DD/MM/YYYY",
+                    key="rag_filter_period",
+                )
+                # Enquanto o usuário escolhe o intervalo, o widget devolve só a data inicial
+                if isinstance(selected_period, (tuple, list)) and len(selected_period) == 2 \
+                        and tuple(selected_period) != (first_date, last_date):
+                    search_filters["date_from"], search_filters["date_to"] = selected_period
+        search_filters = {field: value for field, value in search_filters.items() if value}
+
     submit_rag_button = st.button(
         "⚖️ Buscar e Responder",
         type="primary",
@@ -187,53 +203,148 @@ with tab_rag:
         use_container_width=True
     )
 
-    if not st.session_state.system_ready:
+    if system_loading:
+        st.info("⏳ O sistema de consulta à base (RAG) ainda está carregando; o botão é liberado quando ele ficar pronto.")
+    elif not st.session_state.system_ready:
         st.warning("🔴 O Sistema de consulta à base (RAG) não está pronto ou falhou na inicialização. Funcionalidade indisponível.")
 
     if submit_rag_button and st.session_state.system_ready:
         if not query:
             st.warning("⚠️ Por favor, digite uma pergunta para iniciar a busca.")
         else:
-            with st.spinner("🧠 Analisando sua pergunta e buscando respostas na base de dados..."):
-                try:
-                    relevant_chunks_data = retrieve_relevant_chunks(
-                        query, st.session_state.vector_store, st.session_state.all_chunks_ref,
-                        st.session_state.embedding_model, top_k=5
+            try:
+                with st.spinner("🔎 Buscando trechos relevantes na base de dados..."):
+                    # O primeiro evento traz os chunks do contexto (já fundidos, deduplicados e no
+                    # orçamento de tokens) e os documentos citados; os seguintes, o texto do LLM
+                    answer_events = st.session_state.query_backend.answer_stream(
+                        query, top_k=8, search_mode=search_mode, filters=search_filters
                     )
-                    if not relevant_chunks_data:
-                        # Provide feedback if no specific chunks are found
-                        st.info("ℹ️ Não foram encontrados trechos altamente específicos para sua pergunta na base atual. A IA tentará fornecer uma resposta mais geral com base no conhecimento disponível.")
-
-                    ai_response = generate_response_with_llm(query, relevant_chunks_data, st.session_state.llm_model)
-
-                    st.subheader("💬 Resposta do VeritasJuris IA:")
-                    st.markdown(ai_response) # Assuming markdown formatted response
-
-                    if relevant_chunks_data:
+                    search_result = next(answer_events)
+                relevant_chunks_data = search_result["chunks"]
+                if not relevant_chunks_data:
+                    # Provide feedback if no specific chunks are found
+                    st.info("ℹ️ Não foram encontrados trechos altamente específicos para sua pergunta na base atual. A IA tentará fornecer uma resposta mais geral com base no conhecimento disponível.")
+
+                # A resposta fica acima das fontes, mas as fontes são exibidas assim que a busca termina
+                answer_container = st.container()
+                sources_container = st.container()
+
+                with sources_container:
+                    if search_result["sources"]:
                         st.divider()
                         st.subheader("📜 Documentos de Referência Consultados:")
-                        # Use a set to avoid listing the same source document multiple times if different chunks came from it
-                        processed_sources = set()
-                        for chunk in relevant_chunks_data:
-                            source_file = chunk["metadata_chunk"]["source_document"]
-                            if source_file not in processed_sources:
-                                original_doc = next((doc for doc in st.session_state.initial_documents if doc['source'] == source_file), None)
-                                if original_doc:
-                                    ementa = original_doc.get('ementa_display_text', 'Ementa não disponível.')
-                                    doc_id = original_doc.get('id', 'ID não disponível')
-                                    # Use an expander for each source for cleaner display
-                                    with st.expander(f"📄 Fonte: {source_file} (ID do Documento: {doc_id})"):
-                                        st.markdown(f"**Ementa:**\n {ementa}")
-                                        # Optionally, display a snippet of the relevant chunk text
-                                        # st.caption(f"Trecho Relevante do Chunk:\n...{chunk['text_chunk'][-200:]}...")
-                                else:
-                                    st.caption(f"⚠️ Detalhes do documento original não encontrados para: {source_file}")
-                                processed_sources.add(source_file)
-                except Exception as e:
-                    st.error(f"❌ Erro ao processar a pergunta RAG: {e}")
-                    st.exception(e) # Good for debugging
-
+                        # Uma entrada por documento, mesmo que vários chunks venham dele
+                        for source in search_result["sources"]:
+                            if source["document_id"] is not None:
+                                ementa = source["ementa"] or 'Ementa não disponível.'
+                                # Use an expander for each source for cleaner display
+                                with st.expander(f"📄 Fonte: {source['fileName']} (ID do Documento: {source['document_id']})"):
+                                    st.markdown(f"**Ementa:**\n {ementa}")
+                                    if source.get("near_duplicates"):
+                                        # Textos quase idênticos indexados uma única vez (deduplicação na ingestão)
+                                        also_in = ", ".join(f"{duplicate['fileName']} (ID {duplicate['document_id']})"
+                                                            for duplicate in source["near_duplicates"])
+                                        st.caption(f"Trecho também presente em: {also_in}")
+                            else:
+                                st.caption(f"⚠️ Detalhes do documento original não encontrados para: {source['fileName']}")
+
+                with answer_container:
+                    st.subheader("💬 Resposta do VeritasJuris IA:")
+                    answer_timing = {}
+
+                    def answer_stream():
+                        for event in answer_events:
+                            if event["event"] == "text":
+                                yield event["text"]
+                            elif event["event"] == "done":
+                                answer_timing.update(event)
+                            elif event["event"] == "error":
+                                yield f"\n\nOcorreu um erro ao gerar a resposta: {event['error']}"
+
+                    # Texto renderizado incrementalmente, em markdown, à medida que o LLM o gera
+                    st.write_stream(answer_stream())
+                    if answer_timing.get("first_token_seconds") is not None:
+                        st.caption(f"⏱️ Primeiro trecho em {answer_timing['first_token_seconds']:.2f}s · resposta completa em {answer_timing['seconds']:.2f}s")
+            except QueryServiceError as e:
+                if e.status == 503:
+                    # Backpressure do serviço: fila cheia ou sistema ainda carregando
+                    st.warning(f"⏳ {e} Tente novamente em alguns segundos.")
+                else:
+                    st.error(f"❌ Erro do serviço de consultas: {e}")
+            except Exception as e:
+                st.error(f"❌ Erro ao processar a pergunta RAG: {e}")
+                st.exception(e) # Good for debugging
+
+
+with tab_advanced:
+    st.markdown("<h2 style='font-size: 32px;'>📊 Métricas do Pipeline</h2>", unsafe_allow_html=True)
+    if 'first_render_seconds' in st.session_state:
+        startup_caption = f"⏱️ Inicialização desta sessão: primeira tela em {st.session_state.first_render_seconds:.2f}s"
+        if 'ready_seconds' in st.session_state:
+            startup_caption += f" · sistema pronto em {st.session_state.ready_seconds:.1f}s"
+        st.caption(startup_caption)
+    # Métricas do processo que atende as consultas: o serviço (QUERY_SERVICE_URL) ou este processo
+    query_backend = st.session_state.query_backend
+    metrics_summary = None
+    if query_backend is not None:
+        try:
+            metrics_summary = query_backend.metrics_summary()
+        except QueryServiceError as e:
+            st.warning(f"⚠️ Não foi possível obter as métricas do serviço de consultas: {e}")
+
+    if metrics_summary is None:
+        st.info("ℹ️ Métricas indisponíveis: o sistema de consulta não foi inicializado.")
+    else:
+        st.caption(
+            f"Latência por etapa (percentis das últimas {metrics_summary['window_size']} execuções de cada etapa) e vazão, "
+            "medidas no processo que atende as consultas desde a sua inicialização."
+        )
+        if not metrics_summary["enabled"]:
+            st.info("ℹ️ A coleta de métricas está desativada (METRICS_ENABLED=0).")
+        stage_rows = metrics_summary["stages"]
+        if stage_rows:
+            st.dataframe(stage_rows, use_container_width=True, hide_index=True)
+        else:
+            st.info("ℹ️ Nenhuma etapa medida ainda. Faça uma consulta na aba 'Consulta à Base (RAG)'.")
+
+        histograms = metrics_summary["histograms"]
+        size_labels = {
+            "llm_first_token_seconds": "Primeiro trecho do LLM (s)",
+            "llm_prompt_tokens": "Prompt (tokens)",
+            "llm_response_tokens": "Resposta (tokens)",
+            "context_tokens": "Contexto (tokens)",
+            "service_queue_wait_seconds": "Espera na fila (s)",
+            "service_batch_size": "Perguntas por lote",
+            "startup_ready_seconds": "Carregamento até ficar pronto (s)",
+        }
+        size_columns = [(label, histograms[name]) for name, label in size_labels.items() if name in histograms]
+        if size_columns:
+            for column, (label, summary) in zip(st.columns(len(size_columns)), size_columns):
+                column.metric(label, round(summary["p50"], 2),
+                              help=f"p50 · p90 = {round(summary['p90'], 2)} · p99 = {round(summary['p99'], 2)} · "
+                                   f"{summary['count']} observações")
+
+        cache_stats = metrics_summary["answer_cache"]
+        if cache_stats:
+            st.caption(
+                f"Cache de respostas: {cache_stats['entries']} entradas · taxa de acerto {cache_stats['hit_rate']:.0%} "
+                f"({cache_stats['exact_hits']} exatos, {cache_stats['semantic_hits']} semânticos, {cache_stats['misses']} falhas)"
+            )
+        col_refresh, col_reset = st.columns(2)
+        with col_refresh:
+            st.button("🔄 Atualizar métricas", key="metrics_refresh", use_container_width=True)
+        with col_reset:
+            if st.button("🗑️ Zerar métricas", key="metrics_reset", use_container_width=True):
+                query_backend.reset_metrics()
+                st.rerun()
+        with st.expander("Exposição no formato Prometheus"):
+            st.code(query_backend.prometheus_metrics(), language="text")
 
 
 st.divider()
-st.caption(f"VeritasJuris IA Pro v1.1 ✨ | Hackathon IBMEC | Streamlit v{st.__version__}")
\ No newline at end of file
+st.caption(f"VeritasJuris IA Pro v1.1 ✨ | Hackathon IBMEC | Streamlit v{st.__version__}")
+
+# Tempo até a primeira tela desta sessão (a interface não espera o carregamento do sistema)
+if 'first_render_seconds' not in st.session_state:
+    st.session_state.first_render_seconds = time.perf_counter() - script_started_at
+    observe("app_first_render_seconds", st.session_state.first_render_seconds)
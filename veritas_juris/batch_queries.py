@@ -0,0 +1,90 @@
+# batch_queries.py
+"""
+Execução em lote de perguntas de pesquisa (ex.: jobs noturnos com milhares de perguntas).
+
+Lê as perguntas de um arquivo texto (uma por linha) ou JSON Lines (campo "query"),
+recupera os trechos em lotes (um encode e uma busca matricial por lote) e gera as
+respostas com chamadas concorrentes ao LLM. Grava um JSON por linha com a pergunta,
+a resposta, as fontes e o erro, se houver.
+
+Uso:
+    python batch_queries.py perguntas.txt --out respostas.jsonl --concurrency 8
+"""
+import argparse
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+from context_builder import DEFAULT_CONTEXT_TOKEN_BUDGET
+from metrics import METRICS, configure_metrics_from_env
+from rag_pipeline import (
+    DEFAULT_LLM_CONCURRENCY,
+    DEFAULT_QUERY_BATCH_SIZE,
+    SEARCH_MODES,
+    answer_queries_batch,
+    configure_llm,
+    initialize_embedding_model,
+    load_or_build_vector_store,
+)
+
+DEFAULT_DATA_FILE = os.path.join(os.path.dirname(__file__), "data", "processo.json")
+
+
+def read_queries(path):
+    """Lê as perguntas de um .txt (uma por linha) ou .jsonl (objetos com "query")."""
+    queries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            queries.append(json.loads(line)["query"] if path.endswith(".jsonl") else line)
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Responde perguntas em lote usando o pipeline RAG.")
+    parser.add_argument("queries_path", help="Arquivo .txt (uma pergunta por linha) ou .jsonl (campo 'query')")
+    parser.add_argument("--out", required=True, help="Arquivo JSON Lines de saída")
+    parser.add_argument("--data", default=DEFAULT_DATA_FILE, help="JSON original dos acórdãos")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--search-mode", choices=SEARCH_MODES, default="hybrid")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_QUERY_BATCH_SIZE,
+                        help="Perguntas por encode/busca no FAISS")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_LLM_CONCURRENCY,
+                        help="Máximo de chamadas simultâneas ao LLM")
+    parser.add_argument("--context-budget", type=int, default=DEFAULT_CONTEXT_TOKEN_BUDGET,
+                        help="Orçamento de tokens do contexto de cada pergunta")
+    args = parser.parse_args()
+
+    load_dotenv()
+    configure_metrics_from_env()
+    queries = read_queries(args.queries_path)
+    embedding_model = initialize_embedding_model()
+    llm_model = configure_llm()
+    # Os documentos preparados só são lidos se o índice precisar ser construído
+    index, chunks, lexical_index = load_or_build_vector_store(args.data, None, embedding_model,
+                                                              with_lexical_index=True)
+
+    start = time.perf_counter()
+    results = answer_queries_batch(queries, index, chunks, embedding_model, llm_model, top_k=args.top_k,
+                                   batch_size=args.batch_size, max_concurrency=args.concurrency,
+                                   context_options={"token_budget": args.context_budget},
+                                   lexical_index=lexical_index, search_mode=args.search_mode)
+    elapsed = time.perf_counter() - start
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    failures = sum(1 for result in results if result["error"])
+    print(f"{len(results)} perguntas respondidas em {elapsed:.1f}s "
+          f"({len(results) / max(elapsed, 1e-9):.1f} perguntas/s, {failures} com erro). Saída: {args.out}")
+    for row in METRICS.stage_summary():
+        print(f"  {row['etapa']}: {row['execuções']} execuções, p50 {row['p50 (ms)']} ms, p99 {row['p99 (ms)']} ms")
+    METRICS.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+# benchmark.py
+"""
+Benchmark reprodutível do pipeline RAG sobre corpora sintéticos.
+
+Para cada tamanho de corpus (ex.: 1.000 a 1.000.000 de documentos), gera o JSON no
+formato de processo.json (synthetic_corpus.py) e mede tempo e memória de:
+- load_processes_from_original_json (extração);
+- process_documents_for_rag (chunking);
+- create_vector_store (embeddings + índice FAISS) e ChunkStore.from_chunks;
+- retrieve_relevant_chunks (latência por consulta, p50/p95/p99) e a versão em lote;
+- generate_responses_batch com o LLM simulado.
+O modelo de embedding é o HashingEmbeddingModel e o LLM é o MockLLM, então o
+benchmark roda offline e os números refletem o custo do pipeline, não do modelo.
+
+O resultado é um JSON (ambiente, configuração e um bloco por tamanho) que pode ser
+comparado com um run anterior: com `--baseline`, etapas mais lentas que o baseline
+além de `--max-regression` são listadas e o processo termina com código 1.
+
+Uso:
+    python benchmark.py --sizes 1000 10000 --out benchmark.json
+    python benchmark.py --sizes 1000 --baseline benchmark.json --max-regression 0.2
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import faiss
+import numpy as np
+
+from chunk_store import ChunkStore
+from embedding_engine import HashingEmbeddingModel
+from index_factory import INDEX_TYPES
+from lexical_index import BM25Index
+from metrics import METRICS
+from rag_pipeline import (
+    SEARCH_MODES,
+    MockLLM,
+    create_vector_store,
+    generate_responses_batch,
+    load_processes_from_original_json,
+    process_documents_for_rag,
+    retrieve_relevant_chunks,
+    retrieve_relevant_chunks_batch,
+)
+from synthetic_corpus import generate_queries, write_synthetic_corpus
+
+BENCHMARK_FORMAT_VERSION = 1
+DEFAULT_SIZES = (1000,)
+DEFAULT_NUM_QUERIES = 100
+DEFAULT_MAX_REGRESSION = 0.2
+# Etapas mais rápidas que isso não entram na comparação (ruído de medição)
+DEFAULT_MIN_COMPARABLE_SECONDS = 0.05
+
+
+def _rss_bytes():
+    """Memória residente atual do processo (None se indisponível)."""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_bytes():
+    """Pico de memória residente do processo (None se indisponível)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KiB; macOS, em bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _mb(value):
+    return None if value is None else round(value / (1024 * 1024), 2)
+
+
+def _percentiles_ms(latencies):
+    values = np.asarray(latencies, dtype=np.float64) * 1000
+    if not values.size:
+        return {}
+    return {
+        "mean": round(float(values.mean()), 3),
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+class StageRecorder:
+    """Mede tempo, vazão e memória de cada etapa e guarda o resultado em `stages`."""
+
+    def __init__(self, trace_memory=False, verbose=False):
+        self.trace_memory = trace_memory
+        self.verbose = verbose
+        self.stages = {}
+
+    def run(self, stage, function, *args, items=None, **kwargs):
+        """
+        Executa `function(*args, **kwargs)` como a etapa `stage`. `items` é o número de itens
+        processados ou uma função que o calcula a partir do resultado.
+        """
+        gc.collect()
+        rss_before = _rss_bytes()
+        if self.trace_memory:
+            tracemalloc.start()
+        output = io.StringIO()
+        start = time.perf_counter()
+        # Os prints do pipeline são descartados, exceto com --verbose
+        with contextlib.redirect_stdout(sys.stdout if self.verbose else output):
+            result = function(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        stage_result = {"seconds": round(elapsed, 6)}
+        if self.trace_memory:
+            _, traced_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            stage_result["python_peak_mb"] = _mb(traced_peak)
+        rss_after = _rss_bytes()
+        if rss_before is not None and rss_after is not None:
+            stage_result["rss_delta_mb"] = _mb(rss_after - rss_before)
+        stage_result["peak_rss_mb"] = _mb(_peak_rss_bytes())
+        if callable(items):
+            items = items(result)
+        if items is not None:
+            stage_result["items"] = items
+            stage_result["items_per_second"] = round(items / elapsed, 2) if elapsed > 0 else None
+        self.stages[stage] = stage_result
+        print(f"  {stage}: {elapsed:.3f}s" + (f" ({items} itens)" if items is not None else ""))
+        return result
+
+
+def benchmark_corpus_size(num_documents, work_dir, seed=0, num_queries=DEFAULT_NUM_QUERIES, top_k=5,
+                          search_mode="dense", index_type="flat", embedding_dimension=384,
+                          trace_memory=False, verbose=False):
+    """Executa o benchmark completo para um corpus sintético de `num_documents` documentos."""
+    print(f"Corpus sintético com {num_documents} documentos...")
+    METRICS.reset()
+    recorder = StageRecorder(trace_memory=trace_memory, verbose=verbose)
+    corpus_path = os.path.join(work_dir, f"corpus_{num_documents}_{seed}.json")
+    recorder.run("generate_corpus", write_synthetic_corpus, corpus_path, num_documents, seed=seed,
+                 items=num_documents)
+
+    embedding_model = HashingEmbeddingModel(dimension=embedding_dimension)
+    documents = recorder.run("load_processes_from_original_json", load_processes_from_original_json, corpus_path,
+                             items=len)
+    chunks = recorder.run("process_documents_for_rag", process_documents_for_rag, documents, items=len)
+    num_chunks = len(chunks)
+    del documents
+    index, chunks = recorder.run("create_vector_store", create_vector_store, chunks, embedding_model,
+                                 index_type=index_type, items=num_chunks)
+    chunk_store = recorder.run("chunk_store", ChunkStore.from_chunks, chunks, items=num_chunks)
+    del chunks
+
+    lexical_index = None
+    if search_mode != "dense":
+        lexical_index = recorder.run("lexical_index", BM25Index.build, chunk_store, items=num_chunks)
+
+    queries = generate_queries(num_queries, seed=seed)
+    search_options = {"top_k": top_k, "lexical_index": lexical_index, "search_mode": search_mode}
+    latencies = []
+
+    def retrieve_one_by_one():
+        results = []
+        for query in queries:
+            start = time.perf_counter()
+            results.append(retrieve_relevant_chunks(query, index, chunk_store, embedding_model, **search_options))
+            latencies.append(time.perf_counter() - start)
+        return results
+
+    relevant_chunks_per_query = recorder.run("retrieve_relevant_chunks", retrieve_one_by_one, items=len(queries))
+    recorder.run("retrieve_relevant_chunks_batch", retrieve_relevant_chunks_batch, queries, index, chunk_store,
+                 embedding_model, items=len(queries), **search_options)
+    recorder.run("generate_responses_batch", generate_responses_batch, queries, relevant_chunks_per_query,
+                 MockLLM(delay=0), items=len(queries))
+
+    return {
+        "num_documents": num_documents,
+        "num_chunks": num_chunks,
+        "corpus_mb": _mb(os.path.getsize(corpus_path)),
+        "index_type": type(index).__name__,
+        "stages": recorder.stages,
+        "retrieval_latency_ms": _percentiles_ms(latencies),
+        "pipeline_metrics": METRICS.stage_summary(),
+    }
+
+
+def environment_info():
+    """Versões e hardware, para saber se dois resultados são comparáveis."""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "faiss": getattr(faiss, "__version__", None),
+    }
+
+
+def compare_with_baseline(results, baseline, max_regression=DEFAULT_MAX_REGRESSION,
+                          min_seconds=DEFAULT_MIN_COMPARABLE_SECONDS):
+    """
+    Compara as etapas de cada tamanho de corpus com as do baseline. Retorna as regressões:
+    etapas em que o tempo cresceu mais que `max_regression` (ex.: 0.2 = 20%).
+    """
+    baseline_runs = {run["num_documents"]: run for run in baseline.get("runs", [])}
+    regressions = []
+    for run in results["runs"]:
+        baseline_run = baseline_runs.get(run["num_documents"])
+        if baseline_run is None:
+            continue
+        for stage, stage_result in run["stages"].items():
+            baseline_stage = baseline_run["stages"].get(stage)
+            if baseline_stage is None or baseline_stage["seconds"] < min_seconds:
+                continue
+            change = stage_result["seconds"] / baseline_stage["seconds"] - 1
+            if change > max_regression:
+                regressions.append({"num_documents": run["num_documents"], "stage": stage,
+                                    "baseline_seconds": baseline_stage["seconds"],
+                                    "seconds": stage_result["seconds"], "change": round(change, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline RAG com corpora sintéticos (offline).")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="Números de documentos dos corpora (ex.: 1000 10000 100000)")
+    parser.add_argument("--out", default="benchmark_results.json", help="Arquivo JSON de saída")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--num-queries", type=int, default=DEFAULT_NUM_QUERIES)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--search-mode", choices=SEARCH_MODES, default="dense")
+    parser.add_argument("--index-type", choices=INDEX_TYPES + ("auto",), default="flat")
+    parser.add_argument("--dimension", type=int, default=384, help="Dimensão do embedding simulado")
+    parser.add_argument("--work-dir", help="Diretório dos corpora gerados (padrão: diretório temporário)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Mede também o pico de alocações Python (tracemalloc; deixa as etapas mais lentas)")
+    parser.add_argument("--baseline", help="Resultado anterior para detectar regressões")
+    parser.add_argument("--max-regression", type=float, default=DEFAULT_MAX_REGRESSION)
+    parser.add_argument("--verbose", action="store_true", help="Mostra as mensagens do pipeline")
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items() if key not in ("out", "work_dir", "baseline", "verbose")}
+    results = {
+        "format_version": BENCHMARK_FORMAT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment_info(),
+        "config": config,
+        "runs": [],
+    }
+    with contextlib.ExitStack() as stack:
+        work_dir = args.work_dir or stack.enter_context(tempfile.TemporaryDirectory(prefix="veritas-bench-"))
+        os.makedirs(work_dir, exist_ok=True)
+        for num_documents in args.sizes:
+            results["runs"].append(benchmark_corpus_size(
+                num_documents, work_dir, seed=args.seed, num_queries=args.num_queries, top_k=args.top_k,
+                search_mode=args.search_mode, index_type=args.index_type, embedding_dimension=args.dimension,
+                trace_memory=args.trace_memory, verbose=args.verbose,
+            ))
+            # Grava a cada tamanho: um run longo interrompido mantém os tamanhos já medidos
+            with open(args.out, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {args.out}.")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, max_regression=args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSÃO: {regression['stage']} ({regression['num_documents']} documentos): "
+                  f"{regression['baseline_seconds']:.3f}s -> {regression['seconds']:.3f}s "
+                  f"(+{regression['change']:.0%})")
+        if regressions:
+            sys.exit(1)
+        print("Nenhuma regressão em relação ao baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# chunk_store.py
+"""
+Armazenamento compacto e colunar dos chunks.
+
+Uma lista de dicionários por chunk, cada um com uma cópia dos metadados do
+documento (incluindo a ementa inteira), ocupa boa parte da memória de cada
+processo. O `ChunkStore` guarda:
+- a tabela de documentos uma única vez (metadados + ementa), com ids inteiros;
+- o texto de todos os chunks em um único buffer UTF-8 (em disco, mapeado em
+  memória e compartilhado entre processos);
+- colunas numpy por chunk: offset/tamanho no buffer, id do documento, posição no
+  documento, seção e páginas;
+- as fontes colapsadas em cada chunk representante pela deduplicação (`dedup`),
+  só para os chunks que têm alguma.
+
+O store se comporta como uma sequência somente leitura de chunks: `store[i]`
+materializa o dicionário do chunk (no mesmo formato de `chunk_document`) apenas
+quando ele é acessado, por exemplo para os resultados de uma busca.
+"""
+import io
+import json
+import mmap
+import os
+from array import array
+from collections.abc import Sequence
+
+import numpy as np
+
+CHUNK_TEXT_FILE_NAME = "chunks_text.bin"
+CHUNK_COLUMNS_FILE_NAME = "chunks_columns.npz"
+DOCUMENTS_FILE_NAME = "documents.json"
+
+
+class ChunkStoreWriter:
+    """
+    Monta as colunas do store à medida que os chunks chegam, gravando o texto em
+    `text_file` (arquivo binário aberto ou BytesIO). Chunks de um mesmo documento
+    chegam em sequência e compartilham uma única linha da tabela de documentos.
+    """
+
+    def __init__(self, text_file):
+        self.text_file = text_file
+        self.documents = []
+        self.section_names = []
+        self._section_codes = {}
+        self._last_metadata = None
+        self._offset = 0
+        self.offsets = array("q")
+        self.lengths = array("l")
+        self.document_ids = array("l")
+        self.chunk_indices = array("l")
+        self.section_codes = array("h")
+        self.page_starts = array("l")
+        self.page_ends = array("l")
+        self.chunk_ids = array("q")
+        self.has_chunk_ids = None
+        self.near_duplicates = {}   # posição do chunk -> fontes colapsadas nele
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def add_chunks(self, chunks_with_metadata):
+        for chunk in chunks_with_metadata:
+            self.add_chunk(chunk)
+
+    def add_chunk(self, chunk):
+        metadata = chunk["metadata_chunk"]
+        if metadata is not self._last_metadata and metadata != self._last_metadata:
+            self.documents.append(metadata)
+        self._last_metadata = metadata
+
+        if chunk.get("near_duplicates"):
+            self.near_duplicates[len(self.offsets)] = chunk["near_duplicates"]
+        encoded = chunk["text_chunk"].encode('utf-8')
+        self.text_file.write(encoded)
+        self.offsets.append(self._offset)
+        self.lengths.append(len(encoded))
+        self._offset += len(encoded)
+
+        self.document_ids.append(len(self.documents) - 1)
+        self.chunk_indices.append(chunk.get("chunk_index", -1))
+        section = chunk.get("section")
+        if section is None:
+            self.section_codes.append(-1)
+        else:
+            if section not in self._section_codes:
+                self._section_codes[section] = len(self.section_names)
+                self.section_names.append(section)
+            self.section_codes.append(self._section_codes[section])
+        page_start = chunk.get("page_start")
+        page_end = chunk.get("page_end")
+        self.page_starts.append(-1 if page_start is None else page_start)
+        self.page_ends.append(-1 if page_end is None else page_end)
+
+        # Ids estáveis (IndexManager) são preservados se todos os chunks tiverem um
+        has_chunk_id = "chunk_id" in chunk
+        if self.has_chunk_ids is None:
+            self.has_chunk_ids = has_chunk_id
+        if self.has_chunk_ids and has_chunk_id:
+            self.chunk_ids.append(chunk["chunk_id"])
+        else:
+            self.has_chunk_ids = False
+
+    def add_near_duplicates(self, near_duplicates):
+        """Fontes colapsadas em chunks já gravados (ingestão em fluxo), por posição do chunk."""
+        for position, sources in near_duplicates.items():
+            self.near_duplicates.setdefault(position, []).extend(sources)
+
+    def columns(self):
+        columns = {
+            "offsets": np.asarray(self.offsets, dtype=np.int64),
+            "lengths": np.asarray(self.lengths, dtype=np.int32),
+            "document_ids": np.asarray(self.document_ids, dtype=np.int32),
+            "chunk_indices": np.asarray(self.chunk_indices, dtype=np.int32),
+            "section_codes": np.asarray(self.section_codes, dtype=np.int16),
+            "page_starts": np.asarray(self.page_starts, dtype=np.int32),
+            "page_ends": np.asarray(self.page_ends, dtype=np.int32),
+        }
+        if self.has_chunk_ids:
+            columns["chunk_ids"] = np.asarray(self.chunk_ids, dtype=np.int64)
+        return columns
+
+    def write_tables(self, target_dir):
+        """Grava as colunas e a tabela de documentos (o texto já está em `text_file`)."""
+        with open(os.path.join(target_dir, CHUNK_COLUMNS_FILE_NAME), 'wb') as f:
+            np.savez(f, **self.columns())
+        with open(os.path.join(target_dir, DOCUMENTS_FILE_NAME), 'w', encoding='utf-8') as f:
+            json.dump({"documents": self.documents, "section_names": self.section_names,
+                       "near_duplicates": {str(position): sources for position, sources in self.near_duplicates.items()}},
+                      f, ensure_ascii=False)
+
+
+class ChunkStore(Sequence):
+    """Sequência somente leitura de chunks, materializados sob demanda (ver docstring do módulo)."""
+
+    def __init__(self, documents, section_names, text_buffer, offsets, lengths, document_ids, chunk_indices,
+                 section_codes, page_starts, page_ends, chunk_ids=None, near_duplicates=None):
+        self.documents = documents          # id do documento -> metadados (formato de "metadata_chunk")
+        self.section_names = section_names
+        self.text_buffer = text_buffer      # bytes ou mmap com o texto UTF-8 de todos os chunks
+        self.offsets = offsets
+        self.lengths = lengths
+        self.document_ids = document_ids
+        self.chunk_indices = chunk_indices
+        self.section_codes = section_codes
+        self.page_starts = page_starts
+        self.page_ends = page_ends
+        self.chunk_ids = chunk_ids
+        self.near_duplicates = near_duplicates or {}
+
+    @classmethod
+    def from_chunks(cls, chunks_with_metadata):
+        """Cria o store em memória a partir de uma lista (ou iterável) de chunks."""
+        buffer = io.BytesIO()
+        writer = ChunkStoreWriter(buffer)
+        writer.add_chunks(chunks_with_metadata)
+        columns = writer.columns()
+        return cls(writer.documents, writer.section_names, buffer.getvalue(),
+                   near_duplicates=writer.near_duplicates, **columns)
+
+    @classmethod
+    def load(cls, target_dir, use_mmap=True):
+        """Carrega o store de um diretório; o texto é mapeado em memória (somente leitura)."""
+        with open(os.path.join(target_dir, DOCUMENTS_FILE_NAME), 'r', encoding='utf-8') as f:
+            tables = json.load(f)
+        with np.load(os.path.join(target_dir, CHUNK_COLUMNS_FILE_NAME)) as data:
+            columns = {name: data[name] for name in data.files}
+        text_path = os.path.join(target_dir, CHUNK_TEXT_FILE_NAME)
+        with open(text_path, 'rb') as f:
+            if use_mmap and os.path.getsize(text_path) > 0:
+                text_buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                text_buffer = f.read()
+        near_duplicates = {int(position): sources for position, sources in tables.get("near_duplicates", {}).items()}
+        return cls(tables["documents"], tables["section_names"], text_buffer, near_duplicates=near_duplicates,
+                   **columns)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def text(self, position):
+        """Texto do chunk, sem materializar o restante."""
+        offset = int(self.offsets[position])
+        return self.text_buffer[offset:offset + int(self.lengths[position])].decode('utf-8')
+
+    def document(self, position):
+        """Metadados do documento do chunk (objeto compartilhado por todos os chunks do documento)."""
+        return self.documents[int(self.document_ids[position])]
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        metadata = self.document(position)
+        chunk = {
+            "source_document_chunk_specific": metadata.get("source_document", "FonteDesconhecida"),
+            "text_chunk": self.text(position),
+            "metadata_chunk": metadata,
+        }
+        if self.chunk_indices[position] >= 0:
+            chunk["chunk_index"] = int(self.chunk_indices[position])
+        section_code = int(self.section_codes[position])
+        if section_code >= 0:
+            chunk["section"] = self.section_names[section_code]
+            chunk["page_start"] = int(self.page_starts[position]) if self.page_starts[position] >= 0 else None
+            chunk["page_end"] = int(self.page_ends[position]) if self.page_ends[position] >= 0 else None
+        if self.chunk_ids is not None:
+            chunk["chunk_id"] = int(self.chunk_ids[position])
+        if position in self.near_duplicates:
+            chunk["near_duplicates"] = self.near_duplicates[position]
+        return chunk
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    def ids(self):
+        """Ids dos chunks no índice FAISS: os `chunk_id` estáveis ou as posições."""
+        return self.chunk_ids if self.chunk_ids is not None else np.arange(len(self), dtype=np.int64)
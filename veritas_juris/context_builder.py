@@ -0,0 +1,178 @@
+# context_builder.py
+"""
+Montagem do contexto enviado ao LLM a partir dos chunks recuperados.
+
+Os chunks de `chunk_text` são janelas de palavras com sobreposição, e a busca
+frequentemente devolve janelas vizinhas do mesmo acórdão ou trechos quase
+idênticos. Antes de montar o prompt, `build_context`:
+1. (opcional) reordena os candidatos por MMR, equilibrando relevância e diversidade;
+2. descarta quase-duplicatas (similaridade de Jaccard entre shingles de palavras);
+3. funde chunks adjacentes/sobrepostos do mesmo documento em um único trecho,
+   sem repetir as palavras da sobreposição;
+4. preenche um orçamento de tokens em ordem de relevância.
+
+Os trechos devolvidos têm o mesmo formato dos chunks (`text_chunk`,
+`metadata_chunk`, ...), então podem ser passados diretamente a
+`generate_response_with_llm`/`build_rag_prompt`. Trechos fundidos ou truncados
+não levam o `chunk_id` de nenhum chunk (o texto não é mais o dele): o cache de
+respostas os identifica pelo texto (ver `answer_cache.chunk_cache_id`).
+"""
+import math
+
+import numpy as np
+
+from metrics import METRICS, observe
+
+DEFAULT_CONTEXT_TOKEN_BUDGET = 3000
+DEFAULT_DUPLICATE_THRESHOLD = 0.8
+DEFAULT_MMR_LAMBDA = 0.7
+_SHINGLE_SIZE = 5
+
+
+def estimate_tokens(text):
+    """Estimativa do número de tokens (~4 caracteres por token em português)."""
+    return math.ceil(len(text) / 4)
+
+
+def _shingles(words):
+    if len(words) < _SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + _SHINGLE_SIZE]) for i in range(len(words) - _SHINGLE_SIZE + 1)}
+
+
+def _jaccard(first, second):
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def _overlap_length(previous_words, next_words, max_overlap):
+    """Maior k tal que as últimas k palavras de `previous_words` são as primeiras de `next_words`."""
+    for size in range(min(len(previous_words), len(next_words), max_overlap), 0, -1):
+        if previous_words[-size:] == next_words[:size]:
+            return size
+    return 0
+
+
+def mmr_order(query_vector, chunk_vectors, mmr_lambda=DEFAULT_MMR_LAMBDA):
+    """
+    Ordem de seleção por Maximal Marginal Relevance: a cada passo escolhe o chunk que
+    maximiza lambda * sim(query, chunk) - (1 - lambda) * max sim(chunk, já escolhidos).
+    """
+    vectors = np.asarray(chunk_vectors, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+    query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+    query = query / max(float(np.linalg.norm(query)), 1e-9)
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+    selected = []
+    remaining = list(range(len(vectors)))
+    while remaining:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        scores = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * redundancy
+        selected.append(remaining.pop(int(np.argmax(scores))))
+    return selected
+
+
+def _passage(chunk, text):
+    """Cópia de `chunk` com outro texto, sem o `chunk_id` (que identifica o texto original)."""
+    passage = dict(chunk, text_chunk=text)
+    passage.pop("chunk_id", None)
+    return passage
+
+
+def _merge_group(chunks, max_overlap):
+    """Funde chunks consecutivos do mesmo documento, removendo as palavras sobrepostas."""
+    words = chunks[0]["text_chunk"].split()
+    for chunk in chunks[1:]:
+        next_words = chunk["text_chunk"].split()
+        words.extend(next_words[_overlap_length(words, next_words, max_overlap):])
+    merged = _passage(chunks[0], " ".join(words))
+    merged["merged_chunk_indices"] = [chunk.get("chunk_index") for chunk in chunks]
+    if all("chunk_id" in chunk for chunk in chunks):
+        merged["merged_chunk_ids"] = [chunk["chunk_id"] for chunk in chunks]
+    return merged
+
+
+@METRICS.timed("context_build")
+def build_context(query, relevant_chunks_data, token_budget=DEFAULT_CONTEXT_TOKEN_BUDGET,
+                  duplicate_threshold=DEFAULT_DUPLICATE_THRESHOLD, use_mmr=False, embedding_model=None,
+                  mmr_lambda=DEFAULT_MMR_LAMBDA, max_overlap=None, token_counter=estimate_tokens):
+    """
+    Reduz os chunks recuperados (em ordem de relevância) ao contexto do prompt: trechos
+    sem quase-duplicatas, com vizinhos do mesmo documento fundidos, em ordem de
+    relevância e cabendo em `token_budget` (contado por `token_counter`).
+    `use_mmr` exige `embedding_model` para codificar a query e os chunks.
+    """
+    chunks = list(relevant_chunks_data)
+    if not chunks:
+        return []
+
+    if use_mmr and embedding_model is not None and len(chunks) > 2:
+        vectors = np.asarray(embedding_model.encode([query] + [chunk["text_chunk"] for chunk in chunks]),
+                             dtype=np.float32)
+        chunks = [chunks[i] for i in mmr_order(vectors[0], vectors[1:], mmr_lambda=mmr_lambda)]
+
+    # 1. Quase-duplicatas: mantém o chunk mais bem ranqueado
+    kept = []
+    kept_shingles = []
+    for chunk in chunks:
+        shingles = _shingles(chunk["text_chunk"].split())
+        if any(_jaccard(shingles, other) >= duplicate_threshold for other in kept_shingles):
+            continue
+        kept.append(chunk)
+        kept_shingles.append(shingles)
+
+    # 2. Fusão de chunks adjacentes do mesmo documento (pelo document_id: o fileName pode se
+    #    repetir no corpus); o trecho fundido fica na posição do seu chunk mais relevante
+    groups = []
+    by_document = {}
+    for rank, chunk in enumerate(kept):
+        metadata = chunk["metadata_chunk"]
+        document_key = metadata.get("document_id")
+        if document_key is None:
+            document_key = ("fileName", metadata["source_document"])
+        by_document.setdefault(document_key, []).append((rank, chunk))
+    for ranked_chunks in by_document.values():
+        if all(chunk.get("chunk_index") is not None for _, chunk in ranked_chunks):
+            ranked_chunks.sort(key=lambda item: item[1]["chunk_index"])
+        current = [ranked_chunks[0]]
+        for rank, chunk in ranked_chunks[1:]:
+            previous = current[-1][1]
+            adjacent = (chunk.get("chunk_index") is not None and previous.get("chunk_index") is not None
+                        and chunk["chunk_index"] - previous["chunk_index"] == 1)
+            if adjacent:
+                current.append((rank, chunk))
+            else:
+                groups.append(current)
+                current = [(rank, chunk)]
+        groups.append(current)
+    groups.sort(key=lambda group: min(rank for rank, _ in group))
+
+    max_overlap = max_overlap or max((len(chunk["text_chunk"].split()) for chunk in kept), default=0)
+    passages = [_merge_group([chunk for _, chunk in group], max_overlap) if len(group) > 1 else group[0][1]
+                for group in groups]
+
+    # 3. Orçamento de tokens, em ordem de relevância
+    context = []
+    used_tokens = 0
+    for passage in passages:
+        tokens = token_counter(passage["text_chunk"])
+        if used_tokens + tokens <= token_budget:
+            context.append(passage)
+            used_tokens += tokens
+        elif not context:
+            # Nem o trecho mais relevante cabe: usa o seu início
+            words = passage["text_chunk"].split()
+            while words and token_counter(" ".join(words)) > token_budget:
+                words = words[:int(len(words) * 0.9)]
+            if words:
+                context.append(_passage(passage, " ".join(words)))
+                used_tokens += token_counter(context[0]["text_chunk"])
+    observe("context_tokens", used_tokens)
+    print(f"Contexto montado: {len(context)} trechos a partir de {len(relevant_chunks_data)} chunks "
+          f"(~{used_tokens} tokens de {token_budget}).")
+    return context
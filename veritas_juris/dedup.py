@@ -0,0 +1,224 @@
+# dedup.py
+"""
+Detecção de quase-duplicatas na ingestão (MinHash + LSH).
+
+Os tribunais republicam a mesma ementa, o mesmo relatório e os mesmos trechos
+padronizados em vários acórdãos e agravos relacionados, e o mesmo acórdão pode
+aparecer mais de uma vez no acervo. Indexar cada cópia aumenta o índice e faz o
+top-k da busca ser preenchido por versões do mesmo texto.
+
+Cada texto vira o conjunto dos seus shingles de 5 palavras (como no
+`context_builder`) e uma assinatura MinHash de `num_permutations` valores: a
+fração de posições iguais entre duas assinaturas estima a similaridade de Jaccard
+entre os textos. A assinatura é dividida em `bands` faixas; textos com alguma
+faixa idêntica caem no mesmo balde do LSH e só esses candidatos são comparados,
+então cada texto novo custa O(bandas) em vez de uma comparação com todo o acervo.
+
+O `NearDuplicateFilter` processa os chunks documento a documento:
+1. um documento quase idêntico a outro já visto (mesmo texto republicado) é
+   descartado inteiro e registrado em "near_duplicate_documents" nos metadados
+   do representante;
+2. cada chunk restante quase idêntico a um chunk já indexado é descartado e
+   registrado em "near_duplicates" do chunk representante.
+Os representantes ficam no índice com a lista das fontes que representam. Cada
+fonte colapsada leva os seus metadados ("outros_metadados_doc": relator, data,
+classe, tribunal), que o `MetadataFilterIndex` indexa no chunk representante: um
+filtro pelo relator ou pela data da cópia descartada também encontra o trecho.
+"""
+import zlib
+
+import numpy as np
+
+from metrics import increment, observe, timer
+
+DEFAULT_DEDUP_THRESHOLD = 0.8
+DEFAULT_NUM_PERMUTATIONS = 128
+DEFAULT_LSH_BANDS = 32
+SHINGLE_SIZE = 5
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_MAX_HASH = (1 << 32) - 1
+_SHINGLE_BASE = 1_000_003
+
+
+def dedup_params(threshold=DEFAULT_DEDUP_THRESHOLD):
+    """Parâmetros da deduplicação que entram no fingerprint do índice."""
+    if threshold is None:
+        return {"dedup": None}
+    return {"dedup": {"threshold": threshold, "shingle_size": SHINGLE_SIZE,
+                      "num_permutations": DEFAULT_NUM_PERMUTATIONS, "bands": DEFAULT_LSH_BANDS}}
+
+
+class MinHasher:
+    """Assinaturas MinHash de textos (shingles de palavras, permutações por hashing universal)."""
+
+    def __init__(self, num_permutations=DEFAULT_NUM_PERMUTATIONS, seed=1):
+        rng = np.random.RandomState(seed)
+        # h(x) = (a * x + b) mod p, com p = 2^31 - 1 e a, b, x < p: o produto cabe em 62 bits
+        self._a = rng.randint(1, _MERSENNE_PRIME, size=(num_permutations, 1)).astype(np.uint64)
+        self._b = rng.randint(0, _MERSENNE_PRIME, size=(num_permutations, 1)).astype(np.uint64)
+        self.num_permutations = num_permutations
+        self._word_hashes = {}
+
+    def _word_hash(self, word):
+        word_hash = self._word_hashes.get(word)
+        if word_hash is None:
+            word_hash = self._word_hashes[word] = zlib.crc32(word.encode('utf-8'))
+        return word_hash
+
+    def shingle_hashes(self, text):
+        """Hashes (32 bits) dos shingles de SHINGLE_SIZE palavras do texto, sem repetição."""
+        words = np.asarray([self._word_hash(word) for word in text.lower().split()], dtype=np.uint64)
+        if not len(words):
+            return words
+        size = min(SHINGLE_SIZE, len(words))
+        # Hash polinomial de cada janela de `size` palavras (aritmética de 64 bits com overflow)
+        shingles = np.zeros(len(words) - size + 1, dtype=np.uint64)
+        for offset in range(size):
+            shingles = shingles * np.uint64(_SHINGLE_BASE) + words[offset:offset + len(shingles)]
+        return np.unique(shingles & np.uint64(_MAX_HASH))
+
+    def signature(self, text):
+        """Assinatura (uint32, `num_permutations` valores) do texto; None para texto vazio."""
+        shingles = self.shingle_hashes(text)
+        if not len(shingles):
+            return None
+        prime = np.uint64(_MERSENNE_PRIME)
+        hashed = (self._a * (shingles[np.newaxis, :] % prime) + self._b) % prime
+        return hashed.min(axis=1).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    Representantes indexados por LSH. `find(signature)` retorna a chave do representante
+    com similaridade estimada >= `threshold` (o mais similar), ou None.
+    """
+
+    def __init__(self, threshold=DEFAULT_DEDUP_THRESHOLD, bands=DEFAULT_LSH_BANDS,
+                 num_permutations=DEFAULT_NUM_PERMUTATIONS):
+        if num_permutations % bands:
+            raise ValueError("num_permutations deve ser múltiplo de bands.")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_permutations // bands
+        self._buckets = {}       # (faixa, bytes da faixa) -> linhas dos representantes
+        self._signatures = np.empty((1024, num_permutations), dtype=np.uint32)   # uma linha por representante
+        self._keys = []          # linha -> chave do representante
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def find(self, signature):
+        candidates = set()
+        for band_key in self._band_keys(signature):
+            candidates.update(self._buckets.get(band_key, ()))
+        if not candidates:
+            return None
+        rows = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        similarities = (self._signatures[rows] == signature).mean(axis=1)
+        best = int(np.argmax(similarities))
+        return self._keys[rows[best]] if similarities[best] >= self.threshold else None
+
+    def add(self, key, signature):
+        row = len(self._keys)
+        if row == len(self._signatures):
+            self._signatures = np.concatenate([self._signatures, np.empty_like(self._signatures)])
+        self._signatures[row] = signature
+        self._keys.append(key)
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, []).append(row)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+def _document_source(metadata):
+    return {"source_document": metadata.get("source_document"), "document_id": metadata.get("document_id"),
+            "outros_metadados_doc": metadata.get("outros_metadados_doc", {})}
+
+
+def _chunk_source(chunk):
+    return dict(_document_source(chunk["metadata_chunk"]), chunk_index=chunk.get("chunk_index"))
+
+
+class NearDuplicateFilter:
+    """
+    Deduplicação em fluxo dos chunks, documento a documento (ver docstring do módulo).
+    `filter_document(chunks)` devolve os chunks do documento que devem ser indexados; as
+    fontes colapsadas em cada chunk representante ficam em `chunk_duplicates`
+    (posição do representante entre os chunks mantidos -> fontes) até `attach`/gravação.
+    """
+
+    def __init__(self, threshold=DEFAULT_DEDUP_THRESHOLD, num_permutations=DEFAULT_NUM_PERMUTATIONS,
+                 bands=DEFAULT_LSH_BANDS):
+        self.hasher = MinHasher(num_permutations)
+        self.document_index = NearDuplicateIndex(threshold, bands, num_permutations)
+        self.chunk_index = NearDuplicateIndex(threshold, bands, num_permutations)
+        self.chunk_duplicates = {}
+        self._document_metadata = []   # metadados do documento representante, por chave no índice
+        self.num_documents = 0
+        self.num_duplicate_documents = 0
+        self.num_chunks = 0
+        self.num_kept_chunks = 0
+
+    def filter_document(self, chunks):
+        self.num_documents += 1
+        self.num_chunks += len(chunks)
+        if not chunks:
+            return []
+        with timer("dedup", items=len(chunks)):
+            metadata = chunks[0]["metadata_chunk"]
+            signatures = [self.hasher.signature(chunk["text_chunk"]) for chunk in chunks]
+            # MinHash da união dos shingles dos chunks = mínimo, posição a posição, das assinaturas
+            non_empty = [signature for signature in signatures if signature is not None]
+            document_signature = np.min(non_empty, axis=0) if non_empty else None
+            if document_signature is not None:
+                representative = self.document_index.find(document_signature)
+                if representative is not None:
+                    # Documento republicado: os metadados do representante listam esta fonte
+                    self.num_duplicate_documents += 1
+                    self._document_metadata[representative].setdefault("near_duplicate_documents", []).append(
+                        _document_source(metadata))
+                    return []
+                self.document_index.add(len(self._document_metadata), document_signature)
+                self._document_metadata.append(metadata)
+
+            kept_chunks = []
+            for chunk, signature in zip(chunks, signatures):
+                representative = None if signature is None else self.chunk_index.find(signature)
+                if representative is not None:
+                    self.chunk_duplicates.setdefault(representative, []).append(_chunk_source(chunk))
+                    continue
+                if signature is not None:
+                    self.chunk_index.add(self.num_kept_chunks, signature)
+                self.num_kept_chunks += 1
+                kept_chunks.append(chunk)
+        return kept_chunks
+
+    def attach(self, kept_chunks):
+        """Grava em cada chunk representante (lista de chunks mantidos, em ordem) as fontes colapsadas."""
+        for position, sources in self.chunk_duplicates.items():
+            kept_chunks[position]["near_duplicates"] = sources
+        return kept_chunks
+
+    def report(self):
+        """Totais e a razão de deduplicação (fração dos chunks que não foram indexados)."""
+        removed = self.num_chunks - self.num_kept_chunks
+        return {
+            "documents": self.num_documents,
+            "duplicate_documents": self.num_duplicate_documents,
+            "chunks": self.num_chunks,
+            "indexed_chunks": self.num_kept_chunks,
+            "removed_chunks": removed,
+            "dedup_ratio": removed / self.num_chunks if self.num_chunks else 0.0,
+        }
+
+    def print_report(self):
+        report = self.report()
+        print(f"Deduplicação: {report['removed_chunks']} de {report['chunks']} chunks eram quase-duplicatas "
+              f"({report['dedup_ratio']:.1%}); {report['duplicate_documents']} de {report['documents']} "
+              f"documentos republicados. {report['indexed_chunks']} chunks indexados.")
+        increment("dedup_removed_chunks_total", report["removed_chunks"])
+        observe("dedup_ratio", report["dedup_ratio"])
+        return report
@@ -0,0 +1,132 @@
+# document_registry.py
+"""
+Registro dos documentos do corpus, com busca O(1) por id e por fileName.
+
+Cada documento recebe na ingestão um id numérico estável (`document_id`): a sua
+posição no JSON de origem (ver `prepare_document_for_rag`), a mesma em todas as
+execuções enquanto o corpus não mudar. O id é copiado para os metadados de cada
+chunk, então um chunk recuperado na busca aponta diretamente para o seu documento,
+sem varrer a lista de documentos.
+
+O índice por fileName é um dicionário fileName -> ids: o corpus pode ter mais de
+um documento com o mesmo fileName (ex.: o mesmo acórdão publicado duas vezes).
+
+O registro guarda só os campos de exibição (fileName, ementa e metadados de origem),
+nunca o texto nem os blocos do documento: o texto já está no ChunkStore. No serviço
+ele é montado a partir da tabela de documentos do artefato (`from_chunks`).
+"""
+from chunk_store import ChunkStore
+
+DISPLAY_FIELDS = ("document_id", "source", "ementa_display_text", "full_metadata_origem")
+
+
+def display_fields(document):
+    """Campos do documento (formato de `prepare_document_for_rag`) mantidos no registro."""
+    return {field: document.get(field) for field in DISPLAY_FIELDS}
+
+
+class DocumentRegistry:
+    """Documentos indexados por `document_id` e por fileName (ver docstring do módulo)."""
+
+    def __init__(self):
+        self._documents_by_id = {}      # document_id -> campos de exibição (`display_fields`)
+        self._ids_by_file_name = {}     # fileName -> lista de document_ids, na ordem de registro
+        self._next_id = 0
+
+    @classmethod
+    def from_documents(cls, documents):
+        """Cria o registro a partir dos documentos carregados (ex.: `load_processes_from_original_json`)."""
+        registry = cls()
+        for document in documents:
+            registry.register(document)
+        return registry
+
+    @classmethod
+    def from_chunks(cls, chunks_with_metadata):
+        """
+        Cria o registro a partir dos metadados dos chunks ("metadata_chunk"); de um ChunkStore,
+        lê a tabela de documentos, sem materializar os chunks.
+        """
+        if isinstance(chunks_with_metadata, ChunkStore):
+            all_metadata = chunks_with_metadata.documents
+        else:
+            all_metadata = (chunk["metadata_chunk"] for chunk in chunks_with_metadata)
+        registry = cls()
+        seen = set()
+        for metadata in all_metadata:
+            # Chunks de um mesmo documento repetem os metadados; sem id, o fileName identifica o documento
+            key = metadata.get("document_id")
+            key = ("fileName", metadata.get("source_document")) if key is None else key
+            if key in seen:
+                continue
+            seen.add(key)
+            registry.register({
+                "document_id": metadata.get("document_id"),
+                "source": metadata.get("source_document"),
+                "ementa_display_text": metadata.get("ementa_original"),
+                "full_metadata_origem": metadata.get("outros_metadados_doc", {}),
+            })
+        return registry
+
+    def register(self, document):
+        """
+        Inclui o documento (só os `display_fields`) e retorna o seu id. Documentos sem
+        `document_id` recebem o próximo id livre (gravado no próprio dicionário); um id já
+        registrado é substituído.
+        """
+        document_id = document.get("document_id")
+        if document_id is None:
+            document_id = self._next_id
+            document["document_id"] = document_id
+        previous = self._documents_by_id.get(document_id)
+        if previous is not None:
+            self._unindex_file_name(previous, document_id)
+        self._documents_by_id[document_id] = display_fields(document)
+        self._ids_by_file_name.setdefault(document.get("source"), []).append(document_id)
+        self._next_id = max(self._next_id, document_id + 1)
+        return document_id
+
+    def remove(self, document_id):
+        """Remove o documento do registro. Retorna os campos removidos, ou None se não existir."""
+        document = self._documents_by_id.pop(document_id, None)
+        if document is not None:
+            self._unindex_file_name(document, document_id)
+        return document
+
+    def _unindex_file_name(self, document, document_id):
+        file_name = document.get("source")
+        ids = self._ids_by_file_name.get(file_name, [])
+        if document_id in ids:
+            ids.remove(document_id)
+        if not ids:
+            self._ids_by_file_name.pop(file_name, None)
+
+    def get(self, document_id):
+        """Documento com o id informado, ou None."""
+        return self._documents_by_id.get(document_id)
+
+    def ids_for(self, file_name):
+        """Ids dos documentos com o fileName informado (lista vazia se não houver)."""
+        return list(self._ids_by_file_name.get(file_name, ()))
+
+    def find(self, file_name):
+        """Primeiro documento registrado com o fileName informado, ou None."""
+        ids = self._ids_by_file_name.get(file_name)
+        return self._documents_by_id[ids[0]] if ids else None
+
+    def document_for_chunk(self, chunk):
+        """
+        Documento de origem de um chunk: pelo `document_id` dos metadados e, em chunks
+        sem id (ex.: índices gravados antes dos ids), pelo fileName.
+        """
+        metadata = chunk["metadata_chunk"]
+        document = self.get(metadata.get("document_id"))
+        if document is None:
+            document = self.find(metadata.get("source_document"))
+        return document
+
+    def __len__(self):
+        return len(self._documents_by_id)
+
+    def __contains__(self, document_id):
+        return document_id in self._documents_by_id
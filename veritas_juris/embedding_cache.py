@@ -0,0 +1,124 @@
+# embedding_cache.py
+"""
+Cache de embeddings endereçado por conteúdo.
+
+A chave de cada vetor é o hash de (nome do modelo, texto normalizado do chunk),
+então um chunk que já foi codificado uma vez nunca volta ao modelo, mesmo que
+o corpus seja reprocessado ou reordenado. Ao acrescentar novos acórdãos ao
+`processo.json`, apenas os chunks novos ou alterados são codificados.
+"""
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+
+import numpy as np
+
+# Limite de parâmetros por consulta "IN (...)" no SQLite.
+_SQLITE_BATCH = 500
+
+
+def normalize_chunk_text(text):
+    """Normaliza o texto do chunk para o cálculo da chave (Unicode NFC e espaços colapsados)."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def embedding_cache_key(model_name, text):
+    """Retorna a chave de cache (hex sha256) para o par (modelo, texto normalizado)."""
+    hasher = hashlib.sha256()
+    hasher.update(model_name.encode('utf-8'))
+    hasher.update(b"\x00")
+    hasher.update(normalize_chunk_text(text).encode('utf-8'))
+    return hasher.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Armazena embeddings float32 em um arquivo SQLite local (uma linha por chave).
+    Pode ser compartilhado entre processos; o modo WAL permite leituras
+    concorrentes enquanto um processo de ingestão grava.
+    """
+
+    def __init__(self, db_path, model_name):
+        self.db_path = db_path
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " dim INTEGER NOT NULL,"
+            " vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys):
+        """Retorna um dicionário chave -> vetor (float32) apenas para as chaves presentes no cache."""
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique_keys), _SQLITE_BATCH):
+                batch = unique_keys[start:start + _SQLITE_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, dim, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                )
+                for key, dim, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    if vector.shape[0] == dim:
+                        found[key] = vector
+        return found
+
+    def put_many(self, keys, vectors):
+        """Grava os vetores (matriz N x d) para as chaves correspondentes."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        rows = [(key, int(vector.shape[0]), vector.tobytes()) for key, vector in zip(keys, vectors)]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dim, vector) VALUES (?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def encode_with_cache(texts, embedding_model, cache, show_progress_bar=True):
+    """
+    Gera a matriz de embeddings de `texts` (na mesma ordem), consultando o cache
+    antes e enviando ao modelo somente os textos ausentes. Textos repetidos
+    dentro do mesmo lote são codificados uma única vez.
+    """
+    keys = [embedding_cache_key(cache.model_name, text) for text in texts]
+    cached = cache.get_many(keys)
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in missing:
+            missing[key] = text
+
+    cache.hits += len(texts) - len(missing)
+    cache.misses += len(missing)
+    print(f"Cache de embeddings: {len(texts) - len(missing)} reaproveitados, {len(missing)} a codificar.")
+
+    if missing:
+        missing_keys = list(missing.keys())
+        new_vectors = embedding_model.encode(list(missing.values()), show_progress_bar=show_progress_bar)
+        new_vectors = np.asarray(new_vectors, dtype=np.float32)
+        if new_vectors.ndim == 1:
+            new_vectors = np.expand_dims(new_vectors, axis=0)
+        cache.put_many(missing_keys, new_vectors)
+        cached.update(zip(missing_keys, new_vectors))
+
+    if not keys:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack([cached[key] for key in keys]).astype(np.float32, copy=False)
@@ -0,0 +1,194 @@
+# embedding_engine.py
+"""
+Motor de embeddings para CPU em torno do SentenceTransformer.
+
+Em hosts só com CPU, gerar embeddings é de longe a etapa mais cara da indexação.
+O `EmbeddingEngine`:
+- ordena os textos pelo número de tokens e monta lotes dinâmicos limitados por
+  um orçamento de tokens (lote x maior sequência), reduzindo o padding;
+- controla o número de threads intra-op do torch;
+- opcionalmente roda o modelo em precisão reduzida (bfloat16/float16), com
+  quantização dinâmica int8 das camadas lineares ou com o backend ONNX;
+- devolve a matriz em float32 ou float16, na ordem original dos textos.
+
+Ele expõe `encode(...)` como o SentenceTransformer, então pode ser passado em
+qualquer lugar do pipeline que recebe `embedding_model`.
+"""
+import zlib
+
+import numpy as np
+
+from rag_pipeline import DEFAULT_EMBEDDING_MODEL_NAME, initialize_embedding_model
+
+PRECISIONS = ("float32", "bfloat16", "float16", "qint8")
+BACKENDS = ("torch", "onnx")
+
+DEFAULT_TOKEN_BUDGET = 16384
+DEFAULT_MAX_BATCH_SIZE = 256
+
+
+def _apply_precision(model, precision):
+    """Converte os pesos do modelo (backend torch) para a precisão pedida."""
+    if precision == "float32":
+        return model
+    import torch
+
+    if precision == "bfloat16":
+        return model.to(torch.bfloat16)
+    if precision == "float16":
+        return model.half()
+    # qint8: quantização dinâmica das camadas lineares (a maior parte do custo em CPU)
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class EmbeddingEngine:
+    """Envolve um SentenceTransformer com lotes por orçamento de tokens e opções de precisão."""
+
+    def __init__(self, model, model_name=DEFAULT_EMBEDDING_MODEL_NAME, precision="float32", backend="torch",
+                 token_budget=DEFAULT_TOKEN_BUDGET, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 output_dtype="float32", num_threads=None):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Precisão desconhecida: {precision}. Opções: {', '.join(PRECISIONS)}.")
+        if output_dtype not in ("float32", "float16"):
+            raise ValueError("output_dtype deve ser 'float32' ou 'float16'.")
+        self.model_name = model_name
+        self.precision = precision
+        self.backend = backend
+        self.token_budget = token_budget
+        self.max_batch_size = max_batch_size
+        self.output_dtype = output_dtype
+        if num_threads:
+            import torch
+
+            torch.set_num_threads(num_threads)
+        self.model = _apply_precision(model, precision) if backend == "torch" else model
+
+    @property
+    def model_id(self):
+        """
+        Identificador usado no fingerprint do índice e nas chaves do cache de embeddings:
+        vetores gerados em outra precisão/backend não se misturam com os de float32.
+        """
+        if self.precision == "float32" and self.backend == "torch":
+            return self.model_name
+        return f"{self.model_name}@{self.backend}-{self.precision}"
+
+    def __getattr__(self, name):
+        # Demais atributos (ex.: get_sentence_embedding_dimension) vêm do modelo
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def token_lengths(self, texts):
+        """Número de tokens (truncado em max_seq_length) de cada texto; estimativa por palavras sem tokenizer."""
+        tokenizer = getattr(self.model, "tokenizer", None)
+        max_length = getattr(self.model, "max_seq_length", None) or 512
+        if tokenizer is None:
+            return [min(int(len(text.split()) * 1.5) + 2, max_length) for text in texts]
+        encoded = tokenizer(list(texts), add_special_tokens=True, truncation=True, max_length=max_length)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def plan_batches(self, lengths):
+        """
+        Ordena os índices dos textos do maior para o menor e os agrupa em lotes cujo custo
+        (tamanho do lote x maior sequência do lote) cabe no orçamento de tokens.
+        """
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        batches = []
+        current = []
+        current_max = 0
+        for i in order:
+            longest = max(current_max, lengths[i])
+            if current and (longest * (len(current) + 1) > self.token_budget or len(current) >= self.max_batch_size):
+                batches.append(current)
+                current, longest = [], lengths[i]
+            current.append(i)
+            current_max = longest
+        if current:
+            batches.append(current)
+        return batches
+
+    def encode(self, texts, show_progress_bar=False, **kwargs):
+        """Gera os embeddings de `texts` (matriz N x d) na ordem original."""
+        single_text = isinstance(texts, str)
+        if single_text:
+            texts = [texts]
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=self.output_dtype)
+
+        batches = self.plan_batches(self.token_lengths(texts))
+        embeddings = None
+        for number, batch in enumerate(batches, start=1):
+            vectors = self.model.encode([texts[i] for i in batch], batch_size=len(batch),
+                                        convert_to_numpy=True, show_progress_bar=False, **kwargs)
+            vectors = np.asarray(vectors, dtype=np.float32)
+            if embeddings is None:
+                embeddings = np.empty((len(texts), vectors.shape[1]), dtype=self.output_dtype)
+            embeddings[batch] = vectors
+            if show_progress_bar:
+                print(f"  Embeddings: lote {number}/{len(batches)} ({len(batch)} textos)")
+        return embeddings[0] if single_text else embeddings
+
+
+class HashingEmbeddingModel:
+    """
+    Modelo de embedding determinístico e offline, para benchmarks e testes sem baixar o
+    SentenceTransformer: cada palavra (minúscula) soma +-1 em uma dimensão escolhida pelo
+    seu CRC32 (feature hashing) e o vetor é normalizado. Textos com palavras em comum
+    ficam próximos, o que basta para exercitar índice, busca e filtros.
+    """
+
+    def __init__(self, dimension=384, model_name="hashing-stub"):
+        self.dimension = dimension
+        self.model_name = model_name
+        self._buckets = {}   # palavra -> (dimensão, sinal)
+
+    @property
+    def model_id(self):
+        return f"{self.model_name}-{self.dimension}"
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def _bucket(self, word):
+        bucket = self._buckets.get(word)
+        if bucket is None:
+            digest = zlib.crc32(word.encode('utf-8'))
+            bucket = self._buckets[word] = (digest % self.dimension, 1.0 if digest & 0x80000000 else -1.0)
+        return bucket
+
+    def encode(self, texts, show_progress_bar=False, **kwargs):
+        single_text = isinstance(texts, str)
+        texts = [texts] if single_text else list(texts)
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            buckets = [self._bucket(word) for word in text.lower().split()]
+            if buckets:
+                columns, signs = zip(*buckets)
+                embeddings[row] = np.bincount(columns, weights=signs, minlength=self.dimension)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings /= np.maximum(norms, 1e-9)
+        return embeddings[0] if single_text else embeddings
+
+
+def load_embedding_engine(model_name=DEFAULT_EMBEDDING_MODEL_NAME, precision="float32", backend="torch",
+                          num_threads=None, token_budget=DEFAULT_TOKEN_BUDGET, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                          output_dtype="float32"):
+    """
+    Carrega o modelo (ver `initialize_embedding_model`) e o envolve no `EmbeddingEngine`.
+    Com backend="onnx" o modelo é carregado pelo backend ONNX do sentence-transformers
+    (>= 3.2); precision="qint8" usa o arquivo `onnx/model_qint8_avx512_vnni.onnx`, que
+    precisa ter sido exportado para o modelo (ex.: `export_dynamic_quantized_onnx_model`).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend desconhecido: {backend}. Opções: {', '.join(BACKENDS)}.")
+    if backend == "onnx" and precision not in ("float32", "qint8"):
+        raise ValueError("Com backend='onnx' use precision 'float32' ou 'qint8'.")
+    model_kwargs = None
+    if backend == "onnx" and precision == "qint8":
+        model_kwargs = {"file_name": "onnx/model_qint8_avx512_vnni.onnx"}
+    model = initialize_embedding_model(model_name, backend=backend, model_kwargs=model_kwargs)
+    return EmbeddingEngine(model, model_name=model_name, precision=precision, backend=backend,
+                           token_budget=token_budget, max_batch_size=max_batch_size,
+                           output_dtype=output_dtype, num_threads=num_threads)
@@ -0,0 +1,298 @@
+# index_factory.py
+"""
+Fábrica de índices FAISS para o vector store.
+
+O índice exato (`IndexFlatL2`) faz cada busca em O(N·d); serve para a amostra de
+`data/processo.json`, mas não para o acervo completo do STJ/STF. Aqui o tipo de
+índice é configurável (flat, IVF-Flat, IVF-PQ, HNSW, com quantização escalar
+float16/8 bits), é treinado automaticamente numa amostra quando necessário e
+os parâmetros de busca (`nprobe`, `efSearch`) podem ser ajustados por consulta.
+
+Para escolher o ponto latência/recall conscientemente, `compare_index_configs`
+mede o recall@k de cada índice aproximado contra o índice exato no mesmo corpus:
+
+    python index_factory.py index_artifacts/<fingerprint>/index.faiss --k 10
+"""
+import argparse
+import json
+import math
+import time
+
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+QUANTIZATIONS = (None, "fp16", "sq8")
+
+# Limiares (em número de vetores) usados por index_type="auto"
+AUTO_FLAT_MAX_VECTORS = 50_000
+AUTO_IVF_FLAT_MAX_VECTORS = 1_000_000
+
+# O k-means do FAISS pede ~39 pontos de treino por centróide
+_MIN_TRAIN_POINTS_PER_CENTROID = 39
+_DEFAULT_TRAIN_POINTS_PER_CENTROID = 64
+
+_SQ_CODES = {None: "Flat", "fp16": "SQfp16", "sq8": "SQ8"}
+
+
+def choose_index_type(num_vectors):
+    """Escolhe o tipo de índice pelo tamanho do corpus (usado por index_type="auto")."""
+    if num_vectors <= AUTO_FLAT_MAX_VECTORS:
+        return "flat"
+    if num_vectors <= AUTO_IVF_FLAT_MAX_VECTORS:
+        return "ivf_flat"
+    return "ivf_pq"
+
+
+def default_nlist(num_vectors, train_points=None):
+    """
+    Número de listas do IVF: ~4·sqrt(N), limitado para que haja pontos de treino suficientes
+    (`train_points`, padrão: os N vetores).
+    """
+    nlist = int(4 * math.sqrt(max(num_vectors, 1)))
+    train_points = num_vectors if train_points is None else train_points
+    nlist = min(nlist, train_points // _MIN_TRAIN_POINTS_PER_CENTROID)
+    return max(nlist, 1)
+
+
+def default_pq_m(dimension):
+    """Número de sub-quantizadores do PQ: o maior divisor de d com pelo menos 4 dimensões cada."""
+    for m in range(dimension // 4, 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def describe_index(dimension, num_vectors, index_type="flat", quantization=None,
+                   nlist=None, pq_m=None, hnsw_m=32, train_points=None):
+    """Monta a string do `faiss.index_factory` para a configuração pedida."""
+    if index_type == "auto":
+        index_type = choose_index_type(num_vectors)
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice desconhecido: {index_type}. Opções: auto, {', '.join(INDEX_TYPES)}.")
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Quantização desconhecida: {quantization}. Opções: fp16, sq8.")
+
+    storage = _SQ_CODES[quantization]
+    if index_type == "flat":
+        return storage
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m},{storage}"
+
+    nlist = nlist or default_nlist(num_vectors, train_points)
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},{storage}"
+    # ivf_pq: PQ de 8 bits (256 centróides por sub-quantizador)
+    return f"IVF{nlist},PQ{pq_m or default_pq_m(dimension)}"
+
+
+def default_train_size(index):
+    """
+    Tamanho padrão da amostra de treino de `index`: ~64 pontos por centróide (as listas do
+    IVF ou, no PQ, os 256 centróides de cada sub-quantizador). 0 se o índice não exige treino.
+    """
+    if index.is_trained:
+        return 0
+    import faiss
+    ivf = faiss.try_extract_index_ivf(index)
+    centroids = ivf.nlist if ivf is not None else 1
+    if isinstance(_base_index(ivf if ivf is not None else index), (faiss.IndexIVFPQ, faiss.IndexPQ)):
+        centroids = max(centroids, 256)
+    return centroids * _DEFAULT_TRAIN_POINTS_PER_CENTROID
+
+
+def build_faiss_index(embeddings, index_type="flat", quantization=None, nlist=None, pq_m=None,
+                      hnsw_m=32, train_sample_size=None, seed=1234):
+    """
+    Cria, treina (se necessário) e popula um índice FAISS com `embeddings` (N x d, float32).
+    O treino usa uma amostra aleatória do corpus (padrão: `default_train_size`).
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    num_vectors, dimension = embeddings.shape
+    train_points = min(train_sample_size, num_vectors) if train_sample_size else None
+    description = describe_index(dimension, num_vectors, index_type, quantization, nlist, pq_m, hnsw_m,
+                                 train_points=train_points)
+    import faiss
+    index = faiss.index_factory(dimension, description)
+
+    if not index.is_trained:
+        train_sample_size = train_sample_size or default_train_size(index)
+        sample = embeddings
+        if num_vectors > train_sample_size:
+            rng = np.random.default_rng(seed)
+            sample = embeddings[rng.choice(num_vectors, size=train_sample_size, replace=False)]
+        print(f"Treinando índice '{description}' com {sample.shape[0]} vetores...")
+        index.train(sample)
+
+    index.add(embeddings)
+    print(f"Índice FAISS '{description}' criado com {index.ntotal} vetores.")
+    return index
+
+
+def _base_index(index):
+    """Retorna o índice "de verdade" por trás de wrappers como IndexIDMap/IndexIDMap2."""
+    import faiss
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def stored_vectors(index):
+    """
+    Vetores armazenados no índice, na ordem interna (aproximados em índices com PQ/SQ).
+    Índices IVF só reconstroem com o direct map, criado aqui (altera o índice recebido).
+    """
+    import faiss
+    base_index = _base_index(index)
+    ivf_index = faiss.try_extract_index_ivf(base_index)
+    if ivf_index is not None:
+        ivf_index.make_direct_map()
+    return base_index.reconstruct_n(0, base_index.ntotal)
+
+
+def hold_out_queries(embeddings, num_queries, seed=0):
+    """
+    Separa `num_queries` vetores do corpus para servir de consulta e retorna
+    (corpus sem eles, consultas). Se as consultas continuassem no corpus, o vizinho
+    mais próximo de cada uma seria ela mesma e o recall@k sairia inflado.
+    """
+    rng = np.random.default_rng(seed)
+    num_queries = max(min(num_queries, len(embeddings) - 1), 0)
+    is_query = np.zeros(len(embeddings), dtype=bool)
+    is_query[rng.choice(len(embeddings), size=num_queries, replace=False)] = True
+    return embeddings[~is_query], embeddings[is_query]
+
+
+def make_search_params(index, nprobe=None, ef_search=None, selector=None):
+    """
+    Cria os parâmetros de busca por consulta (`nprobe` para IVF, `efSearch` para HNSW e
+    um IDSelector opcional, que restringe a busca a um subconjunto de ids).
+    Por serem passados em cada `search`, não alteram o índice compartilhado entre threads.
+    Retorna None quando não há nada a ajustar para o tipo de índice.
+    """
+    import faiss
+    base = _base_index(index)
+    if isinstance(base, faiss.IndexIVF) and (nprobe is not None or selector is not None):
+        params = faiss.SearchParametersIVF(nprobe=int(nprobe) if nprobe is not None else base.nprobe)
+    elif isinstance(base, faiss.IndexHNSW) and (ef_search is not None or selector is not None):
+        params = faiss.SearchParametersHNSW(efSearch=int(ef_search) if ef_search is not None else base.hnsw.efSearch)
+    elif selector is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def search_index(index, query_vectors, top_k, nprobe=None, ef_search=None, selector=None):
+    """`index.search` com os parâmetros de busca opcionais."""
+    params = make_search_params(index, nprobe=nprobe, ef_search=ef_search, selector=selector)
+    query_vectors = np.ascontiguousarray(query_vectors, dtype='float32')
+    if params is None:
+        return index.search(query_vectors, top_k)
+    return index.search(query_vectors, top_k, params=params)
+
+
+# --- Verificação de recall ---
+def measure_recall(approx_index, exact_index, query_vectors, k=10, nprobe=None, ef_search=None):
+    """
+    Mede o recall@k do índice aproximado contra o exato (fração dos k vizinhos exatos
+    recuperados) e a latência média por consulta, em milissegundos.
+    """
+    _, exact_ids = exact_index.search(np.ascontiguousarray(query_vectors, dtype='float32'), k)
+    start = time.perf_counter()
+    _, approx_ids = search_index(approx_index, query_vectors, k, nprobe=nprobe, ef_search=ef_search)
+    elapsed = time.perf_counter() - start
+
+    hits = 0
+    for exact_row, approx_row in zip(exact_ids, approx_ids):
+        exact_set = set(exact_row[exact_row >= 0].tolist())
+        hits += len(exact_set.intersection(approx_row.tolist()))
+    total = max(int((exact_ids >= 0).sum()), 1)
+    return {
+        "recall_at_k": hits / total,
+        "k": k,
+        "num_queries": int(len(query_vectors)),
+        "latency_ms_per_query": 1000.0 * elapsed / max(len(query_vectors), 1),
+    }
+
+
+DEFAULT_COMPARISON_CONFIGS = [
+    {"index_type": "flat", "quantization": "fp16"},
+    {"index_type": "flat", "quantization": "sq8"},
+    {"index_type": "ivf_flat", "nprobe": 1},
+    {"index_type": "ivf_flat", "nprobe": 8},
+    {"index_type": "ivf_flat", "nprobe": 32},
+    {"index_type": "ivf_pq", "nprobe": 16},
+    {"index_type": "hnsw", "ef_search": 16},
+    {"index_type": "hnsw", "ef_search": 64},
+]
+
+
+def compare_index_configs(embeddings, query_vectors, configs=None, k=10):
+    """
+    Constrói cada configuração sobre `embeddings` e mede o recall@k contra o índice
+    exato. Configurações que não podem ser treinadas com o corpus informado (ex.:
+    PQ com menos de 256 vetores) são reportadas com o erro em vez de interromper.
+    """
+    import faiss
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    exact_index = faiss.IndexFlatL2(embeddings.shape[1])
+    exact_index.add(embeddings)
+
+    build_keys = ("index_type", "quantization", "nlist", "pq_m", "hnsw_m")
+    built = {}
+    reports = []
+    for config in configs or DEFAULT_COMPARISON_CONFIGS:
+        build_options = {key: config[key] for key in build_keys if key in config}
+        cache_key = json.dumps(build_options, sort_keys=True)
+        report = dict(config)
+        try:
+            if cache_key not in built:
+                start = time.perf_counter()
+                built[cache_key] = (build_faiss_index(embeddings, **build_options), time.perf_counter() - start)
+            index, build_seconds = built[cache_key]
+            report.update(measure_recall(index, exact_index, query_vectors, k=k,
+                                         nprobe=config.get("nprobe"), ef_search=config.get("ef_search")))
+            report["build_seconds"] = build_seconds
+        except (RuntimeError, ValueError) as e:
+            report["error"] = str(e)
+        reports.append(report)
+    return reports
+
+
+def _format_report(reports):
+    lines = [f"{'configuração':<48} {'recall@k':>9} {'ms/consulta':>12}"]
+    for report in reports:
+        label = ", ".join(f"{key}={value}" for key, value in report.items()
+                          if key in ("index_type", "quantization", "nlist", "pq_m", "hnsw_m", "nprobe", "ef_search"))
+        if "error" in report:
+            lines.append(f"{label:<48} ERRO: {report['error']}")
+        else:
+            lines.append(f"{label:<48} {report['recall_at_k']:>9.3f} {report['latency_ms_per_query']:>12.3f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o recall@k de índices aproximados contra o índice exato.")
+    parser.add_argument("index_path", help="Arquivo .faiss com os vetores do corpus (ex.: index_artifacts/<fp>/index.faiss)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--num-queries", type=int, default=200,
+                        help="Consultas amostradas do próprio corpus (e retiradas dele antes da comparação)")
+    parser.add_argument("--json", dest="json_output", help="Grava o relatório em JSON neste arquivo")
+    args = parser.parse_args()
+
+    import faiss
+    source_index = faiss.read_index(args.index_path)
+    embeddings, query_vectors = hold_out_queries(stored_vectors(source_index), args.num_queries)
+
+    reports = compare_index_configs(embeddings, query_vectors, k=args.k)
+    print(_format_report(reports))
+    if args.json_output:
+        with open(args.json_output, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+# index_manager.py
+"""
+Manutenção incremental do vector store.
+
+O `IndexManager` envolve o índice FAISS em um `IndexIDMap2`, de modo que cada
+chunk tem um id estável (não a sua posição na lista), e mantém o mapeamento
+document_id -> ids. Assim é possível incluir, substituir ou remover um acórdão
+mexendo apenas nos vetores e metadados dele, sem reconstruir o índice inteiro
+enquanto as consultas continuam sendo atendidas. O índice lexical (BM25) e as
+listas de postings dos filtros são imutáveis: depois de uma alteração, são
+reconstruídos na primeira busca que precisar deles.
+
+No serviço, o `QueryEngine` cria o gerenciador na primeira atualização
+(`QueryEngine.upsert_document`/`delete_document`); até lá as buscas usam o artefato
+mapeado em memória. Documentos incluídos assim não passam pela deduplicação da
+ingestão (ver `dedup`).
+"""
+import threading
+
+import faiss
+import numpy as np
+
+from index_store import load_vector_store, save_vector_store
+from lexical_index import BM25Index
+from metadata_filters import MetadataFilterIndex
+from rag_pipeline import (
+    DEFAULT_CHUNK_OVERLAP,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_CHUNKING_STRATEGY,
+    chunk_document,
+    embed_texts,
+    retrieve_relevant_chunks,
+    retrieve_relevant_chunks_batch,
+)
+
+
+class IndexManager:
+    """Índice FAISS com ids estáveis por chunk e operações de upsert/delete por documento."""
+
+    def __init__(self, embedding_model, dimension=None, embedding_cache=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP,
+                 chunking_strategy=DEFAULT_CHUNKING_STRATEGY):
+        self.embedding_model = embedding_model
+        self.embedding_cache = embedding_cache
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.chunking_strategy = chunking_strategy
+        self.index = None
+        self.chunks_by_id = {}      # id do chunk -> chunk (texto + metadados)
+        self.ids_by_document = {}   # document_id -> lista de ids dos chunks, na ordem do documento
+        self._next_id = 0
+        self._next_document_id = 0
+        self._filter_index = None   # MetadataFilterIndex, reconstruído sob demanda após alterações
+        self._lexical_index = None  # BM25Index, idem
+        self.version = 0            # incrementado a cada alteração (ex.: `index_version` do AnswerCache)
+        # `_lock` só protege a troca das referências (índice, mapas, índices derivados);
+        # `_write_lock` serializa as atualizações (ver "Atualizações").
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        if dimension is not None:
+            self.index = self._new_index(dimension)
+
+    @staticmethod
+    def _new_index(dimension):
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+
+    @staticmethod
+    def _copy_index(index):
+        """Cópia própria do índice (o original pode estar mapeado em memória, somente leitura)."""
+        return faiss.deserialize_index(faiss.serialize_index(index))
+
+    @classmethod
+    def _with_ids(cls, index, ids):
+        """
+        Copia um índice posicional para um `IndexIDMap2` do mesmo tipo (mesma quantização e,
+        no IVF, os mesmos centróides), com os vetores reconstruídos do próprio índice, sem
+        recalcular embeddings. Levanta ValueError para índices que não podem ser atualizados.
+        O índice recebido não é alterado (pode estar atendendo buscas).
+        """
+        if isinstance(faiss.downcast_index(index), faiss.IndexHNSW):
+            raise ValueError("Índices HNSW não permitem remover vetores; use flat ou IVF para atualizações "
+                             "incrementais.")
+        if not index.is_trained:
+            raise ValueError("O índice não está treinado; não há vetores a reaproveitar.")
+        base = cls._copy_index(index)
+        base_ivf = faiss.try_extract_index_ivf(base)
+        if base_ivf is not None:
+            # O IVF só reconstrói vetores pelo id com o mapa direto (id -> lista)
+            base_ivf.make_direct_map()
+        try:
+            vectors = base.reconstruct_n(0, base.ntotal)
+        except RuntimeError as e:
+            raise ValueError(f"Não foi possível reconstruir os vetores do índice "
+                             f"({type(faiss.downcast_index(index)).__name__}): {e}. "
+                             f"Reconstrua o vector store.") from e
+        base.reset()
+        if base_ivf is not None:
+            # `remove_ids` (via IndexIDMap2) não funciona com o mapa direto
+            base_ivf.make_direct_map(False)
+        id_map = faiss.IndexIDMap2(base)
+        id_map.add_with_ids(vectors, ids)
+        return id_map
+
+    @staticmethod
+    def _document_key(metadata):
+        # Chunks de índices gravados antes dos document_ids ficam sob o fileName
+        document_id = metadata.get("document_id")
+        return document_id if document_id is not None else metadata["source_document"]
+
+    # --- Construção ---
+    @classmethod
+    def from_vector_store(cls, index, chunks_with_metadata, embedding_model, **kwargs):
+        """
+        Cria o gerenciador a partir de um vector store existente (ex.: o retornado por
+        `create_vector_store` ou `load_vector_store`). Chunks sem `chunk_id` recebem
+        como id a sua posição na lista, que é o id implícito do índice original.
+        O tipo do índice (flat, IVF, quantização) é preservado (ver `_with_ids`).
+        """
+        manager = cls(embedding_model, **kwargs)
+        if index is None:
+            return manager
+
+        ids = np.array([chunk.get("chunk_id", position) for position, chunk in enumerate(chunks_with_metadata)],
+                       dtype='int64')
+        # O wrapper de `downcast_index` não tem a posse do objeto C++: guarda-se sempre `index`
+        typed_index = faiss.downcast_index(index)
+        if isinstance(typed_index, faiss.IndexIDMap2):
+            if isinstance(faiss.downcast_index(typed_index.index), faiss.IndexHNSW):
+                raise ValueError("Índices HNSW não permitem remover vetores; use flat ou IVF para atualizações "
+                                 "incrementais.")
+            manager.index = index
+        else:
+            manager.index = cls._with_ids(index, ids)
+
+        for chunk_id, chunk in zip(ids.tolist(), chunks_with_metadata):
+            chunk = dict(chunk, chunk_id=chunk_id)
+            manager.chunks_by_id[chunk_id] = chunk
+            document_key = cls._document_key(chunk["metadata_chunk"])
+            manager.ids_by_document.setdefault(document_key, []).append(chunk_id)
+            if isinstance(document_key, int):
+                manager._next_document_id = max(manager._next_document_id, document_key + 1)
+        manager._next_id = int(ids.max()) + 1 if ids.size else 0
+        return manager
+
+    @classmethod
+    def load(cls, fingerprint, embedding_model, artifacts_dir=None, **kwargs):
+        """Carrega um índice gravado com `save`. O índice é lido para a memória (sem mmap), pois será alterado."""
+        index, chunks_with_metadata = load_vector_store(fingerprint, artifacts_dir=artifacts_dir, mmap=False)
+        return cls.from_vector_store(index, chunks_with_metadata, embedding_model, **kwargs)
+
+    def save(self, fingerprint, artifacts_dir=None):
+        """Grava o índice e os chunks (com seus ids) no formato de `index_store`."""
+        with self._write_lock:
+            _, index, chunks_by_id, _, _ = self._snapshot()
+            chunks = [chunks_by_id[chunk_id] for chunk_id in sorted(chunks_by_id)]
+            return save_vector_store(index, chunks, fingerprint, artifacts_dir=artifacts_dir,
+                                     manifest_extra={"next_chunk_id": self._next_id}, replace=True)
+
+    # --- Atualizações ---
+    # As buscas leem `index`, `chunks_by_id` e os índices derivados sem segurar o lock (ver
+    # `_snapshot`); por isso as atualizações nunca os alteram: montam cópias, calculam os
+    # embeddings e trocam as referências de uma vez, sob `_lock`.
+    def upsert_document(self, doc_info):
+        """
+        Inclui ou substitui um documento (no formato de `load_processes_from_original_json`),
+        identificado pelo seu `document_id`; sem id, recebe o próximo livre (gravado no próprio
+        dicionário). Chunks com texto idêntico ao já indexado mantêm id e vetor; só os chunks
+        novos são codificados e só os que deixaram de existir são removidos do índice.
+        Retorna (ids adicionados, ids removidos).
+        """
+        with self._write_lock:
+            return self._upsert_document(doc_info)
+
+    def _upsert_document(self, doc_info):
+        # Só quem tem `_write_lock` troca o estado: aqui ele pode ser lido sem `_lock`
+        source_file = doc_info.get("source", "FonteDesconhecida")
+        if doc_info.get("document_id") is None:
+            doc_info["document_id"] = self._next_document_id
+        document_id = doc_info["document_id"]
+        if isinstance(document_id, int):
+            self._next_document_id = max(self._next_document_id, document_id + 1)
+        new_chunks = chunk_document(doc_info, chunk_size=self.chunk_size, overlap=self.overlap,
+                                    strategy=self.chunking_strategy)
+
+        existing_by_text = {}
+        for chunk_id in self.ids_by_document.get(document_id, []):
+            existing_by_text.setdefault(self.chunks_by_id[chunk_id]["text_chunk"], []).append(chunk_id)
+
+        document_ids = []
+        updated_chunks = []
+        chunks_to_add = []
+        for chunk in new_chunks:
+            reusable_ids = existing_by_text.get(chunk["text_chunk"])
+            if reusable_ids:
+                # Texto igual: mantém id e vetor, atualiza apenas os metadados
+                chunk_id = reusable_ids.pop(0)
+                updated_chunks.append(dict(chunk, chunk_id=chunk_id))
+            else:
+                chunk_id = self._next_id
+                self._next_id += 1
+                chunks_to_add.append(dict(chunk, chunk_id=chunk_id))
+            document_ids.append(chunk_id)
+        removed_ids = [chunk_id for ids in existing_by_text.values() for chunk_id in ids]
+
+        vectors = None
+        if chunks_to_add:
+            vectors = embed_texts([chunk["text_chunk"] for chunk in chunks_to_add], self.embedding_model,
+                                  embedding_cache=self.embedding_cache, show_progress_bar=False)
+
+        index = self._updated_index(removed_ids, chunks_to_add, vectors)
+        chunks_by_id = dict(self.chunks_by_id)
+        for chunk_id in removed_ids:
+            chunks_by_id.pop(chunk_id, None)
+        for chunk in updated_chunks + chunks_to_add:
+            chunks_by_id[chunk["chunk_id"]] = chunk
+        ids_by_document = dict(self.ids_by_document)
+        if document_ids:
+            ids_by_document[document_id] = document_ids
+        else:
+            ids_by_document.pop(document_id, None)
+        self._swap(index, chunks_by_id, ids_by_document)
+
+        added_ids = [chunk["chunk_id"] for chunk in chunks_to_add]
+        print(f"Documento '{source_file}' (id {document_id}) atualizado no índice: {len(added_ids)} chunks adicionados, "
+              f"{len(removed_ids)} removidos, {len(document_ids) - len(added_ids)} mantidos.")
+        return added_ids, removed_ids
+
+    def delete_document(self, document_id):
+        """Remove do índice todos os chunks do documento `document_id`. Retorna os ids removidos."""
+        with self._write_lock:
+            removed_ids = list(self.ids_by_document.get(document_id, []))
+            if removed_ids:
+                chunks_by_id = dict(self.chunks_by_id)
+                for chunk_id in removed_ids:
+                    chunks_by_id.pop(chunk_id, None)
+                ids_by_document = dict(self.ids_by_document)
+                ids_by_document.pop(document_id)
+                self._swap(self._updated_index(removed_ids, [], None), chunks_by_id, ids_by_document)
+        if removed_ids:
+            print(f"Documento {document_id} removido do índice ({len(removed_ids)} chunks).")
+        else:
+            print(f"ALERTA: Documento {document_id} não está no índice.")
+        return removed_ids
+
+    def _updated_index(self, removed_ids, chunks_to_add, vectors):
+        """Cópia do índice atual sem `removed_ids` e com os vetores novos (o atual não é alterado)."""
+        if self.index is None:
+            index = self._new_index(vectors.shape[1]) if chunks_to_add else None
+        elif removed_ids or chunks_to_add:
+            index = self._copy_index(self.index)
+        else:
+            return self.index
+        if removed_ids:
+            index.remove_ids(np.array(removed_ids, dtype='int64'))
+        if chunks_to_add:
+            index.add_with_ids(vectors, np.array([chunk["chunk_id"] for chunk in chunks_to_add], dtype='int64'))
+        return index
+
+    def _swap(self, index, chunks_by_id, ids_by_document):
+        with self._lock:
+            self.index = index
+            self.chunks_by_id = chunks_by_id
+            self.ids_by_document = ids_by_document
+            self._filter_index = None
+            self._lexical_index = None
+            self.version += 1
+
+    # --- Consulta ---
+    def _snapshot(self):
+        with self._lock:
+            return self.version, self.index, self.chunks_by_id, self._filter_index, self._lexical_index
+
+    def _derived_index(self, attribute, current, version, chunks_by_id, build):
+        """Índice derivado (filtros, BM25) da versão `version`, construído fora do lock se faltar."""
+        if current is None:
+            current = build(chunks_by_id)
+            with self._lock:
+                if self.version == version:
+                    setattr(self, attribute, current)
+        return current
+
+    def filter_index(self):
+        """Índice de metadados (filtros) dos chunks atuais; construído na primeira busca filtrada."""
+        version, _, chunks_by_id, filter_index, _ = self._snapshot()
+        return self._derived_index("_filter_index", filter_index, version, chunks_by_id, MetadataFilterIndex.build)
+
+    def lexical_index(self):
+        """Índice BM25 dos chunks atuais; construído na primeira busca lexical/híbrida."""
+        version, _, chunks_by_id, _, lexical_index = self._snapshot()
+        return self._derived_index("_lexical_index", lexical_index, version, chunks_by_id, _build_lexical_index)
+
+    def _search_state(self, search_options):
+        """
+        Referências de uma mesma versão (índice, chunks, filtros, BM25), tomadas sob o lock; a
+        busca roda fora dele, então as buscas não se bloqueiam nem esperam as atualizações.
+        """
+        version, index, chunks_by_id, filter_index, lexical_index = self._snapshot()
+        if search_options.get("filters") and search_options.get("filter_index") is None:
+            search_options["filter_index"] = self._derived_index("_filter_index", filter_index, version, chunks_by_id,
+                                                                 MetadataFilterIndex.build)
+        if search_options.get("search_mode", "dense") != "dense" and search_options.get("lexical_index") is None:
+            search_options["lexical_index"] = self._derived_index("_lexical_index", lexical_index, version,
+                                                                  chunks_by_id, _build_lexical_index)
+        return index, chunks_by_id
+
+    def search(self, query, top_k=3, **search_options):
+        """Busca os chunks mais relevantes, como `retrieve_relevant_chunks`, resolvendo ids estáveis."""
+        index, chunks_by_id = self._search_state(search_options)
+        return retrieve_relevant_chunks(query, index, chunks_by_id, self.embedding_model, top_k=top_k,
+                                        **search_options)
+
+    def search_batch(self, queries, top_k=3, **search_options):
+        """Versão em lote de `search` (ver `retrieve_relevant_chunks_batch`)."""
+        index, chunks_by_id = self._search_state(search_options)
+        return retrieve_relevant_chunks_batch(queries, index, chunks_by_id, self.embedding_model,
+                                              top_k=top_k, **search_options)
+
+    @property
+    def ntotal(self):
+        index = self.index
+        return 0 if index is None else index.ntotal
+
+    def documents(self):
+        """Lista os document_ids atualmente indexados."""
+        with self._lock:
+            return list(self.ids_by_document)
+
+
+def _build_lexical_index(chunks_by_id):
+    return BM25Index.build(list(chunks_by_id.values()))
@@ -0,0 +1,246 @@
+# index_store.py
+"""
+Persistência em disco do vector store (índice FAISS + chunks com metadados).
+
+Cada artefato fica em um diretório próprio, nomeado pela "impressão digital"
+(fingerprint) do corpus: hash do JSON de origem, dos parâmetros de chunking e do
+nome do modelo de embedding. Se qualquer um deles mudar, o fingerprint muda e o
+índice é reconstruído; caso contrário, o índice é apenas mapeado em memória
+(somente leitura), de modo que vários workers do Streamlit no mesmo host
+compartilham as mesmas páginas do arquivo em vez de cada um manter uma cópia.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from chunk_store import CHUNK_TEXT_FILE_NAME, ChunkStore, ChunkStoreWriter
+
+# Incrementar sempre que o formato dos arquivos abaixo mudar.
+INDEX_FORMAT_VERSION = 9
+
+DEFAULT_ARTIFACTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_artifacts")
+
+INDEX_FILE_NAME = "index.faiss"
+# Os chunks ficam no formato colunar do ChunkStore (texto em chunks_text.bin, mapeado em memória)
+MANIFEST_FILE_NAME = "manifest.json"
+
+
+def _iter_source_files(source_path):
+    """Arquivos que compõem o corpus: o próprio arquivo ou, para diretórios, todos os arquivos em ordem."""
+    if not os.path.isdir(source_path):
+        yield source_path
+        return
+    for root, dirs, files in os.walk(source_path):
+        dirs.sort()
+        for file_name in sorted(files):
+            yield os.path.join(root, file_name)
+
+
+def compute_corpus_fingerprint(source_path, model_name, chunk_size, overlap, extra_params=None):
+    """
+    Calcula o fingerprint do corpus a partir do conteúdo do arquivo (ou diretório) de origem,
+    dos parâmetros de chunking e do nome do modelo de embedding.
+    """
+    hasher = hashlib.sha256()
+    for file_path in _iter_source_files(source_path):
+        hasher.update(os.path.relpath(file_path, source_path).encode('utf-8'))
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(block)
+    params = {
+        "format_version": INDEX_FORMAT_VERSION,
+        "model_name": model_name,
+        "chunk_size": chunk_size,
+        "overlap": overlap,
+        "extra": extra_params or {},
+    }
+    hasher.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    return hasher.hexdigest()[:32]
+
+
+def _artifact_dir(fingerprint, artifacts_dir):
+    return os.path.join(artifacts_dir or DEFAULT_ARTIFACTS_DIR, fingerprint)
+
+
+def artifact_file_path(fingerprint, file_name, artifacts_dir=None):
+    """Caminho de um arquivo auxiliar (ex.: índice lexical) dentro do artefato do fingerprint."""
+    return os.path.join(_artifact_dir(fingerprint, artifacts_dir), file_name)
+
+
+def _read_flags(mmap):
+    import faiss
+    if not mmap:
+        return 0
+    # IO_FLAG_MMAP_IFC mapeia os vetores de índices "flat" sem copiá-los para a heap;
+    # versões mais antigas do FAISS só oferecem IO_FLAG_MMAP.
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    return flags | getattr(faiss, "IO_FLAG_READ_ONLY", 0)
+
+
+class VectorStoreWriter:
+    """
+    Grava um artefato de vector store de forma incremental: os chunks são
+    anexados ao arquivo à medida que chegam (sem manter o corpus em memória)
+    e o índice é gravado no `commit`. A escrita é feita em um diretório
+    temporário, renomeado ao final, para que outro processo nunca veja um
+    artefato pela metade. Como o diretório é endereçado pelo fingerprint, um
+    artefato válido já publicado nunca é apagado: o novo é descartado.
+    """
+
+    def __init__(self, fingerprint, artifacts_dir=None):
+        self.fingerprint = fingerprint
+        self.base_dir = artifacts_dir or DEFAULT_ARTIFACTS_DIR
+        os.makedirs(self.base_dir, exist_ok=True)
+        self.target_dir = _artifact_dir(fingerprint, self.base_dir)
+        self.tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=self.base_dir)
+        self._chunks_file = open(os.path.join(self.tmp_dir, CHUNK_TEXT_FILE_NAME), 'wb')
+        self._chunk_writer = ChunkStoreWriter(self._chunks_file)
+
+    @property
+    def num_chunks(self):
+        return len(self._chunk_writer)
+
+    def write_chunks(self, chunks_with_metadata):
+        self._chunk_writer.add_chunks(chunks_with_metadata)
+
+    def add_near_duplicates(self, near_duplicates):
+        """Fontes colapsadas em chunks já gravados (ver `NearDuplicateFilter.chunk_duplicates`)."""
+        self._chunk_writer.add_near_duplicates(near_duplicates)
+
+    def commit(self, index, manifest_extra=None, replace=False):
+        """
+        Grava o índice e o manifesto e publica o artefato. Retorna o diretório final.
+        Com `replace=True` (ex.: `IndexManager.save`, cujo conteúdo muda sem mudar o
+        fingerprint), substitui um artefato válido em vez de manter o existente.
+        """
+        try:
+            self._chunks_file.close()
+            self._chunk_writer.write_tables(self.tmp_dir)
+            import faiss
+            faiss.write_index(index, os.path.join(self.tmp_dir, INDEX_FILE_NAME))
+            manifest = {
+                "format_version": INDEX_FORMAT_VERSION,
+                "fingerprint": self.fingerprint,
+                "index_type": type(index).__name__,
+                "ntotal": int(index.ntotal),
+                "dimension": int(index.d),
+                "num_chunks": self.num_chunks,
+                "num_documents": len(self._chunk_writer.documents),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            manifest.update(manifest_extra or {})
+            with open(os.path.join(self.tmp_dir, MANIFEST_FILE_NAME), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+            published = self._publish(replace)
+        except Exception:
+            self.abort()
+            raise
+        if published:
+            print(f"Vector store salvo em '{self.target_dir}'.")
+        else:
+            print(f"Vector store já existente em '{self.target_dir}' mantido (o novo foi descartado).")
+        return self.target_dir
+
+    def _publish(self, replace):
+        """Move o diretório temporário para o destino. Retorna False se o artefato existente foi mantido."""
+        if not replace and vector_store_exists(self.fingerprint, artifacts_dir=self.base_dir):
+            # Mesmo fingerprint, mesmo conteúdo: outro processo pode estar com ele mapeado em memória
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            return False
+        previous_dir = None
+        if os.path.isdir(self.target_dir):
+            # Artefato inválido (ou `replace`): sai do caminho por rename; quem já o mapeou continua
+            # lendo os arquivos, que só são apagados depois da publicação do novo
+            previous_dir = tempfile.mkdtemp(prefix=".old-", dir=self.base_dir)
+            os.rmdir(previous_dir)
+            try:
+                os.rename(self.target_dir, previous_dir)
+            except FileNotFoundError:
+                previous_dir = None
+        try:
+            os.rename(self.tmp_dir, self.target_dir)
+        except OSError:
+            # Outro worker publicou o mesmo fingerprint entre a verificação e o rename: fica o dele
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            return False
+        finally:
+            if previous_dir is not None:
+                shutil.rmtree(previous_dir, ignore_errors=True)
+        return True
+
+    def abort(self):
+        """Descarta o artefato parcial."""
+        if not self._chunks_file.closed:
+            self._chunks_file.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def save_vector_store(index, chunks_with_metadata, fingerprint, artifacts_dir=None, manifest_extra=None,
+                      replace=False):
+    """Grava o índice FAISS e os chunks em um diretório versionado pelo fingerprint (ver `VectorStoreWriter.commit`)."""
+    writer = VectorStoreWriter(fingerprint, artifacts_dir=artifacts_dir)
+    try:
+        writer.write_chunks(chunks_with_metadata)
+    except Exception:
+        writer.abort()
+        raise
+    return writer.commit(index, manifest_extra=manifest_extra, replace=replace)
+
+
+def iter_stored_chunks(target_dir):
+    """Lê os chunks de um artefato, um por vez."""
+    yield from ChunkStore.load(target_dir)
+
+
+def vector_store_exists(fingerprint, artifacts_dir=None):
+    """Indica se já existe um artefato compatível para o fingerprint (sem carregá-lo)."""
+    manifest_path = os.path.join(_artifact_dir(fingerprint, artifacts_dir), MANIFEST_FILE_NAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return manifest.get("format_version") == INDEX_FORMAT_VERSION and manifest.get("fingerprint") == fingerprint
+
+
+def load_vector_store(fingerprint, artifacts_dir=None, mmap=True):
+    """
+    Carrega o índice e os chunks (ChunkStore) gravados para o fingerprint informado.
+    Com `mmap=True`, o índice e o texto dos chunks são mapeados em memória.
+    Retorna (None, []) se o artefato não existir ou estiver em formato incompatível.
+    """
+    target_dir = _artifact_dir(fingerprint, artifacts_dir)
+    manifest_path = os.path.join(target_dir, MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_path):
+        return None, []
+
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != INDEX_FORMAT_VERSION or manifest.get("fingerprint") != fingerprint:
+            print(f"ALERTA: Artefato em '{target_dir}' incompatível com a versão atual. Será reconstruído.")
+            return None, []
+
+        import faiss
+        index_path = os.path.join(target_dir, INDEX_FILE_NAME)
+        try:
+            index = faiss.read_index(index_path, _read_flags(mmap))
+        except RuntimeError:
+            # Alguns tipos de índice não suportam mmap; carrega normalmente.
+            index = faiss.read_index(index_path)
+
+        chunks_with_metadata = ChunkStore.load(target_dir, use_mmap=mmap)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"ALERTA: Falha ao carregar o vector store de '{target_dir}': {e}")
+        return None, []
+
+    if index.ntotal != len(chunks_with_metadata):
+        print(f"ALERTA: Artefato em '{target_dir}' inconsistente ({index.ntotal} vetores, {len(chunks_with_metadata)} chunks).")
+        return None, []
+
+    print(f"Vector store carregado de '{target_dir}' com {index.ntotal} vetores.")
+    return index, chunks_with_metadata
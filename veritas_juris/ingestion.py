@@ -0,0 +1,290 @@
+# ingestion.py
+"""
+Ingestão em fluxo (streaming) de grandes acervos de jurisprudência.
+
+`load_processes_from_original_json` faz `json.load` do arquivo inteiro e guarda
+todos os textos em uma lista antes do chunking. Aqui os documentos são lidos um
+a um (array JSON no topo, JSON Lines ou um diretório com um arquivo por decisão),
+segmentados e codificados em lotes de tamanho fixo, e os chunks são gravados em
+disco à medida que ficam prontos. O uso de memória fica limitado ao lote atual
+mais o próprio índice FAISS (que pode ser comprimido com `quantization`/"ivf_pq").
+"""
+import json
+import os
+
+import numpy as np
+
+from dedup import DEFAULT_DEDUP_THRESHOLD, NearDuplicateFilter, dedup_params
+from index_factory import default_train_size, describe_index
+from index_store import VectorStoreWriter, compute_corpus_fingerprint, vector_store_exists
+from parallel_preprocessing import iter_preprocessed_documents
+from rag_pipeline import (
+    DEFAULT_CHUNK_OVERLAP,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_CHUNKING_STRATEGY,
+    chunk_document,
+    chunking_params,
+    embed_texts,
+    embedding_model_id,
+    open_embedding_cache,
+    prepare_document_for_rag,
+)
+
+JSON_LINES_EXTENSIONS = (".jsonl", ".ndjson")
+JSON_EXTENSIONS = (".json",) + JSON_LINES_EXTENSIONS
+
+_READ_SIZE = 1024 * 1024
+_WHITESPACE = " \t\r\n"
+
+# Estimativa usada para dimensionar índices IVF quando o total de vetores não é informado
+AUTO_EXPECTED_VECTORS = 100_000
+
+
+def iter_json_values(file_obj, read_size=_READ_SIZE):
+    """
+    Lê valores JSON de um arquivo texto sem carregá-lo inteiro: aceita um array no
+    topo (`[{...}, {...}]`), JSON Lines ou valores simplesmente concatenados.
+    Apenas o valor sendo decodificado (e o bloco lido) fica em memória.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+    top_level_array = None
+
+    def fill(min_size):
+        nonlocal buffer, position, eof
+        # Descarta o que já foi consumido antes de ler mais
+        buffer = buffer[position:]
+        position = 0
+        while not eof and len(buffer) < min_size:
+            block = file_obj.read(read_size)
+            if not block:
+                eof = True
+            buffer += block
+
+    next_read = read_size
+    while True:
+        # Pula espaços e separadores entre valores
+        while True:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position < len(buffer):
+                break
+            if eof:
+                return
+            fill(1)
+
+        char = buffer[position]
+        if top_level_array is None:
+            top_level_array = char == "["
+            if top_level_array:
+                position += 1
+                continue
+        if top_level_array and char == ",":
+            position += 1
+            continue
+        if top_level_array and char == "]":
+            return
+
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # Valor incompleto no buffer: lê mais (dobrando o bloco para evitar custo quadrático)
+            fill(len(buffer) - position + next_read)
+            next_read *= 2
+            continue
+        next_read = read_size
+        position = end
+        yield value
+
+
+def _iter_source_files(source_path):
+    if not os.path.isdir(source_path):
+        yield source_path
+        return
+    for root, dirs, files in os.walk(source_path):
+        dirs.sort()
+        for file_name in sorted(files):
+            if file_name.lower().endswith(JSON_EXTENSIONS):
+                yield os.path.join(root, file_name)
+
+
+def iter_raw_documents(source_path):
+    """
+    Gera os documentos originais ({"fileName", "content"}) de um arquivo JSON (array no
+    topo ou um único objeto), de um arquivo JSON Lines ou de um diretório com vários
+    desses arquivos (ex.: um arquivo por decisão).
+    """
+    for file_path in _iter_source_files(source_path):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for value in iter_json_values(f):
+                # Um arquivo por decisão pode conter também uma lista de decisões
+                if isinstance(value, list):
+                    yield from value
+                else:
+                    yield value
+
+
+def iter_documents_for_rag(source_path):
+    """Gera, um a um, os documentos prontos para o RAG (ver `prepare_document_for_rag`)."""
+    position = 0
+    for doc_original in iter_raw_documents(source_path):
+        document = prepare_document_for_rag(doc_original, position=position)
+        position += 1
+        if document is not None:
+            yield document
+
+
+def _batch_chunks(chunk_lists, batch_size):
+    batch = []
+    for chunks in chunk_lists:
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def iter_chunk_batches(documents, batch_size=256, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP,
+                       chunking_strategy=DEFAULT_CHUNKING_STRATEGY):
+    """Agrupa os chunks dos documentos em lotes de (até) `batch_size` chunks, preservando a ordem."""
+    chunk_lists = (chunk_document(doc_info, chunk_size=chunk_size, overlap=overlap, strategy=chunking_strategy)
+                   for doc_info in documents)
+    return _batch_chunks(chunk_lists, batch_size)
+
+
+def iter_document_chunks(source_path, num_workers=None, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP,
+                         chunking_strategy=DEFAULT_CHUNKING_STRATEGY):
+    """
+    Gera a lista de chunks de cada documento de `source_path`, em ordem. Com
+    `num_workers` != 1, extração e chunking rodam no pool de processos de
+    `parallel_preprocessing` (padrão: todos os núcleos).
+    """
+    if num_workers == 1:
+        for doc_info in iter_documents_for_rag(source_path):
+            yield chunk_document(doc_info, chunk_size=chunk_size, overlap=overlap, strategy=chunking_strategy)
+        return
+    for _, chunks in iter_preprocessed_documents(iter_raw_documents(source_path), num_workers=num_workers,
+                                                 chunk_size=chunk_size, overlap=overlap,
+                                                 chunking_strategy=chunking_strategy):
+        yield chunks
+
+
+def _new_streaming_index(dimension, index_type, quantization, index_options, num_vectors, train_points=None):
+    import faiss
+    if index_type == "flat" and quantization is None:
+        return faiss.IndexFlatL2(dimension)
+    options = dict(index_options or {})
+    options.pop("train_sample_size", None)
+    description = describe_index(dimension, num_vectors, index_type, quantization, train_points=train_points,
+                                 **options)
+    return faiss.index_factory(dimension, description)
+
+
+def build_vector_store_streaming(source_path, embedding_model, model_name=None,
+                                 batch_size=256, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP,
+                                 artifacts_dir=None, index_type="flat", quantization=None, index_options=None,
+                                 expected_num_vectors=None, use_embedding_cache=True, num_workers=None,
+                                 dedup_threshold=DEFAULT_DEDUP_THRESHOLD, chunking_strategy=DEFAULT_CHUNKING_STRATEGY):
+    """
+    Constrói o vector store de `source_path` em fluxo e o grava em disco (mesmo formato de
+    `index_store`). Retorna o fingerprint do artefato, que pode ser aberto com
+    `load_vector_store(fingerprint, mmap=True)`. Se o artefato já existir, nada é refeito.
+
+    Índices que exigem treino (IVF/PQ) são treinados com os primeiros
+    `index_options["train_sample_size"]` vetores (padrão: `index_factory.default_train_size`
+    do índice dimensionado para `expected_num_vectors`); só esses vetores ficam em memória até
+    o treino. O índice só é criado quando a amostra fica completa (ou o fluxo termina), com o
+    nlist e o index_type="auto" calculados sobre os vetores efetivamente acumulados.
+    `num_workers` controla o paralelismo da extração/chunking (ver `iter_document_chunks`);
+    `chunking_strategy` escolhe o chunking (ver `chunk_document`) e entra no fingerprint.
+    Quase-duplicatas (similaridade >= `dedup_threshold`; None desativa) são descartadas antes
+    do embedding e registradas nos representantes (ver `dedup`).
+    """
+    model_name = model_name or embedding_model_id(embedding_model)
+    index_params = {"index_type": index_type, "quantization": quantization, "index_options": index_options or {},
+                    **chunking_params(chunking_strategy), **dedup_params(dedup_threshold)}
+    fingerprint = compute_corpus_fingerprint(source_path, model_name, chunk_size, overlap, extra_params=index_params)
+    if vector_store_exists(fingerprint, artifacts_dir=artifacts_dir):
+        print(f"Vector store para '{source_path}' já existe (fingerprint {fingerprint}).")
+        return fingerprint
+
+    expected_num_vectors = expected_num_vectors or AUTO_EXPECTED_VECTORS
+    embedding_cache = open_embedding_cache(model_name, artifacts_dir=artifacts_dir) if use_embedding_cache else None
+    writer = VectorStoreWriter(fingerprint, artifacts_dir=artifacts_dir)
+    index = None
+    pending_vectors = []   # vetores aguardando o treino do índice
+    num_pending = 0
+    train_size = (index_options or {}).get("train_sample_size")
+    num_documents = 0
+    near_duplicate_filter = NearDuplicateFilter(dedup_threshold) if dedup_threshold is not None else None
+
+    def count_documents(chunk_lists):
+        nonlocal num_documents
+        for chunks in chunk_lists:
+            num_documents += 1
+            yield chunks if near_duplicate_filter is None else near_duplicate_filter.filter_document(chunks)
+
+    print(f"Ingestão em fluxo de '{source_path}' (lotes de {batch_size} chunks)...")
+    try:
+        chunk_lists = iter_document_chunks(source_path, num_workers=num_workers, chunk_size=chunk_size, overlap=overlap,
+                                           chunking_strategy=chunking_strategy)
+        for batch in _batch_chunks(count_documents(chunk_lists), batch_size):
+            vectors = embed_texts([chunk["text_chunk"] for chunk in batch], embedding_model,
+                                  embedding_cache=embedding_cache, show_progress_bar=False)
+            writer.write_chunks(batch)
+
+            if index is None:
+                pending_vectors.append(vectors)
+                num_pending += len(vectors)
+                if train_size is None:
+                    train_size = default_train_size(_new_streaming_index(
+                        vectors.shape[1], index_type, quantization, index_options, expected_num_vectors))
+                if num_pending < train_size:
+                    continue
+                index = _new_streaming_index(vectors.shape[1], index_type, quantization, index_options,
+                                             max(expected_num_vectors, num_pending), train_points=num_pending)
+                _train_and_flush(index, pending_vectors)
+                pending_vectors = []
+                continue
+            index.add(vectors)
+            print(f"  {writer.num_chunks} chunks indexados ({num_documents} documentos)...")
+
+        if index is None and not pending_vectors:
+            print("Nenhum chunk de texto foi gerado. O Vector Store não pode ser criado.")
+            writer.abort()
+            return None
+        if index is None:
+            # Corpus menor que a amostra de treino: o total já é conhecido, dimensiona por ele
+            index = _new_streaming_index(pending_vectors[0].shape[1], index_type, quantization, index_options,
+                                         num_pending, train_points=num_pending)
+            _train_and_flush(index, pending_vectors)
+
+        manifest_extra = {"model_name": model_name, "source_path": os.path.abspath(source_path),
+                          "num_documents": num_documents}
+        if near_duplicate_filter is not None:
+            writer.add_near_duplicates(near_duplicate_filter.chunk_duplicates)
+            manifest_extra["dedup"] = near_duplicate_filter.print_report()
+        writer.commit(index, manifest_extra=manifest_extra)
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        if embedding_cache is not None:
+            embedding_cache.close()
+
+    print(f"Ingestão concluída: {num_documents} documentos, {index.ntotal} vetores.")
+    return fingerprint
+
+
+def _train_and_flush(index, pending_vectors):
+    sample = np.vstack(pending_vectors)
+    if not index.is_trained:
+        print(f"Treinando índice com {sample.shape[0]} vetores...")
+        index.train(sample)
+    index.add(sample)
@@ -0,0 +1,295 @@
+# metadata_filters.py
+"""
+Filtros estruturados (tribunal, relator, classe, UF, data) para a busca.
+
+Os campos são extraídos dos metadados que o loader já coleta: o `fileName`
+(ex.: `AAINTARESP-1656080-2020-10-26.pdf` -> classe, número e data), o
+`case_info` (UF) e o `relator`/`tribunal` da primeira página. Para cada campo
+categórico há uma lista de postings (valor -> ids dos chunks, ordenados) e,
+para a data, um array ordenado consultado por busca binária. O conjunto de ids
+resultante vira um `IDSelector` passado ao FAISS, de modo que o filtro é
+aplicado dentro da busca (e não descartando linhas do top-k global, o que
+devolveria poucos ou nenhum resultado com filtros seletivos).
+
+Um chunk que representa quase-duplicatas (ver `dedup`) entra também nas postings
+dos metadados das fontes colapsadas nele, então filtrar pela cópia descartada
+encontra o trecho que a representa (cada campo é avaliado sobre o conjunto das
+fontes do chunk).
+"""
+import calendar
+import datetime
+import re
+import unicodedata
+
+import numpy as np
+
+from chunk_store import ChunkStore
+
+CATEGORICAL_FIELDS = ("tribunal", "relator", "classe", "uf")
+DATE_FILTER_FIELDS = ("date_from", "date_to")
+
+_FILE_NAME_PATTERN = re.compile(r"^(?P<classe>[A-Za-z]+)-(?P<numero>\d+)-(?P<date>\d{4}-\d{2}-\d{2})")
+_UF_PATTERN = re.compile(r"\s-\s(?P<uf>[A-Z]{2})\s*\(")
+_RELATOR_TITLE_PATTERN = re.compile(r"^(MINISTRO|MINISTRA|DESEMBARGADOR|DESEMBARGADORA|JUIZ|JUIZA)\s+")
+
+TRIBUNAL_ACRONYMS = {
+    "SUPERIOR TRIBUNAL DE JUSTICA": "STJ",
+    "SUPREMO TRIBUNAL FEDERAL": "STF",
+    "TRIBUNAL SUPERIOR DO TRABALHO": "TST",
+    "TRIBUNAL SUPERIOR ELEITORAL": "TSE",
+    "SUPERIOR TRIBUNAL MILITAR": "STM",
+}
+
+
+def _normalize(value):
+    """Maiúsculas, sem acentos e com espaços colapsados."""
+    value = unicodedata.normalize("NFKD", str(value)).encode("ascii", "ignore").decode("ascii")
+    return " ".join(value.upper().split())
+
+
+def normalize_field_value(field, value):
+    """Normaliza um valor de filtro para comparação com o índice (ex.: "Ministro Og Fernandes" -> "OG FERNANDES")."""
+    if value is None:
+        return None
+    value = _normalize(value)
+    if field == "relator":
+        value = _RELATOR_TITLE_PATTERN.sub("", value)
+    elif field == "tribunal":
+        value = TRIBUNAL_ACRONYMS.get(value, value)
+    return value or None
+
+
+def parse_date(value, bound="lower"):
+    """
+    Converte "2020", "2020-10", "2020-10-26" ou datetime.date para inteiro AAAAMMDD.
+    Datas parciais viram o primeiro dia do período ou, com `bound="upper"` (limite final de
+    um intervalo), o último: "2021" -> 20211231, "2021-02" -> 20210228.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.year * 10000 + value.month * 100 + value.day
+    try:
+        parts = [int(part) for part in str(value).split("-")]
+        if not 1 <= len(parts) <= 3:
+            raise ValueError
+        if bound == "upper":
+            year, month = (parts + [12])[:2]
+            day = parts[2] if len(parts) == 3 else calendar.monthrange(year, month)[1]
+        else:
+            year, month, day = (parts + [1, 1])[:3]
+        datetime.date(year, month, day)
+    except (ValueError, calendar.IllegalMonthError):
+        raise ValueError(f"Data inválida: {value!r}. Use AAAA, AAAA-MM ou AAAA-MM-DD.")
+    return year * 10000 + month * 100 + day
+
+
+def validate_filters(filters):
+    """
+    Confere os filtros recebidos de fora (ex.: pelo serviço HTTP): campos conhecidos, valores
+    categóricos texto (ou lista de textos) e datas válidas. Levanta ValueError com a mensagem
+    para o usuário, em vez de o filtro inválido ser ignorado ou falhar no meio da busca.
+    """
+    unknown = sorted(set(filters) - set(CATEGORICAL_FIELDS) - set(DATE_FILTER_FIELDS))
+    if unknown:
+        raise ValueError(f"Filtro desconhecido: {', '.join(unknown)}. "
+                         f"Opções: {', '.join(CATEGORICAL_FIELDS + DATE_FILTER_FIELDS)}.")
+    for field in CATEGORICAL_FIELDS:
+        wanted = filters.get(field)
+        values = wanted if isinstance(wanted, (list, tuple)) else [wanted]
+        if wanted is not None and not all(isinstance(value, str) for value in values):
+            raise ValueError(f"O filtro '{field}' deve ser um texto ou uma lista de textos.")
+    for field in DATE_FILTER_FIELDS:
+        try:
+            parse_date(filters.get(field), bound="upper" if field == "date_to" else "lower")
+        except ValueError as e:
+            raise ValueError(f"Filtro '{field}': {e}")
+    return filters
+
+
+def extract_filter_fields(document_metadata):
+    """Extrai os campos filtráveis dos metadados de um documento (`full_metadata_origem`)."""
+    file_name = document_metadata.get("fileName") or ""
+    fields = {field: None for field in CATEGORICAL_FIELDS}
+    fields["date"] = None
+    match = _FILE_NAME_PATTERN.match(file_name)
+    if match:
+        fields["classe"] = match.group("classe").upper()
+        fields["date"] = parse_date(match.group("date"))
+    case_info = document_metadata.get("case_info") or ""
+    uf_match = _UF_PATTERN.search(case_info)
+    if uf_match:
+        fields["uf"] = uf_match.group("uf")
+    fields["relator"] = normalize_field_value("relator", document_metadata.get("relator"))
+    fields["tribunal"] = normalize_field_value("tribunal", document_metadata.get("tribunal"))
+    return fields
+
+
+def collapsed_sources(chunk):
+    """Fontes colapsadas no chunk pela deduplicação: chunks avulsos e documentos inteiros."""
+    return list(chunk.get("near_duplicates", ())) + list(chunk.get("metadata_chunk", {}).get("near_duplicate_documents", ()))
+
+
+class MetadataFilterIndex:
+    """Listas de postings por campo/valor e datas ordenadas, sobre os ids dos chunks."""
+
+    def __init__(self, postings, date_ids, date_values, all_ids):
+        self.postings = postings          # campo -> {valor normalizado -> ids ordenados}
+        self.date_ids = date_ids          # ids com data, ordenados pela data
+        self.date_values = date_values    # datas (AAAAMMDD) correspondentes, em ordem crescente
+        self.all_ids = all_ids
+
+    @classmethod
+    def build(cls, chunks_with_metadata):
+        """Constrói o índice; ids = `chunk_id` do chunk ou sua posição na lista."""
+        if isinstance(chunks_with_metadata, ChunkStore):
+            return cls._build_from_store(chunks_with_metadata)
+        if isinstance(chunks_with_metadata, dict):
+            items = chunks_with_metadata.items()
+        else:
+            items = ((chunk.get("chunk_id", position), chunk) for position, chunk in enumerate(chunks_with_metadata))
+
+        lists = {field: {} for field in CATEGORICAL_FIELDS}
+        dated = []
+        all_ids = []
+        fields_by_document = {}
+
+        def fields_for(document_metadata):
+            # Os metadados são os mesmos para todos os chunks de um documento
+            cache_key = tuple(document_metadata.get(key) for key in ("fileName", "case_info", "relator", "tribunal"))
+            fields = fields_by_document.get(cache_key)
+            if fields is None:
+                fields = fields_by_document[cache_key] = extract_filter_fields(document_metadata)
+            return fields
+
+        for chunk_id, chunk in items:
+            metadata = chunk.get("metadata_chunk", {})
+            # O chunk responde pelo seu documento e pelas fontes colapsadas nele (ver `dedup`)
+            sources = [metadata] + collapsed_sources(chunk)
+            for source in sources:
+                fields = fields_for(source.get("outros_metadados_doc") or {})
+                for field in CATEGORICAL_FIELDS:
+                    if fields[field]:
+                        lists[field].setdefault(fields[field], []).append(chunk_id)
+                if fields["date"]:
+                    dated.append((fields["date"], chunk_id))
+            all_ids.append(chunk_id)
+
+        postings = {
+            field: {value: np.unique(np.asarray(ids, dtype=np.int64)) for value, ids in values.items()}
+            for field, values in lists.items()
+        }
+        dated = sorted(set(dated))
+        date_values = np.asarray([date for date, _ in dated], dtype=np.int64)
+        date_ids = np.asarray([chunk_id for _, chunk_id in dated], dtype=np.int64)
+        return cls(postings, date_ids, date_values, np.unique(np.asarray(all_ids, dtype=np.int64)))
+
+    @classmethod
+    def _build_from_store(cls, store):
+        """Versão colunar: extrai os campos uma vez por documento, sem materializar os chunks."""
+        ids = np.asarray(store.ids(), dtype=np.int64)
+        fields_by_document = [extract_filter_fields(document.get("outros_metadados_doc", {}))
+                              for document in store.documents]
+        document_ids = np.asarray(store.document_ids, dtype=np.int64)
+
+        postings = {}
+        for field in CATEGORICAL_FIELDS:
+            values = sorted({fields[field] for fields in fields_by_document if fields[field]})
+            codes = {value: code for code, value in enumerate(values)}
+            document_codes = np.asarray([codes.get(fields[field], -1) for fields in fields_by_document] or [-1],
+                                        dtype=np.int64)
+            chunk_codes = document_codes[document_ids] if len(document_ids) else np.empty(0, dtype=np.int64)
+            # Agrupa os ids por código com uma única ordenação
+            order = np.argsort(chunk_codes, kind="stable")
+            counts = np.bincount(chunk_codes[chunk_codes >= 0], minlength=len(values))
+            start = int((chunk_codes < 0).sum())
+            postings[field] = {}
+            for value, count in zip(values, counts.tolist()):
+                postings[field][value] = np.sort(ids[order[start:start + count]])
+                start += count
+
+        document_dates = np.asarray([fields["date"] or 0 for fields in fields_by_document] or [0], dtype=np.int64)
+        chunk_dates = document_dates[document_ids] if len(document_ids) else np.empty(0, dtype=np.int64)
+        dated = np.flatnonzero(chunk_dates > 0)
+        date_ids = ids[dated]
+        date_values = chunk_dates[dated]
+
+        # Fontes colapsadas pela deduplicação: documentos inteiros (todos os chunks do representante)
+        # e chunks avulsos. São poucas; os ids entram nas postings dos valores de cada fonte.
+        collapsed = []
+        if any(document.get("near_duplicate_documents") for document in store.documents):
+            by_document = np.argsort(document_ids, kind="stable")
+            bounds = np.searchsorted(document_ids[by_document], np.arange(len(store.documents) + 1))
+            for position, document in enumerate(store.documents):
+                document_chunk_ids = ids[by_document[bounds[position]:bounds[position + 1]]]
+                collapsed += [(source, document_chunk_ids) for source in document.get("near_duplicate_documents", ())]
+        for position, sources in store.near_duplicates.items():
+            collapsed += [(source, ids[position:position + 1]) for source in sources]
+        extra_dates = []
+        for source, source_ids in collapsed:
+            fields = extract_filter_fields(source.get("outros_metadados_doc") or {})
+            for field in CATEGORICAL_FIELDS:
+                if fields[field]:
+                    existing = postings[field].get(fields[field], np.empty(0, dtype=np.int64))
+                    postings[field][fields[field]] = np.union1d(existing, source_ids)
+            if fields["date"]:
+                extra_dates += [(fields["date"], chunk_id) for chunk_id in source_ids.tolist()]
+        if extra_dates:
+            date_values = np.concatenate([date_values, np.asarray([date for date, _ in extra_dates], dtype=np.int64)])
+            date_ids = np.concatenate([date_ids, np.asarray([chunk_id for _, chunk_id in extra_dates], dtype=np.int64)])
+        order = np.lexsort((date_ids, date_values))
+        return cls(postings, date_ids[order], date_values[order], np.unique(ids))
+
+    def values(self, field):
+        """Valores distintos de um campo categórico (para montar os filtros na interface)."""
+        return sorted(self.postings.get(field, {}))
+
+    def date_range(self):
+        """(menor, maior) data indexada, como AAAAMMDD, ou (None, None)."""
+        if not len(self.date_values):
+            return None, None
+        return int(self.date_values[0]), int(self.date_values[-1])
+
+    def select_ids(self, filters):
+        """
+        Retorna os ids (ordenados) que satisfazem todos os filtros. Campos categóricos
+        aceitam um valor ou uma lista de valores (OU entre eles); `date_from`/`date_to`
+        delimitam a data (inclusive). Retorna None se nenhum filtro foi informado.
+        """
+        selections = []
+        for field in CATEGORICAL_FIELDS:
+            wanted = filters.get(field)
+            if wanted in (None, "", [], ()):
+                continue
+            if isinstance(wanted, str):
+                wanted = [wanted]
+            field_postings = self.postings.get(field, {})
+            arrays = [field_postings.get(normalize_field_value(field, value)) for value in wanted]
+            arrays = [array for array in arrays if array is not None]
+            selections.append(np.unique(np.concatenate(arrays)) if arrays else np.empty(0, dtype=np.int64))
+
+        date_from = parse_date(filters.get("date_from"))
+        date_to = parse_date(filters.get("date_to"), bound="upper")
+        if date_from is not None or date_to is not None:
+            start = 0 if date_from is None else np.searchsorted(self.date_values, date_from, side="left")
+            end = len(self.date_values) if date_to is None else np.searchsorted(self.date_values, date_to, side="right")
+            # Um chunk com fontes colapsadas pode ter mais de uma data
+            selections.append(np.unique(self.date_ids[start:end]))
+
+        if not selections:
+            return None
+        # Interseção começando pela lista mais seletiva
+        selections.sort(key=len)
+        selected = selections[0]
+        for other in selections[1:]:
+            if not len(selected):
+                break
+            selected = np.intersect1d(selected, other, assume_unique=True)
+        return selected
+
+
+def make_id_selector(ids):
+    """Cria o IDSelector do FAISS para os ids selecionados."""
+    import faiss
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    return faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
@@ -0,0 +1,327 @@
+# metrics.py
+"""
+Instrumentação leve do pipeline: contadores, histogramas e cronômetros por etapa.
+
+Cada etapa do pipeline (extração, chunking, embedding, busca no índice, montagem
+do contexto, chamada ao LLM) é medida com `timer(etapa)`, que registra:
+- `<etapa>_seconds`: histograma da latência de cada execução;
+- `<etapa>_total` e `<etapa>_errors_total`: contadores de execuções e falhas;
+- com `items`, `<etapa>_items_total` e o histograma `<etapa>_items_per_second`.
+Tamanhos (ex.: tokens do prompt e da resposta) entram com `observe`.
+
+O `MetricsRegistry` guarda os totais e uma janela das observações mais recentes
+de cada histograma, da qual saem os percentis (p50/p90/p99) exibidos no app.
+Cada medição também é repassada aos sinks configurados:
+- `JsonLogSink`: um evento JSON por linha (log estruturado);
+- `PrometheusFileSink`: regrava periodicamente um arquivo no formato texto do
+  Prometheus (ex.: para o textfile collector do node_exporter).
+Os sinks são configurados pelas variáveis METRICS_JSON_LOG e METRICS_PROMETHEUS_FILE
+(`configure_metrics_from_env`); METRICS_ENABLED=0 desativa a coleta.
+
+As métricas são do processo: etapas executadas nos processos filhos do
+`parallel_preprocessing` não aparecem no registro do processo principal.
+"""
+import functools
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+DEFAULT_WINDOW_SIZE = 1024
+DEFAULT_PERCENTILES = (50, 90, 99)
+DEFAULT_PROMETHEUS_INTERVAL_SECONDS = 10.0
+PROMETHEUS_PREFIX = "veritas_"
+
+
+def _percentile(sorted_values, percentile):
+    """Percentil (método do vizinho mais próximo) de uma lista já ordenada."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(percentile / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class _Histogram:
+    def __init__(self, window_size):
+        self.window = deque(maxlen=window_size)   # observações mais recentes
+        self.count = 0
+        self.sum = 0.0
+        self.max = None
+
+    def add(self, value):
+        self.window.append(value)
+        self.count += 1
+        self.sum += value
+        self.max = value if self.max is None else max(self.max, value)
+
+    def summary(self, percentiles):
+        recent = sorted(self.window)
+        summary = {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "max": self.max,
+        }
+        for percentile in percentiles:
+            summary[f"p{percentile}"] = _percentile(recent, percentile)
+        return summary
+
+
+class _Timer:
+    """Cronômetro de uma etapa (ver `MetricsRegistry.timer`). `items` e `fields` podem ser ajustados no bloco."""
+
+    def __init__(self, registry, stage, items, fields):
+        self.registry = registry
+        self.stage = stage
+        self.items = items
+        self.fields = fields
+        self.start = None
+        self.elapsed = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.elapsed = time.perf_counter() - self.start
+        # GeneratorExit (stream interrompido pelo consumidor) não é falha da etapa
+        failed = exc_type is not None and issubclass(exc_type, Exception)
+        self.registry.record_stage(self.stage, self.elapsed, items=self.items, error=failed, **self.fields)
+        return False
+
+
+class MetricsRegistry:
+    """Registro em memória, thread-safe, de contadores e histogramas (ver docstring do módulo)."""
+
+    def __init__(self, window_size=DEFAULT_WINDOW_SIZE, enabled=True):
+        self.window_size = window_size
+        self.enabled = enabled
+        self.sinks = []
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink):
+        """Inclui um sink (objeto com `record(event, registry)`)."""
+        self.sinks.append(sink)
+        return sink
+
+    def flush(self):
+        """Força a gravação dos sinks periódicos (ex.: ao final de um job em lote)."""
+        for sink in self.sinks:
+            if hasattr(sink, "flush"):
+                sink.flush(self)
+
+    def _emit(self, event):
+        for sink in self.sinks:
+            try:
+                sink.record(event, self)
+            except Exception as e:
+                print(f"ALERTA: Falha ao gravar métricas em {type(sink).__name__}: {e}")
+
+    def _increment(self, name, value):
+        self._counters[name] = self._counters.get(name, 0) + value
+
+    def _observe(self, name, value):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = _Histogram(self.window_size)
+        histogram.add(value)
+
+    def increment(self, name, value=1, **fields):
+        """Soma `value` ao contador `name`."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._increment(name, value)
+        self._emit({"ts": time.time(), "type": "counter", "name": name, "value": value, **fields})
+
+    def observe(self, name, value, **fields):
+        """Registra uma observação no histograma `name` (ex.: tokens do prompt)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._observe(name, value)
+        self._emit({"ts": time.time(), "type": "histogram", "name": name, "value": value, **fields})
+
+    def record_stage(self, stage, seconds, items=None, error=False, **fields):
+        """Registra uma execução da etapa `stage` que levou `seconds` (e processou `items`)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._observe(f"{stage}_seconds", seconds)
+            self._increment(f"{stage}_total", 1)
+            if error:
+                self._increment(f"{stage}_errors_total", 1)
+            if items is not None:
+                self._increment(f"{stage}_items_total", items)
+                if seconds > 0 and items:
+                    self._observe(f"{stage}_items_per_second", items / seconds)
+        event = {"ts": time.time(), "type": "stage", "stage": stage, "seconds": seconds, "error": error, **fields}
+        if items is not None:
+            event["items"] = items
+        self._emit(event)
+
+    def timer(self, stage, items=None, **fields):
+        """
+        Context manager que mede a etapa: `with metrics.timer("embedding", items=len(texts)):`.
+        `fields` vão apenas para os eventos dos sinks (ex.: search_mode).
+        """
+        return _Timer(self, stage, items, fields)
+
+    def timed(self, stage):
+        """Decorador que mede cada chamada da função como uma execução de `stage`."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self, percentiles=DEFAULT_PERCENTILES):
+        """Contadores e resumo (count/sum/mean/max e percentis da janela recente) de cada histograma."""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "histograms": {name: histogram.summary(percentiles)
+                               for name, histogram in self._histograms.items()},
+            }
+
+    def stage_summary(self, percentiles=DEFAULT_PERCENTILES):
+        """Uma linha por etapa: execuções, falhas, percentis de latência e vazão (itens/s)."""
+        snapshot = self.snapshot(percentiles)
+        counters = snapshot["counters"]
+        histograms = snapshot["histograms"]
+        rows = []
+        for name in sorted(histograms):
+            stage = name[:-len("_seconds")]
+            # Só os histogramas de `timer`/`record_stage` (ex.: não llm_first_token_seconds)
+            if not name.endswith("_seconds") or f"{stage}_total" not in counters:
+                continue
+            latency = histograms[name]
+            row = {"etapa": stage, "execuções": counters[f"{stage}_total"],
+                   "falhas": counters.get(f"{stage}_errors_total", 0)}
+            for percentile in percentiles:
+                value = latency[f"p{percentile}"]
+                row[f"p{percentile} (ms)"] = None if value is None else round(value * 1000, 2)
+            throughput = histograms.get(f"{stage}_items_per_second")
+            row["itens/s (p50)"] = None if throughput is None else round(throughput["p50"], 1)
+            rows.append(row)
+        return rows
+
+    def to_prometheus(self, prefix=PROMETHEUS_PREFIX, percentiles=DEFAULT_PERCENTILES):
+        """Métricas no formato texto de exposição do Prometheus (histogramas como `summary`)."""
+        snapshot = self.snapshot(percentiles)
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = prefix + name
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        for name, summary in sorted(snapshot["histograms"].items()):
+            metric = prefix + name
+            lines.append(f"# TYPE {metric} summary")
+            for percentile in percentiles:
+                value = summary[f"p{percentile}"]
+                if value is not None:
+                    lines.append(f'{metric}{{quantile="{percentile / 100:g}"}} {value}')
+            lines.append(f"{metric}_sum {summary['sum']}")
+            lines.append(f"{metric}_count {summary['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Zera contadores e histogramas (os sinks são mantidos)."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+class JsonLogSink:
+    """Grava cada evento como uma linha JSON em `path` (modo append)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def record(self, event, registry):
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class PrometheusFileSink:
+    """
+    Regrava `path` com `registry.to_prometheus()` no máximo a cada `interval_seconds`
+    (a escrita é atômica: arquivo temporário + rename). `flush` força a gravação.
+    """
+
+    def __init__(self, path, interval_seconds=DEFAULT_PROMETHEUS_INTERVAL_SECONDS):
+        self.path = path
+        self.interval_seconds = interval_seconds
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, event, registry):
+        if time.monotonic() - self._last_write >= self.interval_seconds:
+            self.flush(registry)
+
+    def flush(self, registry):
+        with self._lock:
+            self._last_write = time.monotonic()
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(prefix=".metrics-", dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(registry.to_prometheus())
+                os.replace(tmp_path, self.path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+
+# Registro padrão do processo, usado pelo pipeline
+METRICS = MetricsRegistry(enabled=os.getenv("METRICS_ENABLED", "1") != "0")
+_configured_paths = set()
+
+
+def configure_metrics_from_env(registry=METRICS):
+    """
+    Inclui no registro os sinks definidos no ambiente (METRICS_JSON_LOG e
+    METRICS_PROMETHEUS_FILE, com METRICS_PROMETHEUS_INTERVAL em segundos).
+    Pode ser chamada mais de uma vez: cada arquivo recebe um único sink.
+    """
+    json_log_path = os.getenv("METRICS_JSON_LOG")
+    if json_log_path and ("json", json_log_path) not in _configured_paths:
+        registry.add_sink(JsonLogSink(json_log_path))
+        _configured_paths.add(("json", json_log_path))
+    prometheus_path = os.getenv("METRICS_PROMETHEUS_FILE")
+    if prometheus_path and ("prometheus", prometheus_path) not in _configured_paths:
+        interval = float(os.getenv("METRICS_PROMETHEUS_INTERVAL", str(DEFAULT_PROMETHEUS_INTERVAL_SECONDS)))
+        registry.add_sink(PrometheusFileSink(prometheus_path, interval_seconds=interval))
+        _configured_paths.add(("prometheus", prometheus_path))
+    return registry
+
+
+def timer(stage, items=None, **fields):
+    """Atalho para `METRICS.timer`."""
+    return METRICS.timer(stage, items=items, **fields)
+
+
+def observe(name, value, **fields):
+    """Atalho para `METRICS.observe`."""
+    METRICS.observe(name, value, **fields)
+
+
+def increment(name, value=1, **fields):
+    """Atalho para `METRICS.increment`."""
+    METRICS.increment(name, value, **fields)
@@ -0,0 +1,95 @@
+# parallel_preprocessing.py
+"""
+Pré-processamento paralelo (extração, limpeza e chunking) em todos os núcleos.
+
+Os documentos originais são agrupados em unidades de trabalho de tamanho fixo e
+enviados a um pool de processos; cada unidade devolve os documentos prontos para
+o RAG e seus chunks. Os resultados são emitidos na mesma ordem da entrada, e o
+número de unidades em andamento é limitado, para que o estágio possa ser usado
+dentro da ingestão em fluxo sem acumular o corpus em memória.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from rag_pipeline import (
+    DEFAULT_CHUNK_OVERLAP,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_CHUNKING_STRATEGY,
+    chunk_document,
+    prepare_document_for_rag,
+)
+
+DEFAULT_WORK_UNIT_SIZE = 32
+
+
+def _preprocess_work_unit(start_position, raw_documents, chunk_size, overlap, chunking_strategy):
+    """Executado no processo filho: extrai e segmenta uma unidade de trabalho."""
+    results = []
+    for offset, doc_original in enumerate(raw_documents):
+        document = prepare_document_for_rag(doc_original, position=start_position + offset)
+        if document is None:
+            continue
+        results.append((document, chunk_document(document, chunk_size=chunk_size, overlap=overlap,
+                                                 strategy=chunking_strategy)))
+    return results
+
+
+def _iter_work_units(raw_documents, work_unit_size):
+    iterator = iter(raw_documents)
+    position = 0
+    while True:
+        unit = list(islice(iterator, work_unit_size))
+        if not unit:
+            return
+        yield position, unit
+        position += len(unit)
+
+
+def iter_preprocessed_documents(raw_documents, num_workers=None, work_unit_size=DEFAULT_WORK_UNIT_SIZE,
+                                chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP,
+                                chunking_strategy=DEFAULT_CHUNKING_STRATEGY):
+    """
+    Gera pares (documento, chunks) para cada documento original de `raw_documents`,
+    na ordem de entrada. `num_workers` padrão: todos os núcleos; com 1 o trabalho é
+    feito no próprio processo. No máximo 2 unidades por worker ficam em andamento.
+    `chunking_strategy` é repassada a `chunk_document` (deve ser a do fingerprint do índice).
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    work_units = _iter_work_units(raw_documents, work_unit_size)
+
+    if num_workers == 1:
+        for start_position, unit in work_units:
+            yield from _preprocess_work_unit(start_position, unit, chunk_size, overlap, chunking_strategy)
+        return
+
+    max_in_flight = 2 * num_workers
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        pending = deque()
+        for start_position, unit in work_units:
+            pending.append(executor.submit(_preprocess_work_unit, start_position, unit, chunk_size, overlap,
+                                           chunking_strategy))
+            if len(pending) >= max_in_flight:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def preprocess_corpus_parallel(raw_documents, num_workers=None, work_unit_size=DEFAULT_WORK_UNIT_SIZE,
+                               chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP,
+                               chunking_strategy=DEFAULT_CHUNKING_STRATEGY):
+    """
+    Versão em lista: retorna (documentos, chunks) equivalentes a
+    `load_processes_from_original_json` + `process_documents_for_rag`.
+    """
+    documents = []
+    all_chunks = []
+    for document, chunks in iter_preprocessed_documents(raw_documents, num_workers=num_workers,
+                                                        work_unit_size=work_unit_size,
+                                                        chunk_size=chunk_size, overlap=overlap,
+                                                        chunking_strategy=chunking_strategy):
+        documents.append(document)
+        all_chunks.extend(chunks)
+    print(f"{len(documents)} documentos pré-processados em paralelo ({len(all_chunks)} chunks).")
+    return documents, all_chunks
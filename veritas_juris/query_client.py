@@ -0,0 +1,111 @@
+# query_client.py
+"""
+Cliente HTTP do serviço de consultas (`query_service.py`).
+
+Expõe os mesmos métodos do `QueryEngine` (health, filter_options, search,
+answer_stream, upsert_document, delete_document, metrics_summary, prometheus_metrics,
+reset_metrics), então o app Streamlit usa um ou outro sem mudar o código da interface. Só depende da biblioteca
+padrão: o processo da interface não carrega torch, FAISS nem o modelo de embedding.
+"""
+import json
+import urllib.error
+import urllib.request
+
+DEFAULT_TIMEOUT_SECONDS = 120.0
+
+
+class QueryServiceError(RuntimeError):
+    """Erro devolvido pelo serviço (`status` HTTP; None se o serviço não respondeu)."""
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def _filters_payload(filters):
+    # Datas (datetime.date) viram "AAAA-MM-DD"
+    if not filters:
+        return None
+    return {field: value.isoformat() if hasattr(value, "isoformat") else value for field, value in filters.items()}
+
+
+class QueryServiceClient:
+    """Cliente do serviço em `base_url` (ex.: http://localhost:8765)."""
+
+    def __init__(self, base_url, timeout=DEFAULT_TIMEOUT_SECONDS):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _open(self, path, payload=None):
+        data = None
+        headers = {"Accept": "application/json"}
+        if payload is not None:
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            headers["Content-Type"] = "application/json; charset=utf-8"
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers,
+                                         method="POST" if data is not None else "GET")
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read().decode("utf-8")).get("error") or str(e)
+            except ValueError:
+                message = str(e)
+            raise QueryServiceError(message, status=e.code, retry_after=e.headers.get("Retry-After"))
+        except urllib.error.URLError as e:
+            raise QueryServiceError(f"Serviço de consultas indisponível em {self.base_url}: {e.reason}")
+
+    def _get_json(self, path, payload=None):
+        with self._open(path, payload) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def health(self):
+        """Estado do serviço; sem resposta, {"ready": False, "error": ...}."""
+        try:
+            return self._get_json("/health")
+        except QueryServiceError as e:
+            return {"status": "error", "ready": False, "error": str(e)}
+
+    @property
+    def ready(self):
+        return self.health().get("ready", False)
+
+    @property
+    def error(self):
+        return self.health().get("error")
+
+    def filter_options(self):
+        return self._get_json("/filters")
+
+    def search(self, query, top_k=8, search_mode="hybrid", filters=None):
+        """Chunks do contexto e documentos citados: {"chunks", "sources"}."""
+        return self._get_json("/search", {"query": query, "top_k": top_k, "search_mode": search_mode,
+                                          "filters": _filters_payload(filters)})
+
+    def answer_stream(self, query, top_k=8, search_mode="hybrid", filters=None):
+        """Eventos da resposta, à medida que chegam: "sources", "text"..., "done" (ou "error")."""
+        response = self._open("/answer", {"query": query, "top_k": top_k, "search_mode": search_mode,
+                                          "filters": _filters_payload(filters)})
+        with response:
+            for line in response:
+                if line.strip():
+                    yield json.loads(line.decode("utf-8"))
+
+    def upsert_document(self, document, document_id=None):
+        """Inclui ou substitui um acórdão (item do JSON original): {"document_id", "added", "removed"}."""
+        return self._get_json("/documents", {"document": document, "document_id": document_id})
+
+    def delete_document(self, document_id):
+        """Remove um documento do índice: {"document_id", "removed"}."""
+        return self._get_json("/documents/delete", {"document_id": document_id})
+
+    def metrics_summary(self):
+        return self._get_json("/metrics/summary")
+
+    def prometheus_metrics(self):
+        with self._open("/metrics") as response:
+            return response.read().decode("utf-8")
+
+    def reset_metrics(self):
+        self._get_json("/metrics/reset", {})
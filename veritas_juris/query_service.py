@@ -0,0 +1,684 @@
+# query_service.py
+"""
+Serviço de consultas (HTTP/JSON) independente da interface Streamlit.
+
+Um único processo carrega o modelo de embedding, o índice e o LLM uma vez e atende
+a todos os clientes (o app Streamlit via `QueryServiceClient`, scripts, outros
+serviços), em vez de cada processo da interface manter a sua cópia.
+
+- O servidor é assíncrono (asyncio, sem dependências além da biblioteca padrão): a
+  thread do loop só lê e escreve as requisições.
+- Embedding e busca (CPU) rodam em um pool de `workers` threads que compartilham o
+  modelo e o índice (o torch e o FAISS liberam o GIL). Enquanto todos os workers
+  estão ocupados, as perguntas que chegam esperam numa fila e são buscadas juntas
+  no próximo lote (`retrieve_relevant_chunks_batch`: um encode e uma busca matricial).
+- A geração com o LLM (espera de rede) usa um pool próprio de `llm_concurrency` threads.
+- Backpressure: a fila admite no máximo `max_pending` perguntas; além disso o
+  serviço responde 503 com `Retry-After`, em vez de acumular latência sem limite.
+
+Endpoints:
+    GET  /health            {"status", "ready", "error", "phase", "loading_seconds", "pending", "chunks", "documents"}
+    GET  /filters           valores dos filtros de metadados e intervalo de datas
+    GET  /metrics           métricas do processo no formato texto do Prometheus
+    GET  /metrics/summary   resumo por etapa, histogramas e estatísticas do cache de respostas
+    POST /search            {"query", "top_k", "search_mode", "filters"} -> {"chunks", "sources"}
+    POST /answer            mesmos campos; responde em JSON Lines (stream), um evento por linha:
+                            {"event": "sources"}, {"event": "text"}..., {"event": "done"}
+                            (ou, se a geração falhar depois do início, {"event": "error"} como último)
+    POST /documents         {"document": item do JSON original, "document_id"} -> {"document_id", "added", "removed"}
+    POST /documents/delete  {"document_id"} -> {"document_id", "removed"}
+
+Cada conexão atende uma requisição (`Connection: close`).
+
+Uso:
+    python query_service.py --host 0.0.0.0 --port 8765 --workers 4
+    QUERY_SERVICE_URL=http://localhost:8765 streamlit run veritas_juris/app.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from dotenv import load_dotenv
+
+from answer_cache import AnswerCache
+from context_builder import DEFAULT_CONTEXT_TOKEN_BUDGET, build_context
+from document_registry import DocumentRegistry
+from embedding_engine import load_embedding_engine
+from metadata_filters import MetadataFilterIndex, collapsed_sources, validate_filters
+from metrics import METRICS, configure_metrics_from_env, increment, observe, timer
+from rag_pipeline import (
+    SEARCH_MODES,
+    configure_llm,
+    load_or_build_vector_store,
+    prepare_document_for_rag,
+    retrieve_relevant_chunks_batch,
+    stream_response_with_llm,
+)
+
+DEFAULT_DATA_FILE = os.path.join(os.path.dirname(__file__), "data", "processo.json")
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_PENDING = 64
+DEFAULT_LLM_CONCURRENCY = 8
+DEFAULT_REQUEST_TIMEOUT_SECONDS = 120.0
+DEFAULT_TOP_K = 8
+MAX_BODY_BYTES = 1024 * 1024
+RETRY_AFTER_SECONDS = 1
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+                504: "Gateway Timeout"}
+
+
+def _json_default(value):
+    # Ids e contagens que vêm do numpy/FAISS
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def _dumps(payload):
+    return json.dumps(payload, ensure_ascii=False, default=_json_default)
+
+
+class QueryEngine:
+    """
+    Componentes carregados (modelos, índice, filtros, registro de documentos) e as operações
+    de consulta. É usado pelo serviço HTTP e, sem serviço configurado, diretamente pelo app;
+    `QueryServiceClient` expõe os mesmos métodos por HTTP.
+    """
+
+    def __init__(self, data_file_path=DEFAULT_DATA_FILE, context_token_budget=None, use_mmr=None):
+        self.data_file_path = data_file_path
+        self.context_token_budget = context_token_budget or int(
+            os.getenv("CONTEXT_TOKEN_BUDGET", str(DEFAULT_CONTEXT_TOKEN_BUDGET)))
+        self.use_mmr = os.getenv("CONTEXT_USE_MMR", "0") == "1" if use_mmr is None else use_mmr
+        self.embedding_model = None
+        self.llm_model = None
+        self.vector_store = None
+        self.index_fingerprint = None
+        self.chunks = []
+        self.lexical_index = None
+        self.filter_index = None
+        self.document_registry = None
+        # Criado na primeira atualização de documento; a partir daí as buscas usam o índice dele
+        self.index_manager = None
+        self._update_lock = threading.Lock()
+        self.answer_cache = None
+        self.ready = False
+        self.error = None
+        self.phase = None
+        self.load_started_at = None
+        self.load_seconds = None
+        self._loader = None
+
+    def start_loading(self):
+        """
+        Inicia `load` em uma thread em segundo plano e retorna o próprio engine na hora:
+        quem chama (o app, o servidor) responde enquanto o modelo e o índice carregam;
+        `health()` informa a etapa em andamento e quando o engine fica pronto.
+        """
+        if self._loader is None:
+            self._loader = threading.Thread(target=self.load, name="query-engine-warmup", daemon=True)
+            self._loader.start()
+        return self
+
+    def load(self):
+        """Carrega modelos, documentos e índice (ver `load_or_build_vector_store`). Retorna o próprio engine."""
+        self.load_started_at = time.perf_counter()
+        try:
+            with timer("warmup"):
+                self._load_components()
+            self.ready = True
+            self.load_seconds = time.perf_counter() - self.load_started_at
+            observe("startup_ready_seconds", self.load_seconds)
+            print(f"Componentes de consulta prontos em {self.load_seconds:.1f}s.")
+        except Exception as e:
+            print(f"ERRO: Falha ao carregar os componentes de consulta: {e}")
+            self.error = str(e)
+            self.ready = False
+        finally:
+            self.phase = None
+        return self
+
+    def _load_components(self):
+        # Precisão/backend/threads do modelo de embedding podem ser ajustados no .env
+        self.phase = "modelo de embedding"
+        self.embedding_model = load_embedding_engine(
+            precision=os.getenv("EMBEDDING_PRECISION", "float32"),
+            backend=os.getenv("EMBEDDING_BACKEND", "torch"),
+            num_threads=int(os.getenv("EMBEDDING_THREADS", "0")) or None,
+        )
+        self.phase = "LLM"
+        self.llm_model = configure_llm()
+        semantic_threshold = os.getenv("ANSWER_CACHE_SEMANTIC_THRESHOLD", "0.95")
+        self.answer_cache = AnswerCache(
+            max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024")),
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600))),
+            semantic_threshold=float(semantic_threshold) if semantic_threshold else None,
+        )
+        if not os.path.exists(self.data_file_path):
+            raise FileNotFoundError(f"Arquivo JSON principal não encontrado em: {self.data_file_path}")
+        self.phase = "índice"
+        # Os documentos preparados só são lidos se o índice precisar ser construído
+        self.vector_store, self.chunks, self.lexical_index, self.index_fingerprint = load_or_build_vector_store(
+            self.data_file_path, None, self.embedding_model, with_lexical_index=True, with_fingerprint=True
+        )
+        if self.vector_store is None or not len(self.chunks):
+            raise ValueError("Nenhum chunk gerado a partir dos documentos; o índice RAG não foi criado.")
+        # Fontes exibidas com a resposta: tabela de documentos do artefato (só fileName, ementa e metadados)
+        self.document_registry = DocumentRegistry.from_chunks(self.chunks)
+        self.phase = "filtros"
+        # Listas de postings por tribunal/relator/classe/UF/data para os filtros da busca
+        self.filter_index = MetadataFilterIndex.build(self.chunks)
+        # A primeira chamada ao modelo inicializa kernels e buffers; é feita aqui, e não na
+        # primeira pergunta do usuário.
+        self.phase = "aquecimento"
+        self.embedding_model.encode(["aquecimento do modelo de embedding"])
+
+    def health(self):
+        """Estado do carregamento: etapa em andamento e segundos desde o início (ou até ficar pronto)."""
+        if self.load_seconds is not None:
+            loading_seconds = self.load_seconds
+        elif self.load_started_at is not None:
+            loading_seconds = time.perf_counter() - self.load_started_at
+        else:
+            loading_seconds = 0.0
+        return {
+            "status": "ok" if self.ready else ("error" if self.error else "loading"),
+            "ready": self.ready,
+            "error": self.error,
+            "phase": self.phase,
+            "loading_seconds": loading_seconds,
+            "chunks": self._num_chunks() if self.ready else 0,
+            "documents": len(self.document_registry) if self.document_registry is not None else 0,
+        }
+
+    def _num_chunks(self):
+        return self.index_manager.ntotal if self.index_manager is not None else len(self.chunks)
+
+    def filter_options(self):
+        """Valores de cada filtro categórico e o intervalo de datas (AAAAMMDD) do índice."""
+        filter_index = self.index_manager.filter_index() if self.index_manager is not None else self.filter_index
+        if filter_index is None:
+            return {"tribunal": [], "relator": [], "classe": [], "uf": [], "date_range": [None, None]}
+        options = {field: filter_index.values(field) for field in ("tribunal", "relator", "classe", "uf")}
+        options["date_range"] = list(filter_index.date_range())
+        return options
+
+    def _sources(self, relevant_chunks_data):
+        """
+        Documentos citados pelos chunks, sem repetição (busca O(1) no registro). Em
+        "near_duplicates" vão os demais documentos ({"fileName", "document_id"}) com o mesmo
+        texto, colapsados na ingestão.
+        """
+        sources = {}
+        for chunk in relevant_chunks_data:
+            source_file = chunk["metadata_chunk"]["source_document"]
+            source_key = chunk["metadata_chunk"].get("document_id", source_file)
+            if source_key not in sources:
+                document = self.document_registry.document_for_chunk(chunk)
+                sources[source_key] = {
+                    "fileName": source_file,
+                    "document_id": document.get("document_id") if document else None,
+                    "ementa": document.get("ementa_display_text") if document else None,
+                    "near_duplicates": [],
+                }
+            collapsed = collapsed_sources(chunk)
+            near_duplicates = sources[source_key]["near_duplicates"]
+            for duplicate in collapsed:
+                entry = {"fileName": duplicate["source_document"], "document_id": duplicate["document_id"]}
+                # Trechos repetidos dentro do próprio documento não são outra fonte
+                if duplicate["document_id"] != sources[source_key]["document_id"] and entry not in near_duplicates:
+                    near_duplicates.append(entry)
+        return list(sources.values())
+
+    def search_batch(self, queries, top_k=DEFAULT_TOP_K, search_mode="hybrid", filters=None):
+        """
+        Recupera e monta o contexto (`build_context`) de várias perguntas com as mesmas
+        opções, em uma única busca. Retorna {"chunks", "sources"} por pergunta.
+        """
+        if not self.ready:
+            raise RuntimeError("Sistema de consulta não está pronto.")
+        index_manager = self.index_manager
+        if index_manager is not None:
+            # Índice, BM25 e filtros mantidos em dia pelo IndexManager após as atualizações
+            results = index_manager.search_batch(queries, top_k=top_k, search_mode=search_mode, filters=filters)
+        else:
+            results = retrieve_relevant_chunks_batch(
+                queries, self.vector_store, self.chunks, self.embedding_model, top_k=top_k,
+                lexical_index=self.lexical_index, search_mode=search_mode, filters=filters,
+                filter_index=self.filter_index,
+            )
+        responses = []
+        for query, relevant_chunks_data in zip(queries, results):
+            # Funde vizinhos, remove quase-duplicatas e limita o prompt ao orçamento de tokens
+            context_chunks = build_context(query, relevant_chunks_data, token_budget=self.context_token_budget,
+                                           use_mmr=self.use_mmr, embedding_model=self.embedding_model)
+            responses.append({"chunks": context_chunks, "sources": self._sources(context_chunks)})
+        return responses
+
+    def search(self, query, top_k=DEFAULT_TOP_K, search_mode="hybrid", filters=None):
+        return self.search_batch([query], top_k=top_k, search_mode=search_mode, filters=filters)[0]
+
+    # --- Atualização do acervo ---
+    def _index_manager_for_updates(self):
+        """IndexManager sobre o índice carregado (os chunks passam a ficar em memória), criado uma vez."""
+        if self.index_manager is None:
+            # Importado aqui: carrega o FAISS (ver `load`)
+            from index_manager import IndexManager
+            print("Preparando o índice para atualizações incrementais...")
+            self.index_manager = IndexManager.from_vector_store(self.vector_store, self.chunks, self.embedding_model)
+        return self.index_manager
+
+    def upsert_document(self, document, document_id=None):
+        """
+        Inclui ou substitui um acórdão (item do JSON original, {"fileName", "content"}) sem
+        reconstruir o índice: vetores, BM25, filtros e registro de documentos passam a refleti-lo
+        nas próximas buscas. Sem `document_id`, o documento recebe um id novo.
+        Retorna {"document_id", "added", "removed"} (número de chunks).
+        """
+        if not self.ready:
+            raise RuntimeError("Sistema de consulta não está pronto.")
+        doc_info = prepare_document_for_rag(document)
+        if doc_info is None:
+            raise ValueError("Documento sem a estrutura esperada (fileName/content) ou sem texto.")
+        doc_info["document_id"] = document_id
+        with self._update_lock:
+            index_manager = self._index_manager_for_updates()
+            # O registro atribui o id (se faltar) antes de os chunks herdarem os metadados
+            self.document_registry.register(doc_info)
+            added_ids, removed_ids = index_manager.upsert_document(doc_info)
+        return {"document_id": doc_info["document_id"], "added": len(added_ids), "removed": len(removed_ids)}
+
+    def delete_document(self, document_id):
+        """Remove um documento do índice e do registro. Retorna {"document_id", "removed"} (número de chunks)."""
+        if not self.ready:
+            raise RuntimeError("Sistema de consulta não está pronto.")
+        with self._update_lock:
+            removed_ids = self._index_manager_for_updates().delete_document(document_id)
+            self.document_registry.remove(document_id)
+        return {"document_id": document_id, "removed": len(removed_ids)}
+
+    def index_version(self):
+        """
+        Versão do acervo para o AnswerCache: o fingerprint do artefato (muda com o corpus, o modelo
+        ou os parâmetros do índice) e, depois de atualizações, a versão do IndexManager.
+        """
+        index_manager = self.index_manager
+        if index_manager is not None:
+            return f"{self.index_fingerprint}:{index_manager.version}"
+        return self.index_fingerprint
+
+    def answer_events(self, query, search_result):
+        """Eventos da resposta ("text" a cada pedaço do LLM e "done") para o contexto já recuperado."""
+        start = time.perf_counter()
+        query_vector = None
+        if self.answer_cache.semantic_threshold is not None:
+            query_vector = self.embedding_model.encode([query])[0]
+        first_token_seconds = None
+        # Respostas geradas sobre outra versão do acervo são descartadas pelo cache
+        for text in stream_response_with_llm(query, search_result["chunks"], self.llm_model,
+                                             answer_cache=self.answer_cache, query_vector=query_vector,
+                                             index_version=self.index_version()):
+            if first_token_seconds is None:
+                first_token_seconds = time.perf_counter() - start
+            yield {"event": "text", "text": text}
+        yield {"event": "done", "first_token_seconds": first_token_seconds, "seconds": time.perf_counter() - start}
+
+    def answer_stream(self, query, top_k=DEFAULT_TOP_K, search_mode="hybrid", filters=None):
+        """Busca e resposta: evento "sources" (com os chunks do contexto) seguido dos eventos do LLM."""
+        search_result = self.search(query, top_k=top_k, search_mode=search_mode, filters=filters)
+        yield {"event": "sources", **search_result}
+        yield from self.answer_events(query, search_result)
+
+    def metrics_summary(self):
+        """Resumo exibido no painel de métricas do app."""
+        return {
+            "enabled": METRICS.enabled,
+            "window_size": METRICS.window_size,
+            "stages": METRICS.stage_summary(),
+            "histograms": METRICS.snapshot()["histograms"],
+            "answer_cache": self.answer_cache.stats() if self.answer_cache is not None else None,
+        }
+
+    def prometheus_metrics(self):
+        return METRICS.to_prometheus()
+
+    def reset_metrics(self):
+        METRICS.reset()
+
+
+def _parse_search_request(payload):
+    """Valida o corpo de /search e /answer; retorna (query, opções) ou levanta ValueError."""
+    if not isinstance(payload, dict):
+        raise ValueError("O corpo deve ser um objeto JSON.")
+    query = payload.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise ValueError("Campo 'query' obrigatório.")
+    search_mode = payload.get("search_mode", "hybrid")
+    if search_mode not in SEARCH_MODES:
+        raise ValueError(f"Modo de busca desconhecido: {search_mode}. Opções: {', '.join(SEARCH_MODES)}.")
+    top_k = payload.get("top_k", DEFAULT_TOP_K)
+    if not isinstance(top_k, int) or not 1 <= top_k <= 100:
+        raise ValueError("'top_k' deve ser um inteiro entre 1 e 100.")
+    filters = payload.get("filters") or None
+    if filters is not None and not isinstance(filters, dict):
+        raise ValueError("'filters' deve ser um objeto JSON.")
+    if filters is not None:
+        validate_filters(filters)
+    return query, {"top_k": top_k, "search_mode": search_mode, "filters": filters}
+
+
+def _parse_document_request(path, payload):
+    """Valida o corpo de /documents e /documents/delete; retorna (documento, document_id) ou levanta ValueError."""
+    if not isinstance(payload, dict):
+        raise ValueError("O corpo deve ser um objeto JSON.")
+    document_id = payload.get("document_id")
+    if document_id is not None and (not isinstance(document_id, int) or isinstance(document_id, bool)
+                                    or document_id < 0):
+        raise ValueError("'document_id' deve ser um inteiro não negativo.")
+    if path == "/documents/delete":
+        if document_id is None:
+            raise ValueError("Campo 'document_id' obrigatório.")
+        return None, document_id
+    document = payload.get("document")
+    if not isinstance(document, dict):
+        raise ValueError("Campo 'document' obrigatório: um item do JSON original ({\"fileName\", \"content\"}).")
+    return document, document_id
+
+
+def _batch_key(options):
+    """Perguntas com as mesmas opções de busca podem ser buscadas no mesmo lote."""
+    return options["top_k"], options["search_mode"], _dumps(options["filters"])
+
+
+class _HttpError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class QueryService:
+    """Servidor HTTP assíncrono em torno de um `QueryEngine` (ver docstring do módulo)."""
+
+    def __init__(self, engine, workers=DEFAULT_WORKERS, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_pending=DEFAULT_MAX_PENDING, llm_concurrency=DEFAULT_LLM_CONCURRENCY,
+                 request_timeout=DEFAULT_REQUEST_TIMEOUT_SECONDS):
+        self.engine = engine
+        self.workers = max(1, workers)
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_pending = max(1, max_pending)
+        self.request_timeout = request_timeout
+        self.search_executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="busca")
+        self.llm_executor = ThreadPoolExecutor(max_workers=max(1, llm_concurrency), thread_name_prefix="llm")
+        self._queue = None
+        self._free_workers = None
+
+    # --- Fila de buscas em lote ---
+    async def _dispatch_batches(self):
+        """Tira da fila tudo o que chegou enquanto os workers estavam ocupados e busca em lotes."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._free_workers.acquire()
+            pending = [await self._queue.get()]
+            while len(pending) < self.max_batch_size and not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            groups = {}
+            for item in pending:
+                groups.setdefault(_batch_key(item[1]), []).append(item)
+            group_list = list(groups.values())
+            # O worker já reservado fica com o primeiro grupo; os demais esperam a sua vez
+            for position, group in enumerate(group_list):
+                if position:
+                    await self._free_workers.acquire()
+                loop.create_task(self._run_batch(loop, group))
+
+    async def _run_batch(self, loop, group):
+        queries = [query for query, _, _, _ in group]
+        options = group[0][1]
+        now = time.perf_counter()
+        for _, _, _, enqueued_at in group:
+            observe("service_queue_wait_seconds", now - enqueued_at)
+        observe("service_batch_size", len(group))
+        try:
+            results = await loop.run_in_executor(self.search_executor,
+                                                 lambda: self.engine.search_batch(queries, **options))
+            for (_, _, future, _), result in zip(group, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            for _, _, future, _ in group:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._free_workers.release()
+
+    async def search(self, query, options):
+        """Enfileira a busca; 503 se a fila estiver cheia (backpressure)."""
+        if not self.engine.ready:
+            raise _HttpError(503, "Sistema de consulta ainda não está pronto.",
+                             {"Retry-After": str(RETRY_AFTER_SECONDS)})
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((query, options, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            increment("service_rejected_total")
+            raise _HttpError(503, "Serviço sobrecarregado; tente novamente.",
+                             {"Retry-After": str(RETRY_AFTER_SECONDS)})
+        try:
+            return await asyncio.wait_for(future, self.request_timeout)
+        except asyncio.TimeoutError:
+            raise _HttpError(504, "Tempo limite da busca excedido.")
+
+    async def update_documents(self, path, document, document_id):
+        """Inclusão/remoção de documento no pool de busca (o embedding dos chunks usa CPU)."""
+        if not self.engine.ready:
+            raise _HttpError(503, "Sistema de consulta ainda não está pronto.",
+                             {"Retry-After": str(RETRY_AFTER_SECONDS)})
+        loop = asyncio.get_running_loop()
+        if path == "/documents":
+            operation = lambda: self.engine.upsert_document(document, document_id=document_id)
+        else:
+            operation = lambda: self.engine.delete_document(document_id)
+        try:
+            result = await loop.run_in_executor(self.search_executor, operation)
+        except ValueError as e:
+            raise _HttpError(400, str(e))
+        if path == "/documents/delete" and not result["removed"]:
+            raise _HttpError(404, f"Documento {document_id} não está no índice.")
+        return result
+
+    # --- HTTP ---
+    async def _read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise _HttpError(400, "Linha de requisição inválida.")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise _HttpError(413, "Corpo da requisição grande demais.")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target.split("?", 1)[0], body
+
+    @staticmethod
+    async def _write_response(writer, status, body, content_type="application/json; charset=utf-8", headers=None):
+        data = body.encode("utf-8")
+        head = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}", f"Content-Type: {content_type}",
+                f"Content-Length: {len(data)}", "Connection: close"]
+        head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+
+    async def _write_json(self, writer, status, payload, headers=None):
+        await self._write_response(writer, status, _dumps(payload), headers=headers)
+
+    async def _stream_answer(self, writer, query, options):
+        """Busca pela fila e repassa os eventos do LLM, gerados no pool do LLM, em JSON Lines."""
+        search_result = await self.search(query, options)
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        finished = object()
+        cancelled = threading.Event()
+
+        def produce():
+            try:
+                for event in self.engine.answer_events(query, search_result):
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(events.put_nowait, event)
+            except Exception as e:
+                loop.call_soon_threadsafe(events.put_nowait, {"event": "error", "error": str(e)})
+            finally:
+                loop.call_soon_threadsafe(events.put_nowait, finished)
+
+        async def write_event(event):
+            data = (_dumps(event) + "\n").encode("utf-8")
+            writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+            # drain: um cliente lento segura o produtor em vez de acumular a resposta em memória
+            await writer.drain()
+
+        writer.write(("HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson; charset=utf-8\r\n"
+                      "Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n").encode("latin-1"))
+        try:
+            loop.run_in_executor(self.llm_executor, produce)
+            event = {"event": "sources", **search_result}
+            while event is not finished:
+                await write_event(event)
+                event = await events.get()
+        except ConnectionError:
+            raise
+        except Exception as e:
+            # O status 200 já foi enviado: o erro vai como último evento do stream, não como outra resposta HTTP
+            print(f"ERRO: Falha durante o stream da resposta: {e}")
+            await write_event({"event": "error", "error": str(e)})
+        finally:
+            cancelled.set()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _route(self, method, path, body, writer):
+        if path == "/health":
+            await self._write_json(writer, 200, {**self.engine.health(), "pending": self._queue.qsize()})
+        elif path == "/filters":
+            await self._write_json(writer, 200, self.engine.filter_options())
+        elif path == "/metrics":
+            await self._write_response(writer, 200, METRICS.to_prometheus(), content_type="text/plain; version=0.0.4")
+        elif path == "/metrics/summary":
+            await self._write_json(writer, 200, self.engine.metrics_summary())
+        elif path == "/metrics/reset":
+            if method != "POST":
+                raise _HttpError(405, "Use POST.")
+            self.engine.reset_metrics()
+            await self._write_json(writer, 200, {"reset": True})
+        elif path in ("/search", "/answer"):
+            if method != "POST":
+                raise _HttpError(405, "Use POST.")
+            try:
+                query, options = _parse_search_request(json.loads(body or b"{}"))
+            except (ValueError, json.JSONDecodeError) as e:
+                raise _HttpError(400, str(e))
+            if path == "/search":
+                with timer("service_search"):
+                    await self._write_json(writer, 200, await self.search(query, options))
+            else:
+                with timer("service_answer"):
+                    await self._stream_answer(writer, query, options)
+        elif path in ("/documents", "/documents/delete"):
+            if method != "POST":
+                raise _HttpError(405, "Use POST.")
+            try:
+                document, document_id = _parse_document_request(path, json.loads(body or b"{}"))
+            except (ValueError, json.JSONDecodeError) as e:
+                raise _HttpError(400, str(e))
+            await self._write_json(writer, 200, await self.update_documents(path, document, document_id))
+        else:
+            raise _HttpError(404, f"Rota desconhecida: {path}")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request = await self._read_request(reader)
+            if request is not None:
+                await self._route(*request, writer)
+        except _HttpError as e:
+            await self._write_json(writer, e.status, {"error": str(e)}, headers=e.headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            print(f"ERRO: Falha ao atender a requisição: {e}")
+            try:
+                await self._write_json(writer, 500, {"error": str(e)})
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, load_engine=True):
+        """Sobe o servidor; com `load_engine`, carrega o engine em segundo plano (/health mostra o progresso)."""
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._free_workers = asyncio.Semaphore(self.workers)
+        dispatcher = loop.create_task(self._dispatch_batches())
+        if load_engine and not self.engine.ready:
+            self.engine.start_loading()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serviço de consultas em http://{host}:{port} ({self.workers} workers, fila de {self.max_pending}).")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            dispatcher.cancel()
+            self.search_executor.shutdown(wait=False)
+            self.llm_executor.shutdown(wait=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serviço HTTP/JSON de consultas ao pipeline RAG.")
+    parser.add_argument("--host", default=os.getenv("QUERY_SERVICE_HOST", DEFAULT_HOST))
+    parser.add_argument("--port", type=int, default=int(os.getenv("QUERY_SERVICE_PORT", str(DEFAULT_PORT))))
+    parser.add_argument("--data", default=DEFAULT_DATA_FILE, help="JSON original dos acórdãos")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Threads para embedding e busca (compartilham modelo e índice)")
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE,
+                        help="Máximo de perguntas enfileiradas buscadas em um mesmo lote")
+    parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING,
+                        help="Tamanho da fila; acima disso o serviço responde 503")
+    parser.add_argument("--llm-concurrency", type=int, default=DEFAULT_LLM_CONCURRENCY,
+                        help="Máximo de chamadas simultâneas ao LLM")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_REQUEST_TIMEOUT_SECONDS,
+                        help="Tempo limite (s) de cada busca, incluindo a espera na fila")
+    args = parser.parse_args()
+
+    load_dotenv()
+    configure_metrics_from_env()
+    service = QueryService(QueryEngine(args.data), workers=args.workers, max_batch_size=args.max_batch_size,
+                           max_pending=args.max_pending, llm_concurrency=args.llm_concurrency,
+                           request_timeout=args.timeout)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Serviço encerrado.")
+
+
+if __name__ == "__main__":
+    main()
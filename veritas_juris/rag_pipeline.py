@@ -1,10 +1,39 @@
 # rag_pipeline.py
 import os
 import json
-from sentence_transformers import SentenceTransformer
-import faiss
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import google.generativeai as genai
+# sentence_transformers, faiss e google.generativeai são importados dentro das funções que os
+# usam: importar este módulo (e o app) não carrega torch, FAISS nem o SDK do Gemini.
+
+from answer_cache import chunk_cache_id, llm_model_id
+from chunk_store import ChunkStore
+from context_builder import build_context, estimate_tokens
+from dedup import DEFAULT_DEDUP_THRESHOLD, NearDuplicateFilter, dedup_params
+from structured_chunker import DEFAULT_MAX_CHUNK_TOKENS, DEFAULT_TARGET_CHUNK_TOKENS, chunk_blocks
+from embedding_cache import EmbeddingCache, encode_with_cache
+from index_factory import build_faiss_index, search_index
+from index_store import (
+    DEFAULT_ARTIFACTS_DIR,
+    artifact_file_path,
+    compute_corpus_fingerprint,
+    load_vector_store,
+    save_vector_store,
+)
+from lexical_index import LEXICAL_INDEX_FILE_NAME, BM25Index, reciprocal_rank_fusion
+from metadata_filters import MetadataFilterIndex, make_id_selector
+from metrics import METRICS, observe, timer
+
+DEFAULT_EMBEDDING_MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_CHUNK_OVERLAP = 50
+# "structure": chunks alinhados às seções do acórdão (structured_chunker.py);
+# "words": janelas fixas de DEFAULT_CHUNK_SIZE palavras com DEFAULT_CHUNK_OVERLAP de sobreposição
+DEFAULT_CHUNKING_STRATEGY = "structure"
+CHUNKING_STRATEGIES = ("structure", "words")
+# Incrementar ao alterar `build_rag_prompt`: respostas em cache de outra versão são ignoradas
+PROMPT_VERSION = "1"
 
 
 # rag_pipeline.py
@@ -28,63 +57,150 @@ def mock_generate_argument_variations(text):
     ]
 
 
+class _MockLLMResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class MockLLM:
+    """
+    Modelo local falso com a mesma interface do Gemini (`generate_content(prompt, stream=...)`),
+    para testes e demonstrações sem chave de API. Em streaming devolve a resposta em
+    pedaços de `words_per_chunk` palavras, esperando `delay` segundos entre eles.
+    """
+
+    def __init__(self, answer=None, words_per_chunk=3, delay=0.05):
+        self.answer = answer
+        self.words_per_chunk = words_per_chunk
+        self.delay = delay
+        self.model_name = "mock-local"
+
+    def _answer_for(self, prompt):
+        if self.answer:
+            return self.answer
+        sources_line = prompt.strip().splitlines()[-1].strip()
+        return ("Resposta simulada (modelo local de teste): com base nos trechos de jurisprudência "
+                f"recuperados, esta seria a resposta fundamentada à pergunta.\n\n{sources_line}")
+
+    def generate_content(self, prompt, stream=False):
+        text = self._answer_for(prompt)
+        if not stream:
+            return _MockLLMResponse(text)
+        return self._stream(text)
+
+    def _stream(self, text):
+        words = text.split(" ")
+        for start in range(0, len(words), self.words_per_chunk):
+            if self.delay:
+                time.sleep(self.delay)
+            piece = " ".join(words[start:start + self.words_per_chunk])
+            yield _MockLLMResponse(piece if start == 0 else " " + piece)
+
+
 
 # --- Configuração Inicial (sem alterações) ---
-def configure_llm():
-    """Configura e retorna o cliente do LLM (ex: Google Gemini)."""
+def configure_llm(provider=None):
+    """
+    Configura e retorna o cliente do LLM (ex: Google Gemini). `provider` (ou a variável
+    LLM_PROVIDER) "mock" devolve o `MockLLM` local, sem chamadas externas.
+    """
+    provider = provider or os.getenv("LLM_PROVIDER", "gemini")
+    if provider == "mock":
+        return MockLLM()
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
         raise ValueError("API Key do Google não encontrada. Verifique o arquivo .env.")
+    import google.generativeai as genai
     genai.configure(api_key=api_key)
     model = genai.GenerativeModel('gemini-1.5-flash-latest') # Ou outro modelo adequado
     return model
 
-def initialize_embedding_model(model_name='paraphrase-multilingual-MiniLM-L12-v2'):
-    """Inicializa e retorna o modelo de sentence transformer."""
+def initialize_embedding_model(model_name=DEFAULT_EMBEDDING_MODEL_NAME, backend="torch", model_kwargs=None):
+    """Inicializa e retorna o modelo de sentence transformer (backend "torch" ou "onnx")."""
     print(f"Carregando modelo de embedding: {model_name}...")
-    model = SentenceTransformer(model_name)
+    options = {}
+    if backend != "torch":
+        options["backend"] = backend
+    if model_kwargs:
+        options["model_kwargs"] = model_kwargs
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name, **options)
     print("Modelo de embedding carregado.")
     return model
 
-# --- LÓGICA DE EXTRAÇÃO DE TEXTO (mantida a sua função) ---
-def _extract_text_recursively(data_object):
-    """
-    Função auxiliar para extrair recursivamente todo o texto de um objeto JSON
-    (dicionário, lista ou string).
-    """
-    text_parts = []
+# --- LÓGICA DE EXTRAÇÃO DE TEXTO ---
+# Chaves que não devem ser interpretadas como texto direto para concatenação
+# ou chaves que indicam apenas metadados não textuais.
+# O conjunto é montado uma única vez (antes era uma lista recriada a cada dicionário visitado).
+# A lista de chaves ignoradas pode ser refinada.
+IGNORED_TEXT_KEYS = frozenset([
+    'page', 'fileName', 'document_signature_info', 'document_signature_info_page3',
+    'document_signature_info_page4', 'document_signature_info_page5',
+    'document_signature_info_page6', 'document_signature_info_page7',
+    'document_signature_info_page8', 'document_signature_info_page9',
+    'document_signature_info_page10', 'document_signature_info_page11',
+    'document_signature_info_page12', 'document_signature_info_page13',
+    'document_signature_info_page14', 'document_signature_info_page15',
+    'document_signature_info_page16', 'document_footer', 'document_footer_page3',
+    'case_info_duplicate', 'parties_and_roles_duplicate', 'ementa_duplicate', # Evitar duplicatas
+    'control_code', 'law_reference', # Campos de assinatura geralmente não são texto principal
+    # Chaves que são claramente metadados e não conteúdo textual principal para RAG
+    'numero_registro', 'numero_origem', 'sessao_virtual', 'relator_agint', 'presidente_sessao',
+    'title', # Se o título for apenas "EMENTA", "ACÓRDÃO", etc., pode ser redundante se o corpo for extraído.
+            # Mas se o title tiver conteúdo útil, reavalie.
+])
+
+
+def _collect_text_parts(data_object, text_parts):
+    """Acumula em `text_parts`, em ordem, os textos não vazios de um objeto JSON."""
     if isinstance(data_object, dict):
         for key, value in data_object.items():
-            # Ignorar chaves que não devem ser interpretadas como texto direto para concatenação
-            # ou chaves que indicam apenas metadados não textuais.
-            # A lista de chaves ignoradas pode ser refinada.
-            ignored_keys = [
-                'page', 'fileName', 'document_signature_info', 'document_signature_info_page3',
-                'document_signature_info_page4', 'document_signature_info_page5',
-                'document_signature_info_page6', 'document_signature_info_page7',
-                'document_signature_info_page8', 'document_signature_info_page9',
-                'document_signature_info_page10', 'document_signature_info_page11',
-                'document_signature_info_page12', 'document_signature_info_page13',
-                'document_signature_info_page14', 'document_signature_info_page15',
-                'document_signature_info_page16', 'document_footer', 'document_footer_page3',
-                'case_info_duplicate', 'parties_and_roles_duplicate', 'ementa_duplicate', # Evitar duplicatas
-                'control_code', 'law_reference', # Campos de assinatura geralmente não são texto principal
-                # Chaves que são claramente metadados e não conteúdo textual principal para RAG
-                'numero_registro', 'numero_origem', 'sessao_virtual', 'relator_agint', 'presidente_sessao',
-                'title', # Se o título for apenas "EMENTA", "ACÓRDÃO", etc., pode ser redundante se o corpo for extraído.
-                        # Mas se o title tiver conteúdo útil, reavalie.
-            ]
             # Condição especial para 'ementa' se quisermos um tratamento diferente ou já foi pego
-            if key not in ignored_keys:
-                text_parts.append(_extract_text_recursively(value))
+            if key not in IGNORED_TEXT_KEYS:
+                _collect_text_parts(value, text_parts)
     elif isinstance(data_object, list):
         for item in data_object:
-            text_parts.append(_extract_text_recursively(item))
+            _collect_text_parts(item, text_parts)
     elif isinstance(data_object, str):
-        text_parts.append(data_object)
+        text = data_object.strip()
+        if text:
+            text_parts.append(text)
     # Ignorar outros tipos como números, booleanos, None
 
-    return " ".join(filter(None, text_parts)).strip()
+
+def _extract_text_recursively(data_object):
+    """
+    Função auxiliar para extrair recursivamente todo o texto de um objeto JSON
+    (dicionário, lista ou string). Os trechos são acumulados em uma única lista
+    e unidos uma vez no final, em vez de concatenados a cada nível.
+    """
+    text_parts = []
+    _collect_text_parts(data_object, text_parts)
+    return " ".join(text_parts)
+
+
+def _collect_document_blocks(content_list):
+    """
+    Blocos de texto do documento, na ordem das páginas: um por chave de página não
+    ignorada, no formato {"page", "key", "units"}, em que `units` são as strings do bloco
+    (o `body`, cada item de `points`, ...). Base do chunking por estrutura.
+    """
+    blocks = []
+    for page in content_list:
+        if not isinstance(page, dict):
+            units = []
+            _collect_text_parts(page, units)
+            if units:
+                blocks.append({"page": None, "key": "", "units": units})
+            continue
+        for key, value in page.items():
+            if key in IGNORED_TEXT_KEYS:
+                continue
+            units = []
+            _collect_text_parts(value, units)
+            if units:
+                blocks.append({"page": page.get("page"), "key": key, "units": units})
+    return blocks
 
 
 def _extract_main_ementa_text(content_list):
@@ -109,6 +225,63 @@ def _extract_main_ementa_text(content_list):
 
 
 # --- NOVA LÓGICA DE CARREGAMENTO DE DADOS ---
+@METRICS.timed("extraction")
+def prepare_document_for_rag(doc_original, position=0):
+    """
+    Converte um item do JSON original ({"fileName", "content"}) no documento usado pelo RAG:
+    texto completo para chunking, ementa para exibição e metadados básicos.
+    `position` (posição do item no JSON de origem) é o id estável do documento
+    (`document_id`, ver document_registry.py).
+    Retorna None se o item não tiver a estrutura esperada ou nenhum texto.
+    """
+    if not isinstance(doc_original, dict) or "fileName" not in doc_original or "content" not in doc_original:
+        print(f"ALERTA: Item no JSON original não tem a estrutura esperada (fileName/content): {doc_original}")
+        return None
+
+    file_name_source = doc_original.get("fileName", "FonteDesconhecida_" + str(position))
+    content_list = doc_original.get("content", [])
+
+    # Extrai todo o texto do "content" para o RAG, bloco a bloco (mesmo texto que
+    # _extract_text_recursively(content_list), preservando páginas e seções)
+    blocks = _collect_document_blocks(content_list)
+    text_content_for_rag = " ".join(unit for block in blocks for unit in block["units"])
+
+    # Extrai o texto da ementa principal para exibição
+    ementa_text_for_display = _extract_main_ementa_text(content_list)
+
+    # Coleta alguns metadados importantes para referência
+    # Você pode expandir isso conforme necessário
+    doc_metadata = {
+        "fileName": file_name_source,
+        "case_info": None, # Tenta encontrar o primeiro case_info
+        "relator": None, # Tenta encontrar o primeiro relator
+        "tribunal": None # Cabeçalho da primeira página (ex.: "SUPERIOR TRIBUNAL DE JUSTIÇA")
+    }
+    for page in content_list:
+        if isinstance(page, dict):
+            if not doc_metadata["tribunal"] and page.get("header"):
+                doc_metadata["tribunal"] = page["header"]
+            if not doc_metadata["case_info"] and "case_info" in page:
+                doc_metadata["case_info"] = page["case_info"]
+            if not doc_metadata["relator"] and "parties_and_roles" in page and "relator" in page["parties_and_roles"]:
+                doc_metadata["relator"] = page["parties_and_roles"]["relator"]
+            if doc_metadata["case_info"] and doc_metadata["relator"] and doc_metadata["tribunal"]: # Otimização
+                break
+
+    if not text_content_for_rag.strip():
+        print(f"ALERTA: Documento '{file_name_source}' com texto extraído vazio.")
+        return None
+
+    return {
+        "document_id": position,              # Id numérico estável, atribuído na ingestão
+        "source": file_name_source,
+        "text": text_content_for_rag,         # Texto completo para chunking e embeddings
+        "ementa_display_text": ementa_text_for_display if ementa_text_for_display else "Ementa não encontrada.", # Para exibição
+        "blocks": blocks,                     # Blocos por página/seção para o chunking por estrutura
+        "full_metadata_origem": doc_metadata # Metadados básicos do documento
+    }
+
+
 def load_processes_from_original_json(path_to_original_json_file):
     """
     MODIFICADO: Carrega dados do arquivo JSON ORIGINAL completo.
@@ -125,46 +298,10 @@ def load_processes_from_original_json(path_to_original_json_file):
             print(f"ERRO: O arquivo JSON em {path_to_original_json_file} não é uma lista na raiz.")
             return []
 
-        for doc_original in original_data_list:
-            if not isinstance(doc_original, dict) or "fileName" not in doc_original or "content" not in doc_original:
-                print(f"ALERTA: Item no JSON original não tem a estrutura esperada (fileName/content): {doc_original}")
-                continue
-
-            file_name_source = doc_original.get("fileName", "FonteDesconhecida_" + str(len(documents_for_rag)))
-            content_list = doc_original.get("content", [])
-
-            # Extrai todo o texto do "content" para o RAG
-            # A função _extract_text_recursively vai varrer a lista 'content'
-            text_content_for_rag = _extract_text_recursively(content_list)
-
-            # Extrai o texto da ementa principal para exibição
-            ementa_text_for_display = _extract_main_ementa_text(content_list)
-
-            # Coleta alguns metadados importantes para referência
-            # Você pode expandir isso conforme necessário
-            doc_metadata = {
-                "fileName": file_name_source,
-                "case_info": None, # Tenta encontrar o primeiro case_info
-                "relator": None # Tenta encontrar o primeiro relator
-            }
-            for page in content_list:
-                if isinstance(page, dict):
-                    if not doc_metadata["case_info"] and "case_info" in page:
-                        doc_metadata["case_info"] = page["case_info"]
-                    if not doc_metadata["relator"] and "parties_and_roles" in page and "relator" in page["parties_and_roles"]:
-                        doc_metadata["relator"] = page["parties_and_roles"]["relator"]
-                    if doc_metadata["case_info"] and doc_metadata["relator"]: # Otimização
-                        break
-            
-            if text_content_for_rag.strip():
-                documents_for_rag.append({
-                    "source": file_name_source,
-                    "text": text_content_for_rag,         # Texto completo para chunking e embeddings
-                    "ementa_display_text": ementa_text_for_display if ementa_text_for_display else "Ementa não encontrada.", # Para exibição
-                    "full_metadata_origem": doc_metadata # Metadados básicos do documento
-                })
-            else:
-                print(f"ALERTA: Documento '{file_name_source}' com texto extraído vazio.")
+        for position, doc_original in enumerate(original_data_list):
+            document = prepare_document_for_rag(doc_original, position=position)
+            if document is not None:
+                documents_for_rag.append(document)
 
     except FileNotFoundError:
         print(f"ERRO: Arquivo JSON original não encontrado em '{path_to_original_json_file}'")
@@ -181,7 +318,7 @@ def load_processes_from_original_json(path_to_original_json_file):
 
 # --- Etapa 2: Segmentação (Chunking) ---
 # (Função chunk_text mantida como estava)
-def chunk_text(text, chunk_size=500, overlap=50):
+def chunk_text(text, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP):
     words = text.split()
     chunks = []
     for i in range(0, len(words), chunk_size - overlap):
@@ -192,33 +329,88 @@ def chunk_text(text, chunk_size=500, overlap=50):
 # --- Etapa 3: Processamento e Geração de Embeddings ---
 # (Função process_documents_for_rag mantida como estava em sua lógica principal,
 #  pois ela já espera uma lista de dicionários com "source" e "text")
-def process_documents_for_rag(documents_data):
-    all_chunks_with_source = []
-    for doc_info in documents_data:
-        source_file = doc_info.get("source", "FonteDesconhecida")
-        full_text = doc_info.get("text", "") # Este é o texto completo extraído
-
-        # Adiciona os metadados da ementa e outros relevantes ao chunk
-        # para que possam ser recuperados e usados no prompt ou exibição
-        chunk_metadata = {
-            "source_document": source_file,
-            "ementa_original": doc_info.get("ementa_display_text", ""),
-            "outros_metadados_doc": doc_info.get("full_metadata_origem", {})
+def chunking_params(strategy=DEFAULT_CHUNKING_STRATEGY):
+    """Parâmetros do chunking que entram no fingerprint do índice (além de chunk_size/overlap)."""
+    if strategy == "structure":
+        return {"chunking": strategy, "target_tokens": DEFAULT_TARGET_CHUNK_TOKENS,
+                "max_tokens": DEFAULT_MAX_CHUNK_TOKENS}
+    return {"chunking": strategy}
+
+
+@METRICS.timed("chunking")
+def chunk_document(doc_info, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP,
+                   strategy=DEFAULT_CHUNKING_STRATEGY):
+    """
+    Segmenta um documento (formato de `prepare_document_for_rag`) nos chunks com metadados usados pelo índice.
+    Com strategy="structure" e blocos disponíveis, os chunks seguem as seções do acórdão e
+    registram "section", "page_start" e "page_end"; caso contrário, usa janelas de palavras.
+    """
+    if strategy not in CHUNKING_STRATEGIES:
+        raise ValueError(f"Estratégia de chunking desconhecida: {strategy}. Opções: {', '.join(CHUNKING_STRATEGIES)}.")
+    source_file = doc_info.get("source", "FonteDesconhecida")
+    full_text = doc_info.get("text", "") # Este é o texto completo extraído
+
+    # Adiciona os metadados da ementa e outros relevantes ao chunk
+    # para que possam ser recuperados e usados no prompt ou exibição
+    chunk_metadata = {
+        "source_document": source_file,
+        "document_id": doc_info.get("document_id"), # Id do documento no DocumentRegistry
+        "ementa_original": doc_info.get("ementa_display_text", ""),
+        "outros_metadados_doc": doc_info.get("full_metadata_origem", {})
+    }
+
+    if not full_text.strip():
+        print(f"Alerta: Documento da fonte '{source_file}' não possui conteúdo textual para processar.")
+        return []
+
+    if strategy == "structure" and doc_info.get("blocks"):
+        return [
+            {
+                "source_document_chunk_specific": source_file,
+                "chunk_index": chunk_index,
+                "section": structured_chunk["section"],
+                "page_start": structured_chunk["page_start"],
+                "page_end": structured_chunk["page_end"],
+                "text_chunk": structured_chunk["text"],
+                "metadata_chunk": chunk_metadata
+            }
+            for chunk_index, structured_chunk in enumerate(chunk_blocks(doc_info["blocks"]))
+        ]
+
+    text_chunks = chunk_text(full_text, chunk_size=chunk_size, overlap=overlap)
+
+    return [
+        {
+            "source_document_chunk_specific": source_file, # Fonte específica do chunk
+            "chunk_index": chunk_index, # Posição do chunk no documento (fusão de vizinhos no contexto)
+            "text_chunk": chunk_content,
+            "metadata_chunk": chunk_metadata # Adiciona os metadados ao chunk
         }
+        for chunk_index, chunk_content in enumerate(text_chunks)
+        if chunk_content.strip()
+    ]
 
-        if not full_text.strip():
-            print(f"Alerta: Documento da fonte '{source_file}' não possui conteúdo textual para processar.")
-            continue
 
-        text_chunks = chunk_text(full_text)
-        
-        for chunk_content in text_chunks:
-            if chunk_content.strip():
-                all_chunks_with_source.append({
-                    "source_document_chunk_specific": source_file, # Fonte específica do chunk
-                    "text_chunk": chunk_content,
-                    "metadata_chunk": chunk_metadata # Adiciona os metadados ao chunk
-                })
+def process_documents_for_rag(documents_data, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP,
+                              chunking_strategy=DEFAULT_CHUNKING_STRATEGY, near_duplicate_filter=None):
+    """
+    Segmenta todos os documentos. Com `near_duplicate_filter` (NearDuplicateFilter), documentos
+    e chunks quase duplicados são colapsados nos seus representantes (ver `dedup`).
+    """
+    chunk_lists = (chunk_document(doc_info, chunk_size=chunk_size, overlap=overlap, strategy=chunking_strategy)
+                   for doc_info in documents_data)
+    return collect_chunks(chunk_lists, near_duplicate_filter=near_duplicate_filter)
+
+
+def collect_chunks(chunk_lists, near_duplicate_filter=None):
+    """Junta as listas de chunks de cada documento (em ordem), deduplicando como `process_documents_for_rag`."""
+    all_chunks_with_source = []
+    for chunks in chunk_lists:
+        if near_duplicate_filter is not None:
+            chunks = near_duplicate_filter.filter_document(chunks)
+        all_chunks_with_source.extend(chunks)
+    if near_duplicate_filter is not None:
+        near_duplicate_filter.attach(all_chunks_with_source)
 
     if not all_chunks_with_source:
         print("Alerta: Nenhum chunk de texto foi gerado.")
@@ -227,8 +419,31 @@ def process_documents_for_rag(documents_data):
 
 
 # --- Etapa 4: Criação do Vector Store (FAISS) ---
+def embed_texts(texts, embedding_model, embedding_cache=None, show_progress_bar=True):
+    """
+    Gera os embeddings de `texts` como matriz float32 (N x d), na mesma ordem.
+    Com `embedding_cache`, só os textos ausentes do cache vão para o modelo.
+    """
+    with timer("embedding", items=len(texts)):
+        if embedding_cache is not None:
+            embeddings = encode_with_cache(texts, embedding_model, embedding_cache, show_progress_bar=show_progress_bar)
+        else:
+            embeddings = embedding_model.encode(texts, show_progress_bar=show_progress_bar)
+    embeddings = np.asarray(embeddings, dtype='float32')
+    if embeddings.ndim == 1: # Caso de apenas um texto
+        embeddings = np.expand_dims(embeddings, axis=0)
+    return embeddings
+
+
 # (Função create_vector_store ligeiramente ajustada para lidar com a nova estrutura de chunks)
-def create_vector_store(chunks_with_metadata, embedding_model):
+def create_vector_store(chunks_with_metadata, embedding_model, embedding_cache=None,
+                        index_type="flat", quantization=None, index_options=None):
+    """
+    Gera os embeddings dos chunks e cria o índice FAISS. `index_type` pode ser
+    "flat" (busca exata), "ivf_flat", "ivf_pq", "hnsw" ou "auto" (escolhe pelo
+    tamanho do corpus); `quantization` pode ser None, "fp16" ou "sq8".
+    `index_options` repassa nlist/pq_m/hnsw_m/train_sample_size à fábrica de índices.
+    """
     if not chunks_with_metadata:
         print("Nenhum chunk de texto fornecido para criar o vector store.")
         return None, []
@@ -240,59 +455,271 @@ def create_vector_store(chunks_with_metadata, embedding_model):
         return None, []
 
     print(f"Gerando embeddings para {len(texts_to_embed)} chunks de texto...")
-    embeddings = embedding_model.encode(texts_to_embed, show_progress_bar=True)
+    embeddings = embed_texts(texts_to_embed, embedding_model, embedding_cache=embedding_cache)
     print("Embeddings gerados.")
 
-    if embeddings.ndim == 1: # Caso de apenas um texto
-        embeddings = np.expand_dims(embeddings, axis=0)
     if embeddings.shape[0] == 0: # Caso nenhum embedding tenha sido gerado
         print("Nenhum embedding foi gerado. O Vector Store não pode ser criado.")
         return None, []
 
 
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings.astype('float32'))
+    if index_type == "flat" and quantization is None:
+        import faiss
+        dimension = embeddings.shape[1]
+        index = faiss.IndexFlatL2(dimension)
+        index.add(embeddings)
+    else:
+        index = build_faiss_index(embeddings, index_type=index_type, quantization=quantization,
+                                  **(index_options or {}))
     print(f"Vector store FAISS criado com {index.ntotal} vetores.")
     # Retorna o índice e a lista original de chunks com metadados, pois ela contém mais info
     return index, chunks_with_metadata
 
 
+def open_embedding_cache(model_name=DEFAULT_EMBEDDING_MODEL_NAME, artifacts_dir=None):
+    """Abre o cache de embeddings compartilhado no diretório de artefatos (ou None se indisponível)."""
+    base_dir = artifacts_dir or DEFAULT_ARTIFACTS_DIR
+    try:
+        os.makedirs(base_dir, exist_ok=True)
+        return EmbeddingCache(os.path.join(base_dir, "embedding_cache.sqlite3"), model_name)
+    except Exception as e:
+        print(f"ALERTA: Cache de embeddings indisponível, todos os chunks serão codificados: {e}")
+        return None
+
+
+def embedding_model_id(embedding_model, default=DEFAULT_EMBEDDING_MODEL_NAME):
+    """Nome do modelo usado no fingerprint e no cache (o EmbeddingEngine inclui precisão/backend)."""
+    return getattr(embedding_model, "model_id", None) or default
+
+
+def load_or_build_vector_store(source_path, documents_data, embedding_model,
+                               model_name=None,
+                               chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP,
+                               artifacts_dir=None, mmap=True,
+                               index_type="flat", quantization=None, index_options=None,
+                               with_lexical_index=False, chunking_strategy=DEFAULT_CHUNKING_STRATEGY,
+                               dedup_threshold=DEFAULT_DEDUP_THRESHOLD, num_workers=None, with_fingerprint=False):
+    """
+    Reaproveita o vector store gravado em disco quando o fingerprint do corpus
+    (arquivo de origem + parâmetros de chunking + modelo) coincide; caso contrário,
+    gera os chunks e embeddings, cria o índice e o grava para as próximas execuções.
+    Com `with_lexical_index=True`, retorna também o índice BM25 dos mesmos chunks
+    (gravado no mesmo artefato): (index, chunks, lexical_index). Os chunks vêm em um
+    ChunkStore (sequência compacta, materializada sob demanda). `chunking_strategy`
+    escolhe o chunking (ver `chunk_document`) e entra no fingerprint.
+    Documentos e chunks com similaridade estimada >= `dedup_threshold` são indexados uma
+    única vez (ver `dedup`; None desativa) e a razão de deduplicação vai para o manifesto.
+    Com `documents_data=None`, os documentos só são lidos de `source_path` se o índice
+    precisar ser construído, e são descartados em seguida: quem serve consultas a partir do
+    artefato não mantém o corpus preparado em memória. Nesse caso a extração e o chunking
+    rodam no pool de processos de `parallel_preprocessing` (`num_workers`; padrão: todos os núcleos).
+    Com `with_fingerprint=True`, o fingerprint do artefato vem como último elemento da tupla
+    (ex.: a versão do índice para o AnswerCache).
+    """
+    model_name = model_name or embedding_model_id(embedding_model)
+    index_params = {"index_type": index_type, "quantization": quantization, "index_options": index_options or {},
+                    **chunking_params(chunking_strategy), **dedup_params(dedup_threshold)}
+    fingerprint = compute_corpus_fingerprint(source_path, model_name, chunk_size, overlap, extra_params=index_params)
+    extra_results = (fingerprint,) if with_fingerprint else ()
+    index, chunks_with_metadata = load_vector_store(fingerprint, artifacts_dir=artifacts_dir, mmap=mmap)
+    if index is not None:
+        if with_lexical_index:
+            return (index, chunks_with_metadata,
+                    _load_or_build_lexical_index(fingerprint, chunks_with_metadata, artifacts_dir)) + extra_results
+        return (index, chunks_with_metadata) + extra_results
+
+    print(f"Nenhum vector store em disco para o fingerprint {fingerprint}. Construindo...")
+    near_duplicate_filter = NearDuplicateFilter(dedup_threshold) if dedup_threshold is not None else None
+    if documents_data is None:
+        # Importados aqui: ambos dependem deste módulo
+        from ingestion import iter_document_chunks
+        chunk_lists = iter_document_chunks(source_path, num_workers=num_workers, chunk_size=chunk_size,
+                                           overlap=overlap, chunking_strategy=chunking_strategy)
+        all_chunks = collect_chunks(chunk_lists, near_duplicate_filter=near_duplicate_filter)
+    else:
+        all_chunks = process_documents_for_rag(documents_data, chunk_size=chunk_size, overlap=overlap,
+                                               chunking_strategy=chunking_strategy,
+                                               near_duplicate_filter=near_duplicate_filter)
+    manifest_extra = {"model_name": model_name, "source_path": os.path.abspath(source_path)}
+    if near_duplicate_filter is not None:
+        manifest_extra["dedup"] = near_duplicate_filter.print_report()
+    embedding_cache = open_embedding_cache(model_name, artifacts_dir=artifacts_dir)
+    try:
+        index, chunks_with_metadata = create_vector_store(all_chunks, embedding_model, embedding_cache=embedding_cache,
+                                                          index_type=index_type, quantization=quantization,
+                                                          index_options=index_options)
+    finally:
+        if embedding_cache is not None:
+            embedding_cache.close()
+    if index is not None:
+        # Mesma representação compacta do store carregado do disco
+        chunks_with_metadata = ChunkStore.from_chunks(chunks_with_metadata)
+        try:
+            save_vector_store(index, chunks_with_metadata, fingerprint, artifacts_dir=artifacts_dir,
+                              manifest_extra=manifest_extra)
+        except Exception as e:
+            # Falha ao gravar não impede o uso do índice em memória.
+            print(f"ALERTA: Não foi possível salvar o vector store em disco: {e}")
+    if with_lexical_index:
+        lexical_index = _load_or_build_lexical_index(fingerprint, chunks_with_metadata, artifacts_dir) if index is not None else None
+        return (index, chunks_with_metadata, lexical_index) + extra_results
+    return (index, chunks_with_metadata) + extra_results
+
+
+def _load_or_build_lexical_index(fingerprint, chunks_with_metadata, artifacts_dir=None):
+    """Carrega o índice BM25 gravado junto ao vector store ou o constrói a partir dos chunks."""
+    path = artifact_file_path(fingerprint, LEXICAL_INDEX_FILE_NAME, artifacts_dir=artifacts_dir)
+    if os.path.exists(path):
+        try:
+            return BM25Index.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"ALERTA: Falha ao carregar o índice lexical de '{path}': {e}. Reconstruindo...")
+    lexical_index = BM25Index.build(chunks_with_metadata)
+    try:
+        lexical_index.save(path)
+    except OSError as e:
+        print(f"ALERTA: Não foi possível salvar o índice lexical em disco: {e}")
+    return lexical_index
+
+
 # --- Etapa 5: Recuperação (Retrieval) ---
+def _lookup_chunk(chunks_ref, idx):
+    """
+    Resolve o id devolvido pelo FAISS para o chunk correspondente. `chunks_ref` pode ser
+    a lista de chunks (id = posição) ou um dicionário id estável -> chunk (ver IndexManager).
+    """
+    if isinstance(chunks_ref, dict):
+        return chunks_ref.get(idx)
+    if 0 <= idx < len(chunks_ref):
+        return chunks_ref[idx]
+    return None
+
+
+SEARCH_MODES = ("dense", "lexical", "hybrid")
+
+
+def _dense_search_ids(queries, vector_store_index, embedding_model, top_k, nprobe=None, ef_search=None,
+                      selector=None):
+    """
+    Busca semântica no FAISS para uma lista de queries: um único `encode` e uma única
+    busca matricial. Retorna, para cada query, os ids dos chunks em ordem de relevância.
+    Com `selector` (IDSelector), só os ids selecionados são considerados na busca.
+    """
+    with timer("query_embedding", items=len(queries)):
+        query_embeddings = np.asarray(embedding_model.encode(list(queries)), dtype='float32')
+    if query_embeddings.ndim == 1:
+         query_embeddings = np.expand_dims(query_embeddings, axis=0)
+
+    print(f"Buscando {top_k} chunks mais relevantes...")
+    with timer("index_search", items=len(query_embeddings), index_type=type(vector_store_index).__name__):
+        distances, indices = search_index(vector_store_index, query_embeddings, top_k, nprobe=nprobe,
+                                          ef_search=ef_search, selector=selector)
+    # FAISS devolve -1 quando há menos de top_k vetores no índice
+    return [[int(idx) for idx in row if idx >= 0] for row in indices]
+
+
 # (Função retrieve_relevant_chunks ajustada para usar a lista de chunks com metadados)
-def retrieve_relevant_chunks(query, vector_store_index, all_chunks_with_metadata_list, embedding_model, top_k=3):
-    if vector_store_index is None or vector_store_index.ntotal == 0:
-        print("Vector store não inicializado ou vazio.")
-        return []
+def retrieve_relevant_chunks(query, vector_store_index, all_chunks_with_metadata_list, embedding_model, top_k=3,
+                             nprobe=None, ef_search=None, lexical_index=None, search_mode="dense",
+                             candidate_k=None, rrf_k=60, filters=None, filter_index=None):
+    """
+    Busca os `top_k` chunks mais relevantes para a query. `nprobe` (índices IVF) e
+    `ef_search` (HNSW) ajustam o compromisso latência/recall da busca densa.
+
+    `search_mode`: "dense" (embeddings), "lexical" (BM25 em `lexical_index`) ou "hybrid",
+    que busca `candidate_k` candidatos (padrão: 4 x top_k) em cada lado e os combina
+    por Reciprocal Rank Fusion.
+
+    `filters` restringe a busca por metadados, ex.: {"relator": "Og Fernandes",
+    "classe": ["AGINT", "RESP"], "tribunal": "STJ", "uf": "SC", "date_from": "2020-01-01",
+    "date_to": "2021-12-31"}. Os ids permitidos vêm das listas de postings de
+    `filter_index` (MetadataFilterIndex) e são aplicados dentro da busca: no FAISS via
+    IDSelector e no BM25 zerando os demais chunks, então o top_k vem só dos permitidos.
+    """
     if not query:
         print("Query vazia.")
         return []
+    if search_mode != "lexical":
+        print(f"Gerando embedding para a query: '{query}'")
+    relevant_chunks_data = retrieve_relevant_chunks_batch(
+        [query], vector_store_index, all_chunks_with_metadata_list, embedding_model, top_k=top_k,
+        nprobe=nprobe, ef_search=ef_search, lexical_index=lexical_index, search_mode=search_mode,
+        candidate_k=candidate_k, rrf_k=rrf_k, filters=filters, filter_index=filter_index,
+    )[0]
+    print(f"{len(relevant_chunks_data)} chunks relevantes encontrados.")
+    return relevant_chunks_data
 
-    print(f"Gerando embedding para a query: '{query}'")
-    query_embedding = embedding_model.encode([query])
-    if query_embedding.ndim == 1:
-         query_embedding = np.expand_dims(query_embedding, axis=0)
 
-    print(f"Buscando {top_k} chunks mais relevantes...")
-    distances, indices = vector_store_index.search(query_embedding.astype('float32'), top_k)
-    
-    relevant_chunks_data = []
-    if indices.size > 0:
-        for i in range(len(indices[0])):
-            idx = indices[0][i]
-            if 0 <= idx < len(all_chunks_with_metadata_list):
+@METRICS.timed("retrieval")
+def retrieve_relevant_chunks_batch(queries, vector_store_index, all_chunks_with_metadata_list, embedding_model,
+                                   top_k=3, nprobe=None, ef_search=None, lexical_index=None, search_mode="dense",
+                                   candidate_k=None, rrf_k=60, filters=None, filter_index=None):
+    """
+    Versão em lote de `retrieve_relevant_chunks` (mesmos parâmetros; `filters` vale para
+    todas as queries): as N queries são codificadas em uma única chamada ao modelo e
+    buscadas em uma única busca matricial no FAISS. Retorna uma lista de chunks
+    relevantes por query, na ordem de `queries` (lista vazia para queries vazias).
+    """
+    if search_mode not in SEARCH_MODES:
+        raise ValueError(f"Modo de busca desconhecido: {search_mode}. Opções: {', '.join(SEARCH_MODES)}.")
+    results = [[] for _ in queries]
+    if search_mode != "dense" and lexical_index is None:
+        print(f"ALERTA: Modo '{search_mode}' sem índice lexical; usando apenas a busca densa.")
+        search_mode = "dense"
+    if search_mode != "lexical" and (vector_store_index is None or vector_store_index.ntotal == 0):
+        print("Vector store não inicializado ou vazio.")
+        return results
+    positions = [position for position, query in enumerate(queries) if query]
+    if not positions:
+        return results
+    active_queries = [queries[position] for position in positions]
+
+    allowed_ids = None
+    selector = None
+    if filters:
+        if filter_index is None:
+            print("ALERTA: Filtros sem índice de metadados; construindo um agora (prefira reutilizar o índice).")
+            filter_index = MetadataFilterIndex.build(all_chunks_with_metadata_list)
+        allowed_ids = filter_index.select_ids(filters)
+        if allowed_ids is not None:
+            if not len(allowed_ids):
+                print("Nenhum chunk atende aos filtros informados.")
+                return results
+            print(f"Filtros aplicados: {len(allowed_ids)} chunks elegíveis.")
+            selector = make_id_selector(allowed_ids)
+
+    if search_mode == "dense":
+        ids_per_query = _dense_search_ids(active_queries, vector_store_index, embedding_model, top_k, nprobe,
+                                          ef_search, selector)
+    elif search_mode == "lexical":
+        with timer("lexical_search", items=len(active_queries)):
+            ids_per_query = [lexical_index.search(query, top_k, allowed_ids=allowed_ids)[0].tolist()
+                             for query in active_queries]
+    else:
+        candidate_k = candidate_k or 4 * top_k
+        dense_ids_per_query = _dense_search_ids(active_queries, vector_store_index, embedding_model, candidate_k,
+                                                nprobe, ef_search, selector)
+        with timer("lexical_search", items=len(active_queries)):
+            lexical_ids_per_query = [lexical_index.search(query, candidate_k, allowed_ids=allowed_ids)[0].tolist()
+                                     for query in active_queries]
+        ids_per_query = [reciprocal_rank_fusion([dense_ids, lexical_ids], k=rrf_k)[:top_k]
+                         for dense_ids, lexical_ids in zip(dense_ids_per_query, lexical_ids_per_query)]
+
+    for position, chunk_ids in zip(positions, ids_per_query):
+        for idx in chunk_ids:
+            chunk = _lookup_chunk(all_chunks_with_metadata_list, idx)
+            if chunk is not None:
                 # Retorna o objeto completo do chunk, que inclui o texto e os metadados
-                relevant_chunks_data.append(all_chunks_with_metadata_list[idx])
+                results[position].append(chunk)
             else:
                 print(f"Alerta: Índice {idx} fora do intervalo da lista de chunks (tamanho: {len(all_chunks_with_metadata_list)}).")
-    
-    print(f"{len(relevant_chunks_data)} chunks relevantes encontrados.")
-    return relevant_chunks_data
+    return results
 
 
 # --- Etapa 6: Geração da Resposta com LLM ---
 # (Função generate_response_with_llm ajustada para usar metadados se necessário)
-def generate_response_with_llm(query, relevant_chunks_data, llm_model):
+def build_rag_prompt(query, relevant_chunks_data):
+    """Monta o prompt enviado ao LLM com os trechos recuperados e as fontes consultadas."""
     if not relevant_chunks_data:
         context_from_chunks = "Nenhuma informação específica encontrada nos documentos para esta pergunta."
         sources_info = "Nenhuma fonte específica."
@@ -304,8 +731,7 @@ def generate_response_with_llm(query, relevant_chunks_data, llm_model):
         # Poderia também incluir as ementas aqui se quisesse mostrá-las no prompt ou na resposta
         # ementas_citadas = "\n".join([f"Ementa de {chunk_data['metadata_chunk']['source_document']}:\n{chunk_data['metadata_chunk']['ementa_original']}\n" for chunk_data in relevant_chunks_data])
 
-
-    prompt = f"""
+    return f"""
     Você é VeritasJuris, um assistente de IA especializado em Direito brasileiro.
     Sua tarefa é responder à pergunta do usuário de forma clara, concisa e fundamentada EXCLUSIVAMENTE
     nas informações contidas nos seguintes trechos de jurisprudência.
@@ -323,11 +749,148 @@ def generate_response_with_llm(query, relevant_chunks_data, llm_model):
 
     {sources_info}
     """
+
+
+def _observe_llm_sizes(prompt, answer):
+    """Tamanhos (tokens estimados) do prompt e da resposta de uma chamada ao LLM."""
+    observe("llm_prompt_tokens", estimate_tokens(prompt))
+    observe("llm_response_tokens", estimate_tokens(answer))
+
+
+def _answer_cache_args(query, relevant_chunks_data, llm_model):
+    """Argumentos (query, ids dos chunks, versão do prompt, modelo) da chave no AnswerCache."""
+    return (query, [chunk_cache_id(chunk) for chunk in relevant_chunks_data], PROMPT_VERSION,
+            llm_model_id(llm_model))
+
+
+def generate_response_with_llm(query, relevant_chunks_data, llm_model, answer_cache=None, query_vector=None,
+                               index_version=None):
+    """
+    Gera a resposta fundamentada nos chunks. Com `answer_cache` (AnswerCache), respostas
+    para a mesma pergunta e contexto (ou, com `query_vector`, uma pergunta semanticamente
+    equivalente) são reaproveitadas sem chamar o LLM; `index_version` invalida o cache
+    quando o índice muda.
+    """
+    if answer_cache is not None:
+        cache_args = _answer_cache_args(query, relevant_chunks_data, llm_model)
+        cached_answer, hit_type = answer_cache.get(*cache_args, query_vector=query_vector,
+                                                   index_version=index_version)
+        if cached_answer is not None:
+            print(f"Resposta obtida do cache ({hit_type}).")
+            return cached_answer
+    prompt = build_rag_prompt(query, relevant_chunks_data)
     print("Gerando resposta com LLM (baseado em chunks)...")
     try:
-        response = llm_model.generate_content(prompt)
+        with timer("llm_call", model=llm_model_id(llm_model)):
+            response = llm_model.generate_content(prompt)
+        _observe_llm_sizes(prompt, response.text)
         print("Resposta gerada.")
+        if answer_cache is not None:
+            answer_cache.put(*cache_args, response.text, query_vector=query_vector, index_version=index_version)
         return response.text
     except Exception as e:
         print(f"Erro ao gerar resposta com o LLM: {e}")
-        return "Ocorreu um erro ao tentar gerar a resposta principal. Por favor, tente novamente."
\ No newline at end of file
+        return "Ocorreu um erro ao tentar gerar a resposta principal. Por favor, tente novamente."
+
+
+def stream_response_with_llm(query, relevant_chunks_data, llm_model, answer_cache=None, query_vector=None,
+                             index_version=None):
+    """
+    Versão em streaming de `generate_response_with_llm`: gera os pedaços de texto à medida
+    que o LLM os produz. Aceita qualquer cliente com `generate_content(prompt, stream=True)`
+    que devolva um iterável de pedaços com `.text` (Gemini, `MockLLM`) ou de strings.
+    Uma resposta em cache é devolvida de uma vez; a gerada é guardada ao terminar.
+    """
+    if answer_cache is not None:
+        cache_args = _answer_cache_args(query, relevant_chunks_data, llm_model)
+        cached_answer, hit_type = answer_cache.get(*cache_args, query_vector=query_vector,
+                                                   index_version=index_version)
+        if cached_answer is not None:
+            print(f"Resposta obtida do cache ({hit_type}).")
+            yield cached_answer
+            return
+    prompt = build_rag_prompt(query, relevant_chunks_data)
+    print("Gerando resposta com LLM em streaming (baseado em chunks)...")
+    try:
+        pieces = []
+        with timer("llm_call", model=llm_model_id(llm_model), streaming=True) as llm_timer:
+            for piece in llm_model.generate_content(prompt, stream=True):
+                text = piece if isinstance(piece, str) else piece.text
+                if text:
+                    if not pieces:
+                        observe("llm_first_token_seconds", time.perf_counter() - llm_timer.start)
+                    pieces.append(text)
+                    yield text
+        _observe_llm_sizes(prompt, "".join(pieces))
+        print("Resposta gerada.")
+        if answer_cache is not None:
+            answer_cache.put(*cache_args, "".join(pieces), query_vector=query_vector, index_version=index_version)
+    except Exception as e:
+        print(f"Erro ao gerar resposta com o LLM: {e}")
+        yield "\n\nOcorreu um erro ao tentar gerar a resposta principal. Por favor, tente novamente."
+
+
+DEFAULT_LLM_CONCURRENCY = 8
+DEFAULT_QUERY_BATCH_SIZE = 256
+
+
+def generate_responses_batch(queries, relevant_chunks_per_query, llm_model, max_concurrency=DEFAULT_LLM_CONCURRENCY,
+                             answer_cache=None, index_version=None):
+    """
+    Gera as respostas de várias queries com no máximo `max_concurrency` chamadas ao LLM
+    em paralelo. Uma falha afeta apenas a sua query: cada resultado é um dicionário
+    {"query", "answer", "error"}, com `answer` None e a mensagem em `error` quando falha.
+    Com `answer_cache`, perguntas repetidas (nível exato) não chamam o LLM.
+    """
+    def generate(query, relevant_chunks_data):
+        if not query:
+            return {"query": query, "answer": None, "error": "Query vazia."}
+        if answer_cache is not None:
+            cache_args = _answer_cache_args(query, relevant_chunks_data, llm_model)
+            cached_answer, _ = answer_cache.get(*cache_args, index_version=index_version)
+            if cached_answer is not None:
+                return {"query": query, "answer": cached_answer, "error": None}
+        try:
+            prompt = build_rag_prompt(query, relevant_chunks_data)
+            with timer("llm_call", model=llm_model_id(llm_model)):
+                response = llm_model.generate_content(prompt)
+            _observe_llm_sizes(prompt, response.text)
+            if answer_cache is not None:
+                answer_cache.put(*cache_args, response.text, index_version=index_version)
+            return {"query": query, "answer": response.text, "error": None}
+        except Exception as e:
+            return {"query": query, "answer": None, "error": f"{type(e).__name__}: {e}"}
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        results = list(executor.map(generate, queries, relevant_chunks_per_query))
+    failures = sum(1 for result in results if result["error"])
+    print(f"{len(results)} respostas geradas em lote ({failures} com erro).")
+    return results
+
+
+def answer_queries_batch(queries, vector_store_index, all_chunks_with_metadata_list, embedding_model, llm_model,
+                         top_k=3, batch_size=DEFAULT_QUERY_BATCH_SIZE, max_concurrency=DEFAULT_LLM_CONCURRENCY,
+                         answer_cache=None, context_options=None, **search_options):
+    """
+    Responde uma lista de perguntas: recuperação em lotes de `batch_size` queries (um
+    encode e uma busca matricial por lote) e geração concorrente com o LLM. Retorna um
+    dicionário por query com "query", "answer", "error" e "sources" (fileNames citados).
+    Com `context_options` (dicionário, possivelmente vazio), os chunks de cada query passam
+    por `build_context` (fusão, deduplicação e orçamento de tokens) antes do prompt.
+    """
+    queries = list(queries)
+    relevant_chunks_per_query = []
+    for start in range(0, len(queries), batch_size):
+        relevant_chunks_per_query.extend(retrieve_relevant_chunks_batch(
+            queries[start:start + batch_size], vector_store_index, all_chunks_with_metadata_list, embedding_model,
+            top_k=top_k, **search_options,
+        ))
+    if context_options is not None:
+        relevant_chunks_per_query = [build_context(query, relevant_chunks_data, **context_options)
+                                     for query, relevant_chunks_data in zip(queries, relevant_chunks_per_query)]
+    results = generate_responses_batch(queries, relevant_chunks_per_query, llm_model, max_concurrency=max_concurrency,
+                                       answer_cache=answer_cache)
+    for result, relevant_chunks_data in zip(results, relevant_chunks_per_query):
+        result["sources"] = list(dict.fromkeys(chunk["metadata_chunk"]["source_document"]
+                                               for chunk in relevant_chunks_data))
+    return results
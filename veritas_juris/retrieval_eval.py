@@ -0,0 +1,306 @@
+# retrieval_eval.py
+"""
+Avaliação offline da qualidade da recuperação, para comparar configurações.
+
+Toda otimização de velocidade no chunking (estratégia, chunk_size/overlap), no tipo
+de índice ou na precisão do embedding troca latência por qualidade. Este módulo
+roda um conjunto de perguntas rotuladas por cada configuração e mede recall@k, MRR
+e nDCG@k junto com a latência de cada pergunta, lado a lado.
+
+Conjunto rotulado (JSON Lines), uma pergunta por linha:
+    {"query": "...", "relevant": ["HC-399109-2018-08-31.pdf", ...]}
+    {"query": "...", "relevant_spans": [{"fileName": "...", "text": "trecho", "page": 3}]}
+Com "relevant", a relevância é por documento: a lista ranqueada é a dos documentos
+distintos dos chunks recuperados, na ordem do primeiro chunk de cada um. Com
+"relevant_spans", é por chunk: um chunk é relevante se for do documento e contiver
+o trecho (sem diferenciar maiúsculas/espaços) e, com "page", cobrir a página; cada
+trecho conta uma única vez.
+
+Configurações (arquivo JSON com uma lista): cada item tem "name" e as opções de
+`load_or_build_vector_store`/`retrieve_relevant_chunks_batch`: "chunking",
+"chunk_size", "overlap", "dedup_threshold" (null desativa a deduplicação),
+"index_type", "quantization", "index_options", "nprobe", "ef_search",
+"search_mode", "precision", "backend" e "top_k" (chunks recuperados).
+A primeira configuração é a referência: com `--max-quality-drop`, a recomendação é a
+mais rápida (latência p50) cujo nDCG não caiu mais que isso em relação a ela.
+
+Uso:
+    python retrieval_eval.py data/eval_queries.jsonl --out avaliacao.json
+    python retrieval_eval.py data/eval_queries.jsonl --configs configs.json --stub-embeddings
+"""
+import argparse
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+from dedup import DEFAULT_DEDUP_THRESHOLD
+from embedding_engine import HashingEmbeddingModel, load_embedding_engine
+from rag_pipeline import (
+    DEFAULT_CHUNK_OVERLAP,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_CHUNKING_STRATEGY,
+    load_or_build_vector_store,
+    load_processes_from_original_json,
+    retrieve_relevant_chunks_batch,
+)
+
+DEFAULT_DATA_FILE = os.path.join(os.path.dirname(__file__), "data", "processo.json")
+DEFAULT_KS = (1, 3, 5, 10)
+DEFAULT_MAX_QUALITY_DROP = 0.02
+DEFAULT_CONFIGS = [
+    {"name": "estrutura · flat · híbrida", "chunking": "structure", "index_type": "flat", "search_mode": "hybrid"},
+    {"name": "estrutura · flat · densa", "chunking": "structure", "index_type": "flat", "search_mode": "dense"},
+    {"name": "estrutura · flat · BM25", "chunking": "structure", "index_type": "flat", "search_mode": "lexical"},
+    {"name": "palavras 500/50 · flat · híbrida", "chunking": "words", "chunk_size": 500, "overlap": 50,
+     "index_type": "flat", "search_mode": "hybrid"},
+    {"name": "palavras 250/25 · flat · híbrida", "chunking": "words", "chunk_size": 250, "overlap": 25,
+     "index_type": "flat", "search_mode": "hybrid"},
+    {"name": "estrutura · hnsw(ef=16) · híbrida", "chunking": "structure", "index_type": "hnsw", "ef_search": 16,
+     "search_mode": "hybrid"},
+    {"name": "estrutura · flat · híbrida · sem dedup", "chunking": "structure", "index_type": "flat",
+     "search_mode": "hybrid", "dedup_threshold": None},
+]
+
+
+def load_labeled_queries(path):
+    """Lê o conjunto rotulado (ver docstring do módulo), ignorando linhas vazias."""
+    labeled_queries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if not item.get("query") or not (item.get("relevant") or item.get("relevant_spans")):
+                raise ValueError(f"Linha {line_number} de '{path}' sem 'query' ou sem 'relevant'/'relevant_spans'.")
+            labeled_queries.append(item)
+    return labeled_queries
+
+
+def _normalize_text(text):
+    return " ".join(text.lower().split())
+
+
+def _chunk_matches_span(chunk, span):
+    if chunk["metadata_chunk"]["source_document"] != span["fileName"]:
+        return False
+    if span.get("text") and _normalize_text(span["text"]) not in _normalize_text(chunk["text_chunk"]):
+        return False
+    page = span.get("page")
+    if page is not None:
+        page_start, page_end = chunk.get("page_start"), chunk.get("page_end")
+        if page_start is not None and page_end is not None and not page_start <= page <= page_end:
+            return False
+    return True
+
+
+def judge_results(labeled_query, relevant_chunks_data):
+    """
+    Relevância binária de cada posição da lista ranqueada e o total de itens relevantes:
+    documentos distintos (rótulo "relevant") ou chunks (rótulo "relevant_spans").
+    """
+    spans = labeled_query.get("relevant_spans")
+    if spans:
+        matched_spans = set()
+        gains = []
+        for chunk in relevant_chunks_data:
+            gain = 0
+            for span_number, span in enumerate(spans):
+                if span_number not in matched_spans and _chunk_matches_span(chunk, span):
+                    matched_spans.add(span_number)
+                    gain = 1
+                    break
+            gains.append(gain)
+        return gains, len(spans)
+
+    relevant_documents = set(labeled_query["relevant"])
+    ranked_documents = list(dict.fromkeys(chunk["metadata_chunk"]["source_document"] for chunk in relevant_chunks_data))
+    return [1 if document in relevant_documents else 0 for document in ranked_documents], len(relevant_documents)
+
+
+def recall_at_k(gains, num_relevant, k):
+    return sum(gains[:k]) / num_relevant if num_relevant else 0.0
+
+
+def reciprocal_rank(gains):
+    for rank, gain in enumerate(gains, start=1):
+        if gain:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at_k(gains, num_relevant, k):
+    dcg = sum(gain / math.log2(rank + 1) for rank, gain in enumerate(gains[:k], start=1))
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(num_relevant, k) + 1))
+    return dcg / ideal if ideal else 0.0
+
+
+def _embedding_model_for(config, models, stub_embeddings):
+    """Um modelo por (precisão, backend), reaproveitado entre as configurações."""
+    if stub_embeddings:
+        key = ("stub",)
+        if key not in models:
+            models[key] = HashingEmbeddingModel()
+        return models[key]
+    key = (config.get("precision", "float32"), config.get("backend", "torch"))
+    if key not in models:
+        models[key] = load_embedding_engine(precision=key[0], backend=key[1])
+    return models[key]
+
+
+def evaluate_config(config, labeled_queries, documents, data_path, embedding_model, ks=DEFAULT_KS,
+                    batch_size=1, artifacts_dir=None):
+    """
+    Avalia uma configuração: carrega (ou constrói) o índice e roda as perguntas em lotes de
+    `batch_size` (1 = latência real de cada pergunta; maior = latência amortizada do lote).
+    Retorna as médias das métricas, os percentis de latência e o detalhe por pergunta.
+    """
+    index_options = dict(config.get("index_options") or {})
+    start = time.perf_counter()
+    index, chunks, lexical_index = load_or_build_vector_store(
+        data_path, documents, embedding_model,
+        chunk_size=config.get("chunk_size", DEFAULT_CHUNK_SIZE), overlap=config.get("overlap", DEFAULT_CHUNK_OVERLAP),
+        artifacts_dir=artifacts_dir, index_type=config.get("index_type", "flat"),
+        quantization=config.get("quantization"), index_options=index_options, with_lexical_index=True,
+        chunking_strategy=config.get("chunking", DEFAULT_CHUNKING_STRATEGY),
+        dedup_threshold=config.get("dedup_threshold", DEFAULT_DEDUP_THRESHOLD),
+    )
+    index_seconds = time.perf_counter() - start
+    if index is None:
+        return {"name": config.get("name"), "config": config, "error": "Índice não pôde ser construído."}
+
+    # Na relevância por documento, vários chunks podem ser do mesmo acórdão: busca mais fundo
+    top_k = config.get("top_k", 3 * max(ks))
+    search_options = {"top_k": top_k, "nprobe": config.get("nprobe"), "ef_search": config.get("ef_search"),
+                      "lexical_index": lexical_index, "search_mode": config.get("search_mode", "dense")}
+    queries = [item["query"] for item in labeled_queries]
+    results = []
+    latencies = []
+    for batch_start in range(0, len(queries), batch_size):
+        batch = queries[batch_start:batch_start + batch_size]
+        start = time.perf_counter()
+        results.extend(retrieve_relevant_chunks_batch(batch, index, chunks, embedding_model, **search_options))
+        latencies.extend([(time.perf_counter() - start) / len(batch)] * len(batch))
+
+    per_query = []
+    for item, relevant_chunks_data, latency in zip(labeled_queries, results, latencies):
+        gains, num_relevant = judge_results(item, relevant_chunks_data)
+        query_report = {"query": item["query"], "latency_ms": round(latency * 1000, 3),
+                        "mrr": reciprocal_rank(gains), "first_relevant_rank": None}
+        for k in ks:
+            query_report[f"recall@{k}"] = recall_at_k(gains, num_relevant, k)
+            query_report[f"ndcg@{k}"] = ndcg_at_k(gains, num_relevant, k)
+        if query_report["mrr"]:
+            query_report["first_relevant_rank"] = round(1 / query_report["mrr"])
+        per_query.append(query_report)
+
+    metric_names = ["mrr"] + [f"{metric}@{k}" for k in ks for metric in ("recall", "ndcg")]
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "name": config.get("name"),
+        "config": config,
+        "num_queries": len(per_query),
+        "num_chunks": len(chunks),
+        "index_seconds": round(index_seconds, 3),
+        "metrics": {name: round(float(np.mean([report[name] for report in per_query])), 4) for name in metric_names},
+        "latency_ms": {
+            "mean": round(float(latencies_ms.mean()), 3),
+            "p50": round(float(np.percentile(latencies_ms, 50)), 3),
+            "p95": round(float(np.percentile(latencies_ms, 95)), 3),
+        },
+        "per_query": per_query,
+    }
+
+
+def valid_reports_of(reports):
+    """Relatórios das configurações que rodaram sem erro; o primeiro é a referência."""
+    return [report for report in reports if "error" not in report]
+
+
+def recommend_config(reports, quality_metric, max_quality_drop=DEFAULT_MAX_QUALITY_DROP):
+    """A configuração mais rápida (p50) cuja `quality_metric` fica a até `max_quality_drop` da primeira válida."""
+    valid_reports = valid_reports_of(reports)
+    if not valid_reports:
+        return None
+    reference_quality = valid_reports[0]["metrics"][quality_metric]
+    candidates = [report for report in valid_reports
+                  if report["metrics"][quality_metric] >= reference_quality - max_quality_drop]
+    return min(candidates, key=lambda report: report["latency_ms"]["p50"])
+
+
+def format_comparison(reports, ks=DEFAULT_KS):
+    """Tabela lado a lado: uma linha por configuração."""
+    k_max = max(ks)
+    columns = [f"R@{k}" for k in ks] + ["MRR", f"nDCG@{k_max}", "p50 ms", "p95 ms", "chunks"]
+    lines = [f"{'configuração':<36} " + " ".join(f"{column:>8}" for column in columns)]
+    for report in reports:
+        name = (report["name"] or "")[:36]
+        if "error" in report:
+            lines.append(f"{name:<36} ERRO: {report['error']}")
+            continue
+        metrics = report["metrics"]
+        values = [metrics[f"recall@{k}"] for k in ks] + [metrics["mrr"], metrics[f"ndcg@{k_max}"]]
+        cells = [f"{value:>8.3f}" for value in values]
+        cells += [f"{report['latency_ms']['p50']:>8.2f}", f"{report['latency_ms']['p95']:>8.2f}",
+                  f"{report['num_chunks']:>8}"]
+        lines.append(f"{name:<36} " + " ".join(cells))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Avalia a qualidade da recuperação de várias configurações.")
+    parser.add_argument("queries_path", help="Perguntas rotuladas (.jsonl com 'relevant' ou 'relevant_spans')")
+    parser.add_argument("--data", default=DEFAULT_DATA_FILE, help="JSON original dos acórdãos")
+    parser.add_argument("--configs", help="JSON com a lista de configurações (padrão: DEFAULT_CONFIGS)")
+    parser.add_argument("--ks", type=int, nargs="+", default=list(DEFAULT_KS))
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Perguntas por busca (1 mede a latência de cada pergunta isoladamente)")
+    parser.add_argument("--artifacts-dir", help="Diretório dos índices (reaproveitados entre execuções)")
+    parser.add_argument("--stub-embeddings", action="store_true",
+                        help="Usa o HashingEmbeddingModel (offline) em vez do SentenceTransformer")
+    parser.add_argument("--max-quality-drop", type=float, default=DEFAULT_MAX_QUALITY_DROP,
+                        help="Queda máxima de nDCG em relação à primeira configuração para a recomendação")
+    parser.add_argument("--out", help="Grava o relatório completo (com o detalhe por pergunta) em JSON")
+    args = parser.parse_args()
+
+    labeled_queries = load_labeled_queries(args.queries_path)
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs, 'r', encoding='utf-8') as f:
+            configs = json.load(f)
+    documents = load_processes_from_original_json(args.data)
+
+    models = {}
+    reports = []
+    for config in configs:
+        print(f"Avaliando '{config.get('name')}'...")
+        embedding_model = _embedding_model_for(config, models, args.stub_embeddings)
+        try:
+            reports.append(evaluate_config(config, labeled_queries, documents, args.data, embedding_model,
+                                           ks=args.ks, batch_size=args.batch_size,
+                                           artifacts_dir=args.artifacts_dir))
+        except (RuntimeError, ValueError) as e:
+            print(f"ERRO: Configuração '{config.get('name')}' falhou: {e}")
+            reports.append({"name": config.get("name"), "config": config, "error": str(e)})
+
+    print()
+    print(format_comparison(reports, ks=args.ks))
+    quality_metric = f"ndcg@{max(args.ks)}"
+    recommended = recommend_config(reports, quality_metric, args.max_quality_drop)
+    if recommended is not None:
+        print(f"\nRecomendada: '{recommended['name']}' (mais rápida com {quality_metric} até "
+              f"{args.max_quality_drop} abaixo da referência '{valid_reports_of(reports)[0]['name']}').")
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "queries_path": args.queries_path,
+                       "data": args.data, "ks": args.ks, "reports": reports,
+                       "recommended": recommended["name"] if recommended else None},
+                      f, ensure_ascii=False, indent=2)
+        print(f"Relatório gravado em {args.out}.")
+
+
+if __name__ == "__main__":
+    main()
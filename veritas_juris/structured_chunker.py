@@ -0,0 +1,133 @@
+# structured_chunker.py
+"""
+Chunking orientado à estrutura do acórdão.
+
+Em vez de cortar o texto achatado em janelas fixas de palavras, o chunker percorre
+os blocos de cada página do `processo.json` (ementa, acórdão, relatório, voto,
+certidão...) e monta chunks alinhados às seções: cada unidade de texto (o `body`,
+cada item de `points`, cada parágrafo) é acrescentada ao chunk corrente até ele
+atingir o tamanho-alvo, sem nunca passar do máximo, e uma nova seção principal
+começa um novo chunk. Cada chunk registra a seção e as páginas de origem.
+
+As unidades são as próprias strings do JSON: o texto de um chunk é montado com
+um único `join` das suas unidades, sem `split()`/re-`join` do documento inteiro.
+Só unidades maiores que o máximo são divididas (por frases e, em último caso,
+por palavras).
+"""
+import re
+
+from context_builder import estimate_tokens
+
+DEFAULT_TARGET_CHUNK_TOKENS = 384
+DEFAULT_MAX_CHUNK_TOKENS = 640
+
+# Prefixo da chave do bloco -> seção principal (o prefixo mais longo vence)
+SECTION_PREFIXES = {
+    "ementa": "ementa",
+    "acordao": "acordao",
+    "relatorio": "relatorio",
+    "voto": "voto",
+    "decisao_voto": "voto",
+    "decisao_final_voto": "voto",
+    "certidao": "certidao",
+    "termo": "certidao",
+    "autuacao": "certidao",
+}
+_SORTED_PREFIXES = sorted(SECTION_PREFIXES, key=len, reverse=True)
+
+# Blocos que se repetem em cada página (cabeçalho, identificação do processo, partes)
+PAGE_FURNITURE_PREFIXES = ("header", "case_info", "document_info", "document_footer", "parties_and_roles")
+HEADER_SECTION = "cabecalho"
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.;!?])\s+")
+
+
+def section_for_key(block_key):
+    """Seção principal de um bloco pela sua chave (ex.: "voto_body_continuacao" -> "voto"), ou None."""
+    for prefix in _SORTED_PREFIXES:
+        if block_key.startswith(prefix):
+            return SECTION_PREFIXES[prefix]
+    return None
+
+
+def _split_long_unit(unit, max_tokens, token_counter):
+    """Divide uma unidade maior que `max_tokens` por frases e, se preciso, por palavras."""
+    if token_counter(unit) <= max_tokens:
+        return [unit]
+    pieces = []
+    current = []
+    current_tokens = 0
+    for sentence in _SENTENCE_BOUNDARY.split(unit):
+        sentence_tokens = token_counter(sentence)
+        if sentence_tokens > max_tokens:
+            words = sentence.split()
+            words_per_piece = max(1, int(len(words) * max_tokens / sentence_tokens))
+            sentence_parts = [" ".join(words[i:i + words_per_piece]) for i in range(0, len(words), words_per_piece)]
+        else:
+            sentence_parts = [sentence]
+        for part in sentence_parts:
+            part_tokens = token_counter(part)
+            if current and current_tokens + part_tokens > max_tokens:
+                pieces.append(" ".join(current))
+                current, current_tokens = [], 0
+            current.append(part)
+            current_tokens += part_tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def chunk_blocks(blocks, target_tokens=DEFAULT_TARGET_CHUNK_TOKENS, max_tokens=DEFAULT_MAX_CHUNK_TOKENS,
+                 min_tokens=None, token_counter=estimate_tokens):
+    """
+    Agrupa os blocos de um documento ({"page", "key", "units"}, na ordem das páginas) em
+    chunks alinhados às seções. Um chunk é fechado ao atingir `target_tokens`, antes de
+    passar de `max_tokens` ou quando começa outra seção principal (se já tiver
+    `min_tokens`; trechos menores seguem no chunk seguinte). Retorna dicionários
+    {"text", "section", "page_start", "page_end"}.
+    """
+    min_tokens = target_tokens // 4 if min_tokens is None else min_tokens
+    chunks = []
+    units = []
+    tokens_by_section = {}
+    pages = set()
+    current_tokens = 0
+    current_section = HEADER_SECTION
+
+    def flush():
+        nonlocal units, tokens_by_section, pages, current_tokens
+        if units:
+            chunks.append({
+                "text": " ".join(units),
+                # Seção com mais texto no chunk (trechos curtos de outra seção podem ter sido agregados)
+                "section": max(tokens_by_section, key=tokens_by_section.get),
+                "page_start": min(pages) if pages else None,
+                "page_end": max(pages) if pages else None,
+            })
+        units, tokens_by_section, pages, current_tokens = [], {}, set(), 0
+
+    for block in blocks:
+        block_key = block["key"]
+        section = section_for_key(block_key)
+        if section is None:
+            # Cabeçalhos repetidos nas páginas seguintes não entram no meio das seções
+            if current_section != HEADER_SECTION and block_key.startswith(PAGE_FURNITURE_PREFIXES):
+                continue
+            section = current_section
+        elif section != current_section:
+            if current_tokens >= min_tokens:
+                flush()
+            current_section = section
+
+        for unit in block["units"]:
+            for piece in _split_long_unit(unit, max_tokens, token_counter):
+                piece_tokens = token_counter(piece)
+                if units and (current_tokens >= target_tokens or current_tokens + piece_tokens > max_tokens):
+                    flush()
+                units.append(piece)
+                current_tokens += piece_tokens
+                tokens_by_section[section] = tokens_by_section.get(section, 0) + piece_tokens
+                if block.get("page") is not None:
+                    pages.add(block["page"])
+    flush()
+    return chunks
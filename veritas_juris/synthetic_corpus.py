@@ -0,0 +1,185 @@
+# synthetic_corpus.py
+"""
+Gerador de corpora sintéticos de acórdãos, no mesmo formato de `data/processo.json`.
+
+Cada documento tem "fileName" (CLASSE-NUMERO-AAAA-MM-DD.pdf) e "content" com as
+páginas e blocos que o pipeline espera: cabeçalho, case_info, partes, ementa (body
++ points), acórdão, relatório, voto, decisão e certidão, além dos blocos de
+assinatura ignorados na extração. O texto é montado a partir de frases jurídicas
+por tema, com números de processo e datas variados.
+
+A geração é determinística: o documento `i` depende apenas de (`seed`, `i`), então
+um corpus de 1.000 documentos é o prefixo do de 10.000 com a mesma semente, e dois
+runs de benchmark com os mesmos parâmetros processam exatamente o mesmo texto.
+"""
+import json
+import random
+
+TRIBUNAIS = ("SUPERIOR TRIBUNAL DE JUSTIÇA", "SUPREMO TRIBUNAL FEDERAL")
+CLASSES = (
+    ("AGINT", "AgInt no AGRAVO EM RECURSO ESPECIAL"),
+    ("AGRESP", "AgRg no RECURSO ESPECIAL"),
+    ("RESP", "RECURSO ESPECIAL"),
+    ("AERESP", "AgRg nos EMBARGOS DE DIVERGÊNCIA EM RECURSO ESPECIAL"),
+    ("HC", "HABEAS CORPUS"),
+    ("RHC", "RECURSO EM HABEAS CORPUS"),
+)
+UFS = ("RS", "SC", "PR", "SP", "RJ", "MG", "BA", "PE", "CE", "DF", "GO", "PA")
+RELATORES = (
+    "GURGEL DE FARIA", "OG FERNANDES", "REGINA HELENA COSTA", "BENEDITO GONÇALVES", "SÉRGIO KUKINA",
+    "HERMAN BENJAMIN", "MAURO CAMPBELL MARQUES", "ASSUSETE MAGALHÃES", "FRANCISCO FALCÃO", "MARIA THEREZA DE ASSIS MOURA",
+)
+PARTES = (
+    "FAZENDA NACIONAL", "ESTADO DO RIO GRANDE DO SUL", "MUNICÍPIO DE PORTO ALEGRE", "CONSELHO REGIONAL DE ENFERMAGEM",
+    "COMPANHIA DISTRIBUIDORA DE ENERGIA", "INDÚSTRIA METALÚRGICA LTDA", "COOPERATIVA AGRÍCOLA MISTA",
+    "TRANSPORTADORA RODOVIÁRIA S.A.", "MINISTÉRIO PÚBLICO FEDERAL", "COMÉRCIO DE ALIMENTOS LTDA",
+)
+
+# Tema -> (título da ementa, frases características)
+TEMAS = {
+    "icms": ("TRIBUTÁRIO. ICMS. BASE DE CÁLCULO. DEMANDA CONTRATADA DE ENERGIA ELÉTRICA.", (
+        "O ICMS incide sobre a demanda de potência efetivamente utilizada, e não sobre a contratada.",
+        "A tarifa de uso do sistema de distribuição integra a base de cálculo do ICMS sobre energia elétrica.",
+        "O fato gerador do imposto é a circulação jurídica da mercadoria, não o mero deslocamento físico.",
+    )),
+    "execucao_fiscal": ("PROCESSUAL CIVIL E TRIBUTÁRIO. EXECUÇÃO FISCAL. CERTIDÃO DE DÍVIDA ATIVA.", (
+        "A ausência de notificação administrativa afasta a presunção de certeza e liquidez da Certidão de Dívida Ativa.",
+        "Cabe ao exequente comprovar a regular constituição do crédito tributário.",
+        "A substituição da CDA é admitida até a prolação da sentença de embargos, vedada a modificação do sujeito passivo.",
+    )),
+    "prescricao": ("TRIBUTÁRIO. PRESCRIÇÃO INTERCORRENTE. REDIRECIONAMENTO. SÓCIO-GERENTE.", (
+        "O prazo de prescrição intercorrente inicia-se após o término da suspensão de um ano prevista no art. 40 da LEF.",
+        "O redirecionamento da execução ao sócio-gerente exige a comprovação da dissolução irregular da sociedade.",
+        "A citação da pessoa jurídica interrompe a prescrição em relação aos responsáveis solidários.",
+    )),
+    "contribuicoes": ("TRIBUTÁRIO. CONTRIBUIÇÃO PREVIDENCIÁRIA. VERBAS INDENIZATÓRIAS. NÃO INCIDÊNCIA.", (
+        "Não incide contribuição previdenciária sobre o terço constitucional de férias indenizadas.",
+        "O aviso prévio indenizado possui natureza indenizatória e não integra o salário de contribuição.",
+        "Os primeiros quinze dias de afastamento por doença não configuram remuneração por serviço prestado.",
+    )),
+    "anuidades": ("ADMINISTRATIVO. CONSELHO DE FISCALIZAÇÃO PROFISSIONAL. ANUIDADES. LEI 12.514/2011.", (
+        "As anuidades devidas aos conselhos profissionais têm natureza tributária de contribuição de interesse de categoria.",
+        "É vedado ao conselho executar judicialmente dívidas inferiores a quatro vezes o valor da anuidade.",
+        "A fixação de anuidade por resolução do conselho ofende o princípio da legalidade tributária.",
+    )),
+    "habeas_corpus": ("PENAL E PROCESSUAL PENAL. HABEAS CORPUS. PRISÃO PREVENTIVA. FUNDAMENTAÇÃO.", (
+        "A prisão preventiva exige fundamentação concreta quanto ao risco à ordem pública.",
+        "A gravidade abstrata do delito não justifica, por si só, a segregação cautelar.",
+        "Condições pessoais favoráveis não impedem a prisão quando presentes os requisitos legais.",
+    )),
+}
+FRASES_PROCESSUAIS = (
+    "A conformidade do acórdão recorrido com a jurisprudência desta Corte atrai o óbice da Súmula 83 do STJ.",
+    "A revisão das conclusões do Tribunal de origem demandaria o reexame de fatos e provas, vedado pela Súmula 7 do STJ.",
+    "O recurso não impugnou especificamente os fundamentos da decisão agravada, incidindo a Súmula 182 do STJ.",
+    "Não há omissão quando o Tribunal de origem se manifesta fundamentadamente sobre as questões relevantes.",
+    "A divergência jurisprudencial exige o cotejo analítico entre os acórdãos confrontados.",
+    "Os embargos de declaração não se prestam à rediscussão do mérito da causa.",
+)
+VOTANTES = "Os Srs. Ministros {0}, {1} e {2} votaram com o Sr. Ministro Relator."
+
+
+def _sentences(rng, tema, count):
+    _, frases = TEMAS[tema]
+    pool = frases + FRASES_PROCESSUAIS
+    return [rng.choice(pool) for _ in range(count)]
+
+
+def generate_document(position, seed=0, pages_per_document=3, paragraphs_per_section=4):
+    """Gera o documento `position` do corpus da semente `seed` (ver docstring do módulo)."""
+    rng = random.Random(seed * 1_000_003 + position)
+    sigla, classe_extensa = rng.choice(CLASSES)
+    numero = 100000 + rng.randrange(1900000)
+    ano = rng.randrange(2012, 2024)
+    data = f"{ano}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}"
+    uf = rng.choice(UFS)
+    tribunal = TRIBUNAIS[0] if rng.random() < 0.9 else TRIBUNAIS[1]
+    relator, *votantes = rng.sample(RELATORES, 4)
+    agravante, agravado = rng.sample(PARTES, 2)
+    tema = rng.choice(sorted(TEMAS))
+    titulo_ementa, _ = TEMAS[tema]
+    case_info = f"{classe_extensa} N° {numero} - {uf} ({ano}/{rng.randrange(10 ** 7):07d}-{rng.randrange(10)})"
+    assinatura = {
+        "law_reference": "Documento eletrônico assinado eletronicamente nos termos do Art. 1º §2º inciso III da Lei 11.419/2006",
+        "signatory": f"Signatário(a): MINISTRO {relator.title()} Assinado em: {data}",
+        "control_code": f"Código de Controle do Documento: {rng.getrandbits(64):016x}",
+    }
+
+    pontos = [f"{i}. {frase}" for i, frase in enumerate(_sentences(rng, tema, 3), start=1)]
+    pontos.append(f"{len(pontos) + 1}. Agravo interno desprovido.")
+    content = [{
+        "page": 1,
+        "header": tribunal,
+        "case_info": case_info,
+        "parties_and_roles": {"relator": f"MINISTRO {relator}", "agravante": agravante, "agravado": agravado},
+        "ementa": {"title": "EMENTA", "body": titulo_ementa, "points": pontos},
+        "acordao": {
+            "title": "ACÓRDÃO",
+            "body": "Vistos e relatados estes autos em que são partes as acima indicadas, acordam os Ministros da "
+                    "PRIMEIRA TURMA, por unanimidade, negar provimento ao recurso, nos termos do voto do Relator.",
+            "votantes": VOTANTES.format(*(v.title() for v in votantes)),
+        },
+        "document_signature_info": assinatura,
+    }]
+    for page in range(2, pages_per_document + 1):
+        page_content = {"page": page, f"header_page{page}": tribunal}
+        if page == 2:
+            page_content["relatorio"] = {
+                "title": "RELATÓRIO",
+                "body": f"Trata-se de agravo interposto por {agravante} contra decisão que negou provimento ao "
+                        f"recurso, na ação movida em face de {agravado}. " + " ".join(_sentences(rng, tema, 2)),
+            }
+            page_content["relatorio_fim"] = "É o relatório."
+        elif page == 3:
+            page_content["voto"] = {
+                "title": "VOTO",
+                "introducao": f"O SENHOR MINISTRO {relator} (Relator): O recurso não merece prosperar.",
+                "fundamentacao": [" ".join(_sentences(rng, tema, 3)) for _ in range(paragraphs_per_section)],
+            }
+        else:
+            page_content[f"voto_body_continuacao_{page}"] = [" ".join(_sentences(rng, tema, 3))
+                                                             for _ in range(paragraphs_per_section)]
+        if page == pages_per_document:
+            page_content["decisao_voto"] = "Ante o exposto, nego provimento ao agravo interno. É como voto."
+            page_content["certidao_julgamento"] = {
+                "title": "CERTIDÃO DE JULGAMENTO",
+                "texto": f"Certifico que a egrégia PRIMEIRA TURMA, ao apreciar o processo em epígrafe, decidiu, "
+                         f"por unanimidade, negar provimento ao recurso, nos termos do voto do Ministro {relator.title()}.",
+            }
+        page_content[f"document_signature_info_page{page}"] = assinatura
+        content.append(page_content)
+
+    return {"fileName": f"{sigla}-{numero}-{data}.pdf", "content": content}
+
+
+def generate_queries(num_queries, seed=0, words_per_query=8):
+    """Perguntas de teste: trechos das frases de cada tema, determinísticos para a semente."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(num_queries):
+        _, frases = TEMAS[rng.choice(sorted(TEMAS))]
+        words = rng.choice(frases).rstrip(".").split()
+        start = rng.randrange(max(1, len(words) - words_per_query + 1))
+        queries.append(" ".join(words[start:start + words_per_query]))
+    return queries
+
+
+def iter_synthetic_documents(num_documents, seed=0, **document_options):
+    """Gera os documentos 0..num_documents-1 do corpus da semente `seed`."""
+    for position in range(num_documents):
+        yield generate_document(position, seed=seed, **document_options)
+
+
+def write_synthetic_corpus(path, num_documents, seed=0, **document_options):
+    """
+    Grava o corpus como uma lista JSON (formato de processo.json), um documento por vez,
+    sem montar a lista em memória. Retorna o caminho gravado.
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("[\n")
+        for position, document in enumerate(iter_synthetic_documents(num_documents, seed=seed, **document_options)):
+            if position:
+                f.write(",\n")
+            f.write(json.dumps(document, ensure_ascii=False))
+        f.write("\n]\n")
+    return path